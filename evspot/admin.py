@@ -0,0 +1,152 @@
+"""
+Admin changelists for tables with millions of rows.
+
+The stock changelist counts every matching row for its paginator and the
+whole table again for the "n total" link, two full scans per page view.
+LargeTableAdmin counts exactly only up to ADMIN_EXACT_COUNT_LIMIT rows and
+estimates beyond that, and skips the second count. Its date hierarchy finds
+the years, months or days holding rows with an indexed EXISTS per period,
+where the stock one truncates the date of every row to list them.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+
+SEARCH_PREFIXES = {'^': 'istartswith', '=': 'iexact', '@': 'search'}
+
+
+def estimated_rows(queryset):
+    """Approximate row count of the queryset's whole table, from the planner statistics or the primary key range"""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table is first analyzed
+        if row and row[0] >= 0:
+            return int(row[0])
+    ids = queryset.model._default_manager.using(queryset.db).values_list('pk', flat=True)
+    first, last = ids.order_by('pk').first(), ids.order_by('-pk').first()
+    return 0 if first is None else last - first + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """Exact counts up to ADMIN_EXACT_COUNT_LIMIT rows, estimated ones past it"""
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        # COUNT(*) over a LIMIT subquery stops reading after limit + 1 rows
+        counted = self.object_list.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        if not self.object_list.query.has_filters():
+            return max(estimated_rows(self.object_list), counted)
+        # A filtered list this long is browsed by its first pages, narrower filters reach the rest
+        return limit
+
+
+def _truncate(value, kind):
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind == 'day':
+        return value
+    value = value.replace(day=1)
+    return value if kind == 'month' else value.replace(month=1)
+
+
+def _advance(value, kind):
+    if kind == 'year':
+        return value.replace(year=value.year + 1)
+    if kind == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value + timedelta(days=1)
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """dates() and datetimes() that probe each period between the first and last row instead of truncating every row"""
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite reads MIN() or MAX() off an index only when it is the query's one aggregate,
+        # the date hierarchy asks for both in one query
+        if args or len(kwargs) < 2 or not all(type(value) in (Min, Max) for value in kwargs.values()):
+            return super().aggregate(*args, **kwargs)
+        return {name: super(IndexedDatesQuerySet, self).aggregate(**{name: value})[name] for name, value in kwargs.items()}
+
+    def _periods(self, field_name, kind, order, to_naive, from_naive):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        start, last = _truncate(to_naive(bounds['first']), kind), to_naive(bounds['last'])
+        periods = []
+        while start <= last:
+            end = _advance(start, kind)
+            # A range the field's index answers without reading the rows
+            if self.filter(**{f'{field_name}__gte': from_naive(start), f'{field_name}__lt': from_naive(end)}).exists():
+                periods.append(from_naive(start))
+            start = end
+        return periods if order == 'ASC' else periods[::-1]
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        return self._periods(field_name, kind, order, lambda value: datetime.combine(value, time()), lambda value: value.date())
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, **kwargs):
+        if kind not in ('year', 'month', 'day') or kwargs:
+            return super().datetimes(field_name, kind, order, tzinfo, **kwargs)
+        if not settings.USE_TZ:
+            return self._periods(field_name, kind, order, lambda value: value, lambda value: value)
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        return self._periods(
+            field_name, kind, order,
+            lambda value: timezone.localtime(value, tzinfo).replace(tzinfo=None),
+            lambda value: timezone.make_aware(value, tzinfo),
+        )
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Unrouted like the original, so actions on it still write to the primary
+        return IndexedDatesQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset._db)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin whose changelist never counts or date-truncates the whole table"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Fields across a foreign key are matched in the related table first and
+        # reached through the key's index, instead of joining every row to test it
+        local, related = [], {}
+        for field in self.get_search_fields(request):
+            lookup = SEARCH_PREFIXES.get(field[0], 'icontains')
+            path = field[1:] if field[0] in SEARCH_PREFIXES else field
+            key, _, rest = path.partition('__')
+            if rest and self.model._meta.get_field(key).many_to_one:
+                related.setdefault(key, []).append(f'{rest}__{lookup}')
+            else:
+                local.append(f'{path}__{lookup}')
+        for term in smart_split(search_term):
+            if term[0] in '"\'' and term[-1] == term[0]:
+                term = unescape_string_literal(term)
+            condition = Q(*((lookup, term) for lookup in local), _connector=Q.OR)
+            for key, lookups in related.items():
+                matches = self.model._meta.get_field(key).related_model._default_manager.filter(
+                    Q(*((lookup, term) for lookup in lookups), _connector=Q.OR)
+                )
+                condition |= Q(**{f'{key}__in': matches.values('pk')})
+            queryset = queryset.filter(condition)
+        return queryset, False
@@ -0,0 +1,46 @@
+"""
+Registry for the performance benchmarks run by `manage.py benchmark`.
+
+Apps declare benchmarks in their own `benchmarks.py` module, which is
+discovered the same way as `admin.py`.
+"""
+import time
+from contextlib import contextmanager
+
+registry = {}
+
+
+def benchmark(name, **defaults):
+    """Register a benchmark function under name with default options"""
+    def decorator(func):
+        registry[name] = (func, defaults)
+        return func
+    return decorator
+
+
+@contextmanager
+def timed(results, label):
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
+
+
+@contextmanager
+def counted(results, label):
+    """Count the queries run inside the block on every database, reads may be routed to a replica"""
+    from django.db import connections
+    from django.test.utils import CaptureQueriesContext
+
+    contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+    for context in contexts:
+        context.__enter__()
+    try:
+        yield
+    finally:
+        for context in contexts:
+            context.__exit__(None, None, None)
+    results[label] = sum(len(context) for context in contexts)
+
+
+def rate(count, seconds):
+    return count / seconds if seconds else float('inf')
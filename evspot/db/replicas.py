@@ -0,0 +1,127 @@
+"""
+Read replica routing.
+
+Reads go to a replica only inside requests that ReplicaMiddleware marked as
+safe: GET and HEAD requests, plus views decorated with replica_safe. Every
+write goes to the primary and pins the rest of the request to it. While
+the replicas catch up, the client's next requests stay on the primary: a
+short-lived cookie covers browsers, and a cache entry keyed by the user id
+covers token clients that do not keep cookies. Pins made in one process
+reach the others only through a shared cache such as Redis.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    """Where the current request reads from"""
+
+    def __init__(self, request=None, pinned=False):
+        self.request = request
+        self.pinned = pinned
+        self.replica = None
+        self.wrote = False
+        self.principal_checked = False
+
+
+def _pin_key(user_id):
+    return f'replicas:pin:{user_id}'
+
+
+def _principal(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def _principal_pinned(state):
+    """Whether the request's user wrote recently, looked up once per request"""
+    # Set first, resolving a session user reads through this router again
+    state.principal_checked = True
+    user_id = _principal(state.request)
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+def replica_safe(view):
+    """Let a view or viewset action read from a replica even though its HTTP method is not GET"""
+    view.replica_safe = True
+    return view
+
+
+def _view_handler(request, view_func):
+    # DRF viewsets map HTTP methods to actions, plain views are the function itself
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return view_func
+    method = request.method.lower()
+    return getattr(cls, getattr(view_func, 'actions', {}).get(method, method), None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.pinned or state.replica is None:
+            return DEFAULT_DB_ALIAS
+        if model._meta.label in (settings.AUTH_USER_MODEL, 'sessions.Session'):
+            # Authentication must see a login or registration the moment it commits
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its own writes
+            return DEFAULT_DB_ALIAS
+        if not state.principal_checked and _principal_pinned(state):
+            # Token authentication runs in the view, so the user is only known by the first read
+            state.pinned = True
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(request, pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+            user_id = _principal(request)
+            if user_id is not None:
+                cache.set(_pin_key(user_id), 1, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _routing.get()
+        if state is None or state.pinned or not settings.DATABASE_REPLICAS:
+            return None
+        if request.method in SAFE_METHODS or getattr(_view_handler(request, view_func), 'replica_safe', False):
+            # One replica per request so its reads see a single consistent snapshot
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
@@ -0,0 +1,69 @@
+"""
+Thumbnail derivatives for uploaded images.
+
+Derivatives are named after a hash of their bytes, so a URL never changes
+content and can be cached forever. The mapping from size and format to
+storage path is kept in a JSON column next to the original image.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Longest edge in pixels for each derivative
+DEFAULT_SIZES = {'thumb': 160, 'card': 480}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _encode(image, image_format, options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _store(data, extension):
+    digest = hashlib.sha256(data).hexdigest()[:24]
+    name = f'derivatives/{digest[:2]}/{digest}.{extension}'
+    # Same bytes, same name, so an existing file is already correct
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def build_derivatives(field_file):
+    """Render every size and format of an image file, returns the mapping to store alongside it"""
+    sizes = getattr(settings, 'IMAGE_DERIVATIVE_SIZES', DEFAULT_SIZES)
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        # JPEGs decode straight at a reduced scale that is still larger than the biggest size
+        image.draft('RGB', (max(sizes.values()),) * 2)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    derivatives = {'source': field_file.name}
+    for size_name, edge in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        derivatives[size_name] = {'width': resized.width, 'height': resized.height}
+        for extension, (image_format, options) in FORMATS.items():
+            derivatives[size_name][extension] = _store(_encode(resized, image_format, options), extension)
+    return derivatives
+
+
+def needs_derivatives(field_file, derivatives):
+    """Whether the stored derivatives were built from a different file than field_file"""
+    return (field_file.name or None) != (derivatives or {}).get('source')
+
+
+def derivative_urls(derivatives, size_name='thumb'):
+    """URLs of one size in every format, or None before the derivatives exist"""
+    entry = (derivatives or {}).get(size_name)
+    if not entry:
+        return None
+    urls = {extension: default_storage.url(entry[extension]) for extension in FORMATS}
+    urls.update(width=entry['width'], height=entry['height'])
+    return urls
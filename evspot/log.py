@@ -0,0 +1,27 @@
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.module_loading import import_string
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Formats records on the calling thread and queues them, a listener thread
+    writes them through the target handler so callers never block on I/O.
+
+    Extra options are passed to the target, e.g. filename for a FileHandler.
+    """
+
+    def __init__(self, target='logging.StreamHandler', **options):
+        super().__init__(queue.SimpleQueue())
+        self.target = import_string(target)(**options)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit, drain the queue before that
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
@@ -3,18 +3,33 @@ Django settings for evspot project.
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
 
+from corsheaders.defaults import default_headers
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# 'dev' for local work or 'prod' for deployments. Every value below can still be
+# overridden from the environment or a .env file.
+SETTINGS_PROFILE = config('SETTINGS_PROFILE', default='dev')
+PRODUCTION = SETTINGS_PROFILE == 'prod'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-evspot-secret-key-change-in-production'
+# It signs auth tokens and sessions, so production refuses to start on the public development key.
+INSECURE_SECRET_KEY = 'django-insecure-evspot-secret-key-change-in-production'
+SECRET_KEY = config('SECRET_KEY', default='' if PRODUCTION else INSECURE_SECRET_KEY)
+if PRODUCTION and (not SECRET_KEY or SECRET_KEY.startswith('django-insecure')):
+    raise ImproperlyConfigured('SECRET_KEY must be set to a private value when SETTINGS_PROFILE=prod')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG also records every SQL query in memory.
+DEBUG = config('DEBUG', default=not PRODUCTION, cast=bool)
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1,0.0.0.0', cast=Csv())
 
 # Application definition
 INSTALLED_APPS = [
@@ -28,11 +43,14 @@ INSTALLED_APPS = [
     'corsheaders',
     'stations',
     'users',
+    'tasks',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'stations.operators.OperatorMiddleware',
+    'evspot.db.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -43,6 +61,9 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'evspot.urls'
 
+# SQLite test databases are files, so tests can send requests from several threads
+TEST_RUNNER = 'evspot.test_runner.SQLiteFileRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -62,13 +83,99 @@ TEMPLATES = [
 WSGI_APPLICATION = 'evspot.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = config('DB_ENGINE', default='sqlite3')
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            # Stock SQLite backend that also applies SQLITE_PRAGMAS to each new connection
+            'ENGINE': 'evspot.db.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                'timeout': config('DB_TIMEOUT', default=20, cast=int),
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # Benchmarks use an in-memory database unless given a file, tests a temporary file (see TEST_RUNNER)
+            'TEST': {'NAME': config('DB_TEST_NAME', default='') or None},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': config('DB_NAME', default='evspot_db'),
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default=''),
+        }
+    }
+
+# Keep connections open between requests instead of reconnecting every time,
+# health checks replace a connection the server has dropped
+DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600 if PRODUCTION else 0, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=PRODUCTION, cast=bool)
+
+# Charging operators hosted here, see stations.operators. Requests name theirs with the
+# X-Operator header, requests without one and management commands act for DEFAULT_OPERATOR.
+DEFAULT_OPERATOR = config('DEFAULT_OPERATOR', default='default')
+# Operators with a database of their own as slug=location pairs, a database file for SQLite or a
+# host for other engines. Their own processes run with DEFAULT_OPERATOR set to the slug and use
+# that database as default, the shared processes turn their requests away.
+OPERATOR_DATABASES = dict(entry.split('=', 1) for entry in config('OPERATOR_DATABASES', default='', cast=Csv()))
+if DEFAULT_OPERATOR in OPERATOR_DATABASES:
+    DATABASES['default']['NAME' if DB_ENGINE == 'sqlite3' else 'HOST'] = OPERATOR_DATABASES[DEFAULT_OPERATOR]
+
+# Read replicas, each entry is a database file for SQLite or a host for other engines.
+# Tests point every replica at the primary.
+DATABASE_REPLICAS = []
+for index, location in enumerate(config('DB_REPLICAS', default='', cast=Csv()), 1):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    replica['NAME' if DB_ENGINE == 'sqlite3' else 'HOST'] = location
+    DATABASES[f'replica{index}'] = replica
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['evspot.db.replicas.ReplicaRouter']
+# Seconds a client keeps reading from the primary after it wrote something
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# WAL lets readers and a writer work at the same time, NORMAL sync is safe with WAL
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': 'normal',
+    'cache_size': -20000,  # KiB
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
 }
 
+# Cache
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'evspot',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Users' favorite station id sets stay cached this long. A local memory cache belongs to one process and
+# never sees another worker drop a set after a change, so without Redis they expire within seconds.
+FAVORITES_CACHE_SECONDS = 3600 if REDIS_URL else 5
+if DEFAULT_OPERATOR in OPERATOR_DATABASES:
+    # Operator ids and user ids restart in its own database, its keys must not meet the shared ones
+    CACHES['default']['KEY_PREFIX'] = DEFAULT_OPERATOR
+
+# Sessions are read on every authenticated request, serve them from the cache in production
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if PRODUCTION else 'django.contrib.sessions.backends.db',
+)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -85,6 +192,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing, the first hasher is used for new hashes and logins upgrade older ones
+PASSWORD_HASHERS = [
+    'users.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 600000
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -102,11 +219,18 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Longest edge in pixels of the WebP/JPEG thumbnails built for station and profile images
+IMAGE_DERIVATIVE_SIZES = {'thumb': 160, 'card': 480}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
@@ -114,18 +238,78 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+    ] + ([] if PRODUCTION else ['rest_framework.renderers.BrowsableAPIRenderer']),
 }
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-operator')
 
 # Custom user model
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Signed token authentication
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=15)
+REFRESH_TOKEN_LIFETIME = timedelta(days=7)
+PRINCIPAL_CACHE_SIZE = 1024
+PRINCIPAL_CACHE_TTL = 300  # seconds
+
+# Failed login attempts allowed per client IP and per username within WINDOW seconds.
+# With Redis the counters live in the cache and every process shares them, LOGIN_THROTTLE_STORE overrides.
+LOGIN_THROTTLE = {
+    'STORE': config(
+        'LOGIN_THROTTLE_STORE',
+        default='users.throttling.CacheWindowStore' if REDIS_URL else 'users.throttling.LocalWindowStore',
+    ),
+    'WINDOW': 300,
+    'IP_LIMIT': 20,
+    'USERNAME_LIMIT': 5,
+}
+
+# Automatic review screening, matching reviews are held for staff instead of being published
+REVIEW_MODERATION = {
+    'BLOCKED_TERMS': config('REVIEW_BLOCKED_TERMS', default='', cast=Csv()),
+    'MAX_LINKS': 1,
+}
+
+# Station sync cursors only move past changes this old, so writes still committing are not skipped
+SYNC_SETTLE_SECONDS = 5
+
+# Each process's station grid index reads other processes' station writes from the change log at most this often
+STATION_INDEX_REFRESH_SECONDS = 1
+
+# Append-only log of station and session state changes, `manage.py rotate_events` archives old events here
+STATION_EVENTS = config('STATION_EVENTS', default=True, cast=bool)
+STATION_EVENT_ARCHIVE_DIR = config('STATION_EVENT_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'events'))
+
+# Admin changelists count rows exactly up to this many and estimate past it,
+# the force-close action only closes active sessions older than STALE_SESSION_HOURS
+ADMIN_EXACT_COUNT_LIMIT = 10000
+STALE_SESSION_HOURS = 24
+
+# Retried session starts and stops with the same Idempotency-Key get the first response for this long,
+# `manage.py expire_idempotency_keys` deletes older keys
+IDEMPOTENCY_KEY_SECONDS = 24 * 3600
+
+# Background tasks run by `manage.py run_worker`, eager mode runs them in-process after commit instead
+TASKS_EAGER = config('TASKS_EAGER', default=False, cast=bool)
+
+# Workers and `manage.py prune_tasks` delete finished tasks this many days after they finished
+TASK_DONE_RETENTION_DAYS = 7
+TASK_FAILED_RETENTION_DAYS = 30
+
 # Logging configuration
+LOG_LEVEL = config('LOG_LEVEL', default='WARNING' if PRODUCTION else 'DEBUG')
+
+
+def _log_handler(target, **options):
+    # In production records are queued and written by a background thread, so requests never wait on log I/O
+    if PRODUCTION:
+        return {'class': 'evspot.log.BackgroundHandler', 'target': target, **options}
+    return {'class': target, **options}
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -140,17 +324,17 @@ LOGGING = {
         },
     },
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
-        },
-        'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple',
-        },
+        'file': _log_handler(
+            'logging.FileHandler',
+            level='INFO',
+            filename=BASE_DIR / 'logs' / 'django.log',
+            formatter='verbose',
+        ),
+        'console': _log_handler(
+            'logging.StreamHandler',
+            level=LOG_LEVEL,
+            formatter='simple',
+        ),
     },
     'root': {
         'handlers': ['console', 'file'],
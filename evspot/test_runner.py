@@ -0,0 +1,30 @@
+"""
+Test runner that keeps SQLite test databases in a temporary file.
+
+An in-memory test database is a shared-cache database, where a second
+thread's write fails with "database table is locked" instead of waiting.
+A file lets tests send requests from several threads, each on its own
+connection, as concurrent workers would. DB_TEST_NAME still picks the file.
+"""
+import os
+import shutil
+import tempfile
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class SQLiteFileRunner(DiscoverRunner):
+    def setup_databases(self, **kwargs):
+        self._tmp = None
+        for alias in connections:
+            test = connections[alias].settings_dict['TEST']
+            if connections[alias].vendor == 'sqlite' and not test.get('NAME') and not test.get('MIRROR'):
+                self._tmp = self._tmp or tempfile.mkdtemp(prefix='evspot-test-')
+                test['NAME'] = os.path.join(self._tmp, f'{alias}.sqlite3')
+        return super().setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
@@ -103,7 +103,8 @@ async function handleLogin(e) {
         
         if (response.ok) {
             // Store user data
-            localStorage.setItem('authToken', data.token || 'dummy-token');
+            localStorage.setItem('authToken', data.token);
+            localStorage.setItem('refreshToken', data.refresh);
             localStorage.setItem('userData', JSON.stringify(data.user));
             
             currentUser = data.user;
@@ -200,6 +201,7 @@ async function handleLogout() {
         
         // Clear local storage
         localStorage.removeItem('authToken');
+        localStorage.removeItem('refreshToken');
         localStorage.removeItem('userData');
         
         currentUser = null;
@@ -210,6 +212,7 @@ async function handleLogout() {
         console.error('Logout error:', error);
         // Still clear local storage even if API call fails
         localStorage.removeItem('authToken');
+        localStorage.removeItem('refreshToken');
         localStorage.removeItem('userData');
         currentUser = null;
         updateUIForGuest();
@@ -219,13 +222,17 @@ async function handleLogout() {
 // Verify token
 async function verifyToken(token) {
     try {
-        const response = await fetch('/api/users/profile/', {
-            headers: {
-                'Authorization': `Bearer ${token}`,
-                'X-CSRFToken': getCookie('csrftoken')
-            }
+        let response = await fetch('/api/users/profile/', {
+            headers: authHeaders()
         });
         
+        // Access tokens are short-lived, trade the refresh token for a new one and retry
+        if (response.status === 401 && await refreshAuthToken()) {
+            response = await fetch('/api/users/profile/', {
+                headers: authHeaders()
+            });
+        }
+        
         if (response.ok) {
             const userData = await response.json();
             currentUser = userData;
@@ -233,6 +240,7 @@ async function verifyToken(token) {
         } else {
             // Token is invalid
             localStorage.removeItem('authToken');
+            localStorage.removeItem('refreshToken');
             localStorage.removeItem('userData');
             updateUIForGuest();
         }
@@ -334,50 +342,126 @@ function getCookie(name) {
     return cookieValue;
 }
 
-// API helper functions
-const API = {
-    // Get nearby stations
-    async getNearbyStations(lat, lng, radius) {
+// Request headers with the CSRF token and, when logged in, the bearer token
+function authHeaders(extra = {}) {
+    const headers = {
+        'X-CSRFToken': getCookie('csrftoken'),
+        ...extra
+    };
+    const token = localStorage.getItem('authToken');
+    if (token) {
+        headers['Authorization'] = `Bearer ${token}`;
+    }
+    return headers;
+}
+
+// Exchange the refresh token for a new access token
+async function refreshAuthToken() {
+    const refresh = localStorage.getItem('refreshToken');
+    if (!refresh) {
+        return false;
+    }
+    
+    const response = await fetch('/api/users/token/refresh/', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ refresh: refresh })
+    });
+    if (!response.ok) {
+        return false;
+    }
+    
+    const data = await response.json();
+    localStorage.setItem('authToken', data.token);
+    localStorage.setItem('refreshToken', data.refresh);
+    return true;
+}
+
+// A new key for each start or stop the user asks for, its retries send the same one
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    // randomUUID needs a secure context, plain http still gets a key unlikely to repeat
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+}
+
+// POST with an Idempotency-Key, retrying lost responses and 409s so the server still acts only once
+async function idempotentPost(url, key, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
         try {
-            const csrfToken = getCookie('csrftoken');
-            if (!csrfToken) {
-                throw new Error('CSRF token not found');
-            }
-            
-            const response = await fetch('/api/stations/nearby/', {
+            const response = await fetch(url, {
                 method: 'POST',
-                headers: {
+                headers: authHeaders({
                     'Content-Type': 'application/json',
-                    'X-CSRFToken': csrfToken
-                },
-                body: JSON.stringify({
-                    latitude: lat,
-                    longitude: lng,
-                    radius: radius
+                    'Idempotency-Key': key
                 })
             });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch stations');
+            if ((response.status !== 409 && response.status < 500) || attempt >= attempts) {
+                return response;
             }
-            
-            return await response.json();
+        } catch (error) {
+            // The request may have reached the server, only a retry with the same key is safe
+            if (attempt >= attempts) {
+                throw error;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+}
+
+// Last body and ETag of each polled URL, so repeat polls are answered with 304 Not Modified
+const responseCache = new Map();
+
+// GET JSON with If-None-Match, reusing the cached body when the server says it has not changed
+async function conditionalFetch(url) {
+    const cached = responseCache.get(url);
+    const headers = authHeaders();
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+    
+    // The browser cache would answer the validation itself, this keeps it between us and the server
+    const response = await fetch(url, { headers: headers, cache: 'no-store' });
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    if (!response.ok) {
+        throw new Error(`Request to ${url} failed`);
+    }
+    
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        responseCache.set(url, { etag: etag, data: data });
+    }
+    return data;
+}
+
+// API helper functions
+const API = {
+    // Get nearby stations
+    async getNearbyStations(lat, lng, radius) {
+        try {
+            // Rounded coordinates keep the URL, and so the cached ETag, stable while the position jitters
+            const params = new URLSearchParams({
+                latitude: lat.toFixed(4),
+                longitude: lng.toFixed(4),
+                radius: radius
+            });
+            return await conditionalFetch(`/api/stations/nearby/?${params}`);
         } catch (error) {
             console.error('API Error:', error);
             throw error;
         }
     },
     
-    // Start charging session
-    async startCharging(stationId) {
+    // Start charging session, a caller retrying the same start passes its key again
+    async startCharging(stationId, key = newIdempotencyKey()) {
         try {
-            const response = await fetch(`/api/stations/${stationId}/start_charging/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                }
-            });
+            const response = await idempotentPost(`/api/stations/${stationId}/start_charging/`, key);
             
             if (!response.ok) {
                 const error = await response.json();
@@ -391,16 +475,10 @@ const API = {
         }
     },
     
-    // Stop charging session
-    async stopCharging(stationId) {
+    // Stop charging session, a caller retrying the same stop passes its key again
+    async stopCharging(stationId, key = newIdempotencyKey()) {
         try {
-            const response = await fetch(`/api/stations/${stationId}/stop_charging/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                }
-            });
+            const response = await idempotentPost(`/api/stations/${stationId}/stop_charging/`, key);
             
             if (!response.ok) {
                 const error = await response.json();
@@ -419,10 +497,9 @@ const API = {
         try {
             const response = await fetch('/api/favorites/', {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                },
+                headers: authHeaders({
+                    'Content-Type': 'application/json'
+                }),
                 body: JSON.stringify({
                     station: stationId
                 })
@@ -443,9 +520,7 @@ const API = {
     async getUserSessions() {
         try {
             const response = await fetch('/api/sessions/', {
-                headers: {
-                    'X-CSRFToken': getCookie('csrftoken')
-                }
+                headers: authHeaders()
             });
             
             if (!response.ok) {
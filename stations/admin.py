@@ -1,34 +1,119 @@
 from django.contrib import admin
-from .models import ChargingStation, ChargingSession, Review, FavoriteStation
+from evspot.admin import LargeTableAdmin
+from .fleet import close_stale_sessions
+from .models import ChargingStation, ChargingSession, Review, FavoriteStation, PricingRule, FleetSummary, Operator
+from .reviews import decide
+from .signals import sessions_finished
+
+
+@admin.register(Operator)
+class OperatorAdmin(admin.ModelAdmin):
+    list_display = ['name', 'slug', 'created_at']
+    search_fields = ['name', 'slug']
+    prepopulated_fields = {'slug': ['name']}
+    readonly_fields = ['created_at']
+
+
+class OperatorOwnedAdmin(admin.ModelAdmin):
+    """Add forms start with the request's operator, the models have no default for it"""
+    
+    def get_changeform_initial_data(self, request):
+        initial = super().get_changeform_initial_data(request)
+        initial.setdefault('operator', request.operator.pk)
+        return initial
 
 
 @admin.register(ChargingStation)
-class ChargingStationAdmin(admin.ModelAdmin):
-    list_display = ['name', 'address', 'charging_type', 'status', 'available_ports', 'total_ports', 'price_per_kwh']
-    list_filter = ['charging_type', 'status', 'created_at']
+class ChargingStationAdmin(OperatorOwnedAdmin):
+    list_display = ['name', 'operator', 'address', 'charging_type', 'status', 'available_ports', 'total_ports', 'price_per_kwh']
+    list_select_related = ['operator']
+    list_filter = ['operator', 'charging_type', 'status', 'created_at']
     search_fields = ['name', 'address']
     readonly_fields = ['created_at', 'updated_at']
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Map cells, sync logs and analytics rows are kept per operator, a station stays with its own
+        if obj is not None:
+            return self.readonly_fields + ['operator']
+        return self.readonly_fields
 
 
 @admin.register(ChargingSession)
-class ChargingSessionAdmin(admin.ModelAdmin):
+class ChargingSessionAdmin(LargeTableAdmin):
     list_display = ['user', 'station', 'start_time', 'end_time', 'status', 'energy_consumed', 'total_cost']
+    list_select_related = ['user', 'station']
     list_filter = ['status', 'start_time']
+    date_hierarchy = 'start_time'
     search_fields = ['user__username', 'station__name']
+    raw_id_fields = ['user', 'station', 'vehicle']
     readonly_fields = ['start_time']
+    actions = ['force_close_stale']
+    
+    @admin.action(description='Force-close selected sessions that are stale')
+    def force_close_stale(self, request, queryset):
+        closed = close_stale_sessions(queryset)
+        sessions_finished.send(sender=ChargingSession, sessions=closed)
+        self.message_user(request, f'{len(closed)} stale sessions closed')
+
+
+class RatingFilter(admin.SimpleListFilter):
+    """The five ratings, where the stock filter reads every review for its distinct values"""
+    title = 'rating'
+    parameter_name = 'rating'
+    
+    def lookups(self, request, model_admin):
+        return [(str(rating), str(rating)) for rating in range(1, 6)]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(rating=self.value())
+        return queryset
 
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
-    list_display = ['user', 'station', 'rating', 'created_at']
-    list_filter = ['rating', 'created_at']
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ['user', 'station', 'rating', 'status', 'created_at']
+    list_select_related = ['user', 'station']
+    list_filter = ['status', RatingFilter, 'created_at']
+    date_hierarchy = 'created_at'
     search_fields = ['user__username', 'station__name', 'comment']
-    readonly_fields = ['created_at']
+    raw_id_fields = ['user', 'station']
+    readonly_fields = ['created_at', 'updated_at']
+    actions = ['publish_reviews', 'reject_reviews']
+    
+    @admin.action(description='Publish selected reviews')
+    def publish_reviews(self, request, queryset):
+        self.message_user(request, f'{decide(queryset, "published")} reviews published')
+    
+    @admin.action(description='Reject selected reviews')
+    def reject_reviews(self, request, queryset):
+        self.message_user(request, f'{decide(queryset, "rejected")} reviews rejected')
 
 
 @admin.register(FavoriteStation)
-class FavoriteStationAdmin(admin.ModelAdmin):
+class FavoriteStationAdmin(LargeTableAdmin):
     list_display = ['user', 'station', 'created_at']
+    list_select_related = ['user', 'station']
     list_filter = ['created_at']
     search_fields = ['user__username', 'station__name']
-    readonly_fields = ['created_at'] 
\ No newline at end of file
+    raw_id_fields = ['user', 'station']
+    readonly_fields = ['created_at']
+
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(OperatorOwnedAdmin):
+    list_display = ['name', 'operator', 'station', 'charging_type', 'weekdays', 'start_time', 'end_time', 'min_occupancy', 'multiplier', 'is_active']
+    list_select_related = ['operator', 'station']
+    list_filter = ['operator', 'is_active', 'charging_type']
+    search_fields = ['name', 'station__name']
+    raw_id_fields = ['station']
+
+
+@admin.register(FleetSummary)
+class FleetSummaryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'operator', 'active_sessions', 'sessions_started', 'sessions_completed', 'energy_consumed', 'total_cost', 'updated_at']
+    list_select_related = ['user', 'operator']
+    list_filter = ['operator']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+    readonly_fields = ['updated_at']
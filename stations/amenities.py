@@ -0,0 +1,125 @@
+"""
+Amenity tags, filtering and facet counts.
+
+ChargingStation.amenities stays the free-form list shown to users. Each entry
+is also indexed as a slug ("24/7 Access" becomes "247-access") in the
+StationAmenity join table, which filters and facet counts read instead of
+scanning JSON.
+"""
+import itertools
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Subquery
+from django.utils.text import slugify
+
+from .models import Amenity, StationAmenity
+
+FACETS = ['amenities', 'charging_type', 'status']
+
+
+def amenity_slug(name):
+    return slugify(str(name))[:60]
+
+
+def station_tags(amenities):
+    """Slug to display name for a station's amenities list, entries without letters or digits are skipped"""
+    tags = {}
+    for name in amenities if isinstance(amenities, list) else []:
+        slug = amenity_slug(name)
+        if slug:
+            tags.setdefault(slug, ' '.join(str(name).split())[:100])
+    return tags
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def index_amenities(rows, batch_size=5000, amenity_model=Amenity, link_model=StationAmenity):
+    """Rewrite the index rows of (station id, amenities) pairs, returns how many stations were indexed"""
+    amenity_ids = {}
+    indexed = 0
+    for batch in _batches(rows, batch_size):
+        tags = {pk: station_tags(amenities) for pk, amenities in batch}
+        names = {}
+        for station in tags.values():
+            for slug, name in station.items():
+                names.setdefault(slug, name)
+        new = [slug for slug in names if slug not in amenity_ids]
+        if new:
+            # The first spelling of a tag becomes its display name
+            amenity_model.objects.bulk_create([amenity_model(slug=slug, name=names[slug]) for slug in new], ignore_conflicts=True)
+            amenity_ids.update(amenity_model.objects.filter(slug__in=new).values_list('slug', 'pk'))
+        with transaction.atomic():
+            link_model.objects.filter(station_id__in=list(tags)).delete()
+            link_model.objects.bulk_create([
+                link_model(station_id=pk, amenity_id=amenity_ids[slug]) for pk, station in tags.items() for slug in station
+            ], batch_size=batch_size)
+        indexed += len(tags)
+    return indexed
+
+
+def sync_station_amenities(station):
+    """Bring one station's index rows in line with its amenities list, a no-op after unrelated edits"""
+    indexed = set(StationAmenity.objects.filter(station=station.pk).values_list('amenity__slug', flat=True))
+    if indexed != set(station_tags(station.amenities)):
+        index_amenities([(station.pk, station.amenities)])
+
+
+def with_amenities(queryset, names):
+    """Stations having every one of the named amenities, answered from the index"""
+    # One join per tag, so the database can start from the rarest tag or from stations
+    # already narrowed by other filters. The index is unique, so no row is repeated.
+    for slug in sorted({amenity_slug(name) for name in names} - {''}):
+        queryset = queryset.filter(amenity_links__amenity_id=Subquery(Amenity.objects.filter(slug=slug).values('pk')))
+    return queryset
+
+
+def parse_facets(value):
+    """Known facet names from a comma separated ?facets= parameter"""
+    return [facet for facet in dict.fromkeys((value or '').split(',')) if facet in FACETS]
+
+
+def _ranked(counts):
+    return dict(sorted(counts, key=lambda item: (-item[1], item[0])))
+
+
+def facet_counts(queryset, facets):
+    """
+    Value counts of each facet over the stations in queryset.
+
+    Station columns are counted together in one GROUP BY over their
+    combinations, amenities in one GROUP BY over the covering index.
+    """
+    stations = queryset.order_by()
+    counts = {}
+    fields = [facet for facet in facets if facet != 'amenities']
+    if fields:
+        totals = {field: defaultdict(int) for field in fields}
+        for *values, count in stations.values_list(*fields).annotate(count=Count('pk')):
+            for field, value in zip(fields, values):
+                totals[field][value] += count
+        counts.update((field, _ranked(total.items())) for field, total in totals.items())
+    if 'amenities' in facets:
+        links = StationAmenity.objects.all()
+        if stations.query.where:
+            links = links.filter(station__in=stations.values('pk'))
+        rows = list(links.values_list('amenity').annotate(count=Count('pk')))
+        slugs = dict(Amenity.objects.filter(pk__in=[amenity for amenity, _ in rows]).values_list('pk', 'slug'))
+        counts['amenities'] = _ranked((slugs[amenity], count) for amenity, count in rows)
+    return {facet: counts[facet] for facet in facets}
+
+
+def count_facets(stations, facets):
+    """The same counts as facet_counts for stations already in memory, in one pass over them"""
+    counters = {facet: Counter() for facet in facets}
+    for station in stations:
+        for facet, counter in counters.items():
+            if facet == 'amenities':
+                counter.update(station_tags(station.amenities).keys())
+            else:
+                counter[getattr(station, facet)] += 1
+    return {facet: _ranked(counter.items()) for facet, counter in counters.items()}
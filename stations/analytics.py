@@ -0,0 +1,244 @@
+"""
+Operator analytics from materialized usage totals.
+
+Billing a session queues a recount of its station's day, which then
+recounts the station's month and the region's day and month from the day
+rows, so a refresh is a few small GROUP BYs however long the history is.
+Range queries read whole months from the month rows and only the days at
+either edge from the day rows: a year is at most 12 month rows and 60 day
+rows per station or region, whatever the number of sessions behind them.
+
+Regions are the map cells at ANALYTICS_REGION_ZOOM, about 150 km across.
+Rows written before a station moved keep its old region until a rebuild.
+Every row belongs to the station's operator, which only sees its own totals.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, F, Q, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from tasks.queue import enqueue_many
+from .models import ChargingSession, ChargingStation, RegionUsage, StationUsage
+from .tiles import cell_key, cell_xy, split_key
+
+ANALYTICS_REGION_ZOOM = 8
+TOTALS = ['sessions', 'energy_consumed', 'revenue']
+ZERO = {'sessions': 0, 'energy_consumed': Decimal('0'), 'revenue': Decimal('0')}
+CENT = Decimal('0.01')
+
+
+def region_of(latitude, longitude):
+    """Key of the analytics region containing a point"""
+    return cell_key(*cell_xy(latitude, longitude, ANALYTICS_REGION_ZOOM), ANALYTICS_REGION_ZOOM)
+
+
+def _month(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return day.replace(year=day.year + day.month // 12, month=day.month % 12 + 1, day=1)
+
+
+def _moment(day):
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def _totals(row):
+    return {field: row[field] for field in TOTALS}
+
+
+def _usage_sums():
+    return {field: Sum(field, default=0) for field in TOTALS}
+
+
+def _in_cents(row):
+    # SQLite adds decimals as floats, sums come back with noise past the cents
+    row['energy_consumed'] = Decimal(row['energy_consumed']).quantize(CENT)
+    row['revenue'] = Decimal(row['revenue']).quantize(CENT)
+    return row
+
+
+def session_totals(sessions, first=None, last=None):
+    """Totals of the completed sessions in the queryset by (station id, day they ended), optionally from day first up to day last"""
+    sessions = sessions.filter(status='completed', end_time__isnull=False)
+    if first is not None:
+        sessions = sessions.filter(end_time__gte=_moment(first), end_time__lt=_moment(last))
+    rows = sessions.order_by().annotate(day=TruncDate('end_time')).values('station', 'day').annotate(
+        sessions=Count('id'), energy_consumed=Sum('energy_consumed', default=0), revenue=Sum('total_cost', default=0)
+    )
+    return {(row['station'], row['day']): _totals(row) for row in rows}
+
+
+def _upsert(model, rows, keys, fields=TOTALS):
+    model.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=['period', 'start', *keys], update_fields=fields
+    )
+
+
+def queue_usage_refresh(sessions):
+    """Queue a recount of the station days the completed sessions ended on"""
+    pairs = {(session.station_id, timezone.localdate(session.end_time)) for session in sessions}
+    enqueue_many('stations.refresh_usage', [
+        (f'usage:{station}:{day}', {'station': station, 'day': day.isoformat()}) for station, day in pairs
+    ])
+
+
+def refresh_usage(pairs):
+    """Recount the day and month rows of (station id, day) pairs and of the regions those stations are in"""
+    regions, operators = {}, {}
+    for pk, operator, latitude, longitude in ChargingStation.objects.filter(
+        pk__in={station for station, _ in pairs}
+    ).values_list('pk', 'operator', 'latitude', 'longitude'):
+        regions[pk], operators[pk] = region_of(latitude, longitude), operator
+    days, months = defaultdict(set), defaultdict(set)
+    for station, day in pairs:
+        # Rows of deleted stations went with them
+        if station in regions:
+            days[day].add(station)
+            months[_month(day)].add(station)
+
+    with transaction.atomic():
+        rows = []
+        for day, stations in days.items():
+            totals = session_totals(ChargingSession.objects.filter(station__in=stations), day, day + timedelta(days=1))
+            rows += [
+                StationUsage(
+                    station_id=station, operator_id=operators[station], region=regions[station], period='day', start=day,
+                    **totals.get((station, day), ZERO)
+                )
+                for station in stations
+            ]
+        _upsert(StationUsage, rows, ['station'], TOTALS + ['region'])
+
+        rows = []
+        for month, stations in months.items():
+            totals = {
+                row['station']: _totals(row) for row in StationUsage.objects.filter(
+                    period='day', station__in=stations, start__gte=month, start__lt=_next_month(month)
+                ).order_by().values('station').annotate(**_usage_sums())
+            }
+            rows += [
+                StationUsage(
+                    station_id=station, operator_id=operators[station], region=regions[station], period='month', start=month,
+                    **totals.get(station, ZERO)
+                )
+                for station in stations
+            ]
+        _upsert(StationUsage, rows, ['station'], TOTALS + ['region'])
+
+        rows = []
+        for period, starts in (('day', days), ('month', months)):
+            for start, stations in starts.items():
+                keys = {(operators[station], regions[station]) for station in stations}
+                totals = {
+                    (row['operator_id'], row['region']): _totals(row) for row in StationUsage.objects.filter(
+                        period=period, start=start, operator__in={operator for operator, _ in keys}, region__in={region for _, region in keys}
+                    ).order_by().values('operator_id', 'region').annotate(**_usage_sums())
+                }
+                rows += [
+                    RegionUsage(operator_id=operator, region=region, period=period, start=start, **totals.get((operator, region), ZERO))
+                    for operator, region in keys
+                ]
+        _upsert(RegionUsage, rows, ['operator', 'region'])
+
+
+def rebuild_usage(batch_size=200, session_model=ChargingSession, station_model=ChargingStation,
+                  station_usage_model=StationUsage, region_usage_model=RegionUsage):
+    """Recount every usage row from the sessions, batch_size stations at a time, returns (station rows, region rows)"""
+    # Migration 0016 rebuilds with the models from before operators, its rows go without one
+    scoped = any(field.name == 'operator' for field in station_usage_model._meta.fields)
+    stations = list(station_model.objects.order_by('pk').values_list(
+        'pk', F('operator') if scoped else Value(None, output_field=BigIntegerField()), 'latitude', 'longitude'
+    ))
+
+    def usage(model, operator, **fields):
+        return model(**fields) if operator is None else model(operator_id=operator, **fields)
+
+    region_rows = defaultdict(lambda: dict(ZERO))
+    written = 0
+    with transaction.atomic():
+        station_usage_model.objects.all().delete()
+        region_usage_model.objects.all().delete()
+        for offset in range(0, len(stations), batch_size):
+            places = {
+                pk: (operator, region_of(latitude, longitude)) for pk, operator, latitude, longitude in stations[offset:offset + batch_size]
+            }
+            month_rows = defaultdict(lambda: dict(ZERO))
+            rows = []
+            for (station, day), totals in session_totals(session_model.objects.filter(station__in=places)).items():
+                operator, region = places[station]
+                rows.append(usage(station_usage_model, operator, station_id=station, region=region, period='day', start=day, **totals))
+                for total in (
+                    month_rows[station, _month(day)], region_rows[operator, region, 'day', day], region_rows[operator, region, 'month', _month(day)]
+                ):
+                    for field in TOTALS:
+                        total[field] += totals[field]
+            rows += [
+                usage(station_usage_model, places[station][0], station_id=station, region=places[station][1], period='month', start=month, **totals)
+                for (station, month), totals in month_rows.items()
+            ]
+            station_usage_model.objects.bulk_create(rows, batch_size=5000)
+            written += len(rows)
+        region_usage_model.objects.bulk_create([
+            usage(region_usage_model, operator, region=region, period=period, start=start, **totals)
+            for (operator, region, period, start), totals in region_rows.items()
+        ], batch_size=5000)
+    return written, len(region_rows)
+
+
+def covering(start, end):
+    """Filter for the month and day rows that together cover the days from start to end, both included"""
+    end += timedelta(days=1)
+    first = start if start.day == 1 else _next_month(start)
+    last = _month(end)
+    if first >= last:
+        return Q(period='day', start__gte=start, start__lt=end)
+    return (
+        Q(period='month', start__gte=first, start__lt=last)
+        | Q(period='day', start__gte=start, start__lt=first)
+        | Q(period='day', start__gte=last, start__lt=end)
+    )
+
+
+def network_totals(operator_id, start, end):
+    return _in_cents(RegionUsage.objects.filter(covering(start, end), operator=operator_id).aggregate(**_usage_sums()))
+
+
+def station_ranking(operator_id, start, end, ordering='revenue', limit=20):
+    """The operator's stations with the highest ordering total from start to end, with their names"""
+    rows = list(StationUsage.objects.filter(covering(start, end), operator=operator_id).values('station').annotate(
+        **_usage_sums()
+    ).order_by(f'-{ordering}', 'station_id')[:limit])
+    names = dict(ChargingStation.objects.filter(pk__in=[row['station'] for row in rows]).values_list('pk', 'name'))
+    for row in rows:
+        _in_cents(row)['name'] = names.get(row['station'])
+    return rows
+
+
+def region_totals(operator_id, start, end, ordering='revenue', limit=100):
+    """Regions with the highest ordering total of the operator from start to end, with their map cell"""
+    rows = list(RegionUsage.objects.filter(covering(start, end), operator=operator_id).values('region').annotate(
+        **_usage_sums()
+    ).order_by(f'-{ordering}', 'region')[:limit])
+    for row in rows:
+        _in_cents(row)['zoom'] = ANALYTICS_REGION_ZOOM
+        row['x'], row['y'] = split_key(row['region'], ANALYTICS_REGION_ZOOM)
+    return rows
+
+
+def daily_totals(operator_id, start, end, station=None, region=None):
+    """Totals of each day from start to end of one of the operator's stations, one of its regions or its whole network"""
+    if station is not None:
+        rows = StationUsage.objects.filter(operator=operator_id, station=station)
+    elif region is not None:
+        rows = RegionUsage.objects.filter(operator=operator_id, region=region)
+    else:
+        rows = RegionUsage.objects.filter(operator=operator_id)
+    return [_in_cents(row) for row in rows.filter(period='day', start__gte=start, start__lte=end).values(day=F('start')).annotate(
+        **_usage_sums()
+    ).order_by('day')]
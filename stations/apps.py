@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class StationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'stations' 
\ No newline at end of file
+    name = 'stations'
+
+    def ready(self):
+        from . import signals  # noqa: F401
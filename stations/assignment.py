@@ -0,0 +1,177 @@
+import heapq
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import event_log
+from .load_management import load_manager
+from .models import ChargingStation, ChargingSession
+from .pricing import pricing_engine, time_slice
+from .spatial import find_station_point, get_station_index, haversine_km
+
+# Assumptions used when a session does not state its requirements
+DEFAULT_ENERGY_KWH = 30
+AVERAGE_TRAVEL_SPEED_KMH = 40
+
+Candidate = namedtuple('Candidate', ['station_id', 'distance', 'wait_seconds', 'charge_seconds', 'finish_at', 'power_kw'])
+
+
+class NoPortAvailable(Exception):
+    def __init__(self, candidates):
+        super().__init__('No charging port could be reserved')
+        self.candidates = candidates
+
+
+def charge_seconds(energy_kwh, power_kw):
+    return float(energy_kwh) / max(float(power_kw), 0.1) * 3600
+
+
+def reserve_port(station_id):
+    """Take one port with a single conditional UPDATE, returns False if the station is full"""
+    return ChargingStation.objects.filter(
+        pk=station_id, status='active', available_ports__gt=0
+    ).update(available_ports=F('available_ports') - 1, updated_at=timezone.now()) == 1
+
+
+def release_port(station_id):
+    return ChargingStation.objects.filter(
+        pk=station_id, available_ports__lt=F('total_ports')
+    ).update(available_ports=F('available_ports') + 1, updated_at=timezone.now()) == 1
+
+
+class PortScheduler:
+    """Predicted free time of every port, kept as one min-heap of epoch seconds per station"""
+
+    def __init__(self):
+        self._heaps = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, station_id):
+        return station_id in self._heaps
+
+    def load(self, station_id, total_ports, busy_until):
+        heap = sorted(busy_until)[-total_ports:] if total_ports else []
+        heap += [0.0] * (total_ports - len(heap))
+        heapq.heapify(heap)
+        with self._lock:
+            self._heaps[station_id] = heap
+
+    def forget(self, station_id):
+        with self._lock:
+            self._heaps.pop(station_id, None)
+
+    def next_free(self, station_id, now):
+        heap = self._heaps.get(station_id)
+        if not heap:
+            return None
+        return max(heap[0], now)
+
+    def reserve(self, station_id, finish_at):
+        with self._lock:
+            heap = self._heaps.get(station_id)
+            if heap:
+                heapq.heapreplace(heap, finish_at)
+
+    def release(self, station_id, finish_at, now):
+        """Mark the port that was predicted to free at finish_at as free now"""
+        with self._lock:
+            heap = self._heaps.get(station_id)
+            if not heap:
+                return
+            # Ports per station are few, so a linear search beats bookkeeping positions
+            position = min(range(len(heap)), key=lambda i: abs(heap[i] - finish_at))
+            heap[position] = now
+            heapq.heapify(heap)
+
+
+scheduler = PortScheduler()
+
+
+def _load_missing(points, now):
+    """Seed heaps for stations the scheduler has not seen yet, one query for all of them"""
+    missing = {point.id: point for point in points if point.id not in scheduler}
+    if not missing:
+        return
+    busy = {station_id: [] for station_id in missing}
+    sessions = ChargingSession.objects.filter(status='active', station_id__in=missing).values_list(
+        'station_id', 'start_time', 'expected_end_time'
+    )
+    for station_id, start_time, expected_end_time in sessions:
+        if expected_end_time is None:
+            duration = charge_seconds(DEFAULT_ENERGY_KWH, missing[station_id].power_output)
+            expected_end_time = start_time + timedelta(seconds=duration)
+        busy[station_id].append(max(expected_end_time.timestamp(), now))
+    for station_id, point in missing.items():
+        scheduler.load(station_id, point.total_ports, busy[station_id])
+
+
+def rank_candidates(operator_id, station_id, latitude, longitude, energy_kwh=DEFAULT_ENERGY_KWH, max_power_kw=None,
+                    charging_type=None, radius=10, neighbours=5, now=None):
+    """Score the requested station and its nearest neighbours of the same operator by predicted finish time"""
+    now = time.time() if now is None else now
+    requested = find_station_point(operator_id, station_id)
+    if requested is None:
+        return []
+    index = get_station_index(operator_id)
+
+    points = [requested] + [
+        point for _, point in index.nearest(requested.latitude, requested.longitude, neighbours + 1, radius)
+        if point.id != station_id
+    ][:neighbours]
+    if charging_type:
+        points = [point for point in points if point.id == station_id or point.charging_type == charging_type]
+    _load_missing(points, now)
+    loads = load_manager.loads([point.id for point in points])
+
+    candidates = []
+    for point in points:
+        free_at = scheduler.next_free(point.id, now)
+        if free_at is None:
+            continue
+        distance = haversine_km(latitude, longitude, point.latitude, point.longitude)
+        arrival = now + distance / AVERAGE_TRAVEL_SPEED_KMH * 3600
+        # A shared grid connection may leave less than the port's rated power
+        power = min(point.power_output, load_manager.headroom(point.id, loads=loads))
+        if max_power_kw:
+            power = min(power, max_power_kw)
+        start = max(free_at, arrival)
+        duration = charge_seconds(energy_kwh, power)
+        candidates.append(Candidate(point.id, distance, start - arrival, duration, start + duration, power))
+
+    # Earliest finish wins, more power headroom breaks ties
+    candidates.sort(key=lambda c: (c.finish_at, -c.power_kw))
+    return candidates
+
+
+def assign_session(user, operator_id, station_id, latitude, longitude, **requirements):
+    """Reserve the best port near the requested station and open a charging session on it"""
+    candidates = rank_candidates(operator_id, station_id, latitude, longitude, **requirements)
+    for candidate in candidates:
+        with transaction.atomic():
+            if not reserve_port(candidate.station_id):
+                # Our prediction was stale, resync this station on the next lookup
+                scheduler.forget(candidate.station_id)
+                continue
+            expected_end = timezone.now() + timedelta(seconds=candidate.charge_seconds)
+            charging_type, base_price, available, total = ChargingStation.objects.values_list(
+                'charging_type', 'price_per_kwh', 'available_ports', 'total_ports'
+            ).get(pk=candidate.station_id)
+            # Quote the price as listed before this driver took the port
+            price = pricing_engine.price_value(
+                candidate.station_id, operator_id, charging_type, base_price, available + 1, total, time_slice()
+            )
+            session = ChargingSession.objects.create(
+                user=user, station_id=candidate.station_id, expected_end_time=expected_end, price_per_kwh=price
+            )
+            event_log.sessions_started([session])
+        return session, candidate
+    raise NoPortAvailable(candidates)
+
+
+def estimate_end_time(power_kw, energy_kwh=DEFAULT_ENERGY_KWH):
+    return timezone.now() + timedelta(seconds=charge_seconds(energy_kwh, power_kw))
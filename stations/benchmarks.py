@@ -0,0 +1,1364 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from evspot.benchmarks import benchmark, counted, rate, timed
+from .models import ChargingStation
+from .operators import operator_directory, operator_key
+from .tiles import grid_cell
+
+User = get_user_model()
+
+
+def create_stations(count, seed=0, center=(37.77, -122.42), spread=0.5, batch_size=5000, amenities=None, operator=None):
+    """Bulk create synthetic active stations of operator scattered around center, with up to four of amenities each"""
+    operator = operator or operator_directory.default()
+    rng = random.Random(seed)
+    types = [('slow', 11), ('fast', 50), ('super', 150)]
+    stations = []
+    for i in range(count):
+        charging_type, power = rng.choice(types)
+        ports = rng.randint(1, 8)
+        latitude = Decimal(f'{center[0] + rng.uniform(-spread, spread):.6f}')
+        longitude = Decimal(f'{center[1] + rng.uniform(-spread, spread):.6f}')
+        stations.append(ChargingStation(
+            operator=operator,
+            name=f'Station {i}',
+            address=f'{i} Benchmark Ave',
+            latitude=latitude,
+            longitude=longitude,
+            # bulk_create skips the pre_save signal that normally places the station
+            grid_cell=grid_cell(latitude, longitude),
+            charging_type=charging_type,
+            power_output=power,
+            price_per_kwh=Decimal(f'{rng.uniform(0.2, 0.6):.2f}'),
+            total_ports=ports,
+            available_ports=ports,
+            amenities=rng.sample(amenities, rng.randint(0, 4)) if amenities else [],
+        ))
+    ChargingStation.objects.bulk_create(stations, batch_size=batch_size)
+    return list(ChargingStation.objects.filter(operator=operator).values_list('id', 'latitude', 'longitude'))
+
+
+def create_users(count, prefix='bench'):
+    User.objects.bulk_create(
+        [User(username=f'{prefix}{i}', password='!') for i in range(count)], batch_size=5000
+    )
+    return list(User.objects.filter(username__startswith=prefix))
+
+
+@benchmark('assignment', scale=2000, iterations=5000)
+def assignment_benchmark(scale, iterations):
+    from .assignment import assign_session, rank_candidates, scheduler, NoPortAvailable
+    from .spatial import get_station_index, reset_station_index
+
+    operator = operator_directory.default()
+    stations = create_stations(scale)
+    rng = random.Random(1)
+    results = {}
+
+    reset_station_index()
+    with timed(results, 'index build seconds'):
+        get_station_index(operator.pk)
+
+    picks = [rng.choice(stations) for _ in range(iterations)]
+    # The first pass also seeds the scheduler from the database
+    for label in ('cold ranking seconds', 'warm ranking seconds'):
+        with timed(results, label):
+            for station_id, lat, lng in picks:
+                rank_candidates(operator.pk, station_id, lat, lng, energy_kwh=rng.uniform(10, 60))
+    results['warm ranked assignments per second'] = rate(iterations, results['warm ranking seconds'])
+
+    users = create_users(min(iterations, 2000))
+    assigned = rejected = 0
+    start = time.perf_counter()
+    for user, (station_id, lat, lng) in zip(users, picks):
+        try:
+            assign_session(user, operator.pk, station_id, lat, lng)
+            assigned += 1
+        except NoPortAvailable:
+            rejected += 1
+    elapsed = time.perf_counter() - start
+    results['reserved assignments'] = assigned
+    results['rejected assignments'] = rejected
+    results['reserved assignments per second'] = rate(assigned + rejected, elapsed)
+    results['stations tracked by scheduler'] = len(scheduler._heaps)
+    return results
+
+
+@benchmark('load_management', scale=500, iterations=200000)
+def load_management_benchmark(scale, iterations):
+    """Churn sessions across capped stations, checking the cap after every event"""
+    from .load_management import StationLoad
+
+    rng = random.Random(2)
+    results = {}
+    for policy in ('equal', 'fifo', 'priority'):
+        stations = []
+        for _ in range(scale):
+            power = rng.choice([11, 50, 150])
+            ports = rng.randint(2, 12)
+            # Grid connections are sized well below every port running flat out
+            stations.append(StationLoad(power * ports * rng.uniform(0.3, 0.8), power, policy))
+        active = [[] for _ in stations]
+        next_id = 0
+
+        start = time.perf_counter()
+        for tick in range(iterations):
+            index = rng.randrange(scale)
+            load, sessions = stations[index], active[index]
+            if sessions and (len(sessions) >= 12 or rng.random() < 0.5):
+                load.remove(sessions.pop(rng.randrange(len(sessions))))
+            else:
+                next_id += 1
+                load.add(next_id, tick, rng.randint(0, 3))
+                sessions.append(next_id)
+            if load.total_allocated() > load.capacity_kw + 1e-6:
+                raise AssertionError(f'{policy}: station {index} allocated above its {load.capacity_kw:.1f} kW cap')
+        elapsed = time.perf_counter() - start
+
+        results[f'{policy} events per second'] = rate(iterations, elapsed)
+        results[f'{policy} sessions recomputed per event'] = sum(load.recomputed for load in stations) / iterations
+        results[f'{policy} mean active sessions per station'] = sum(len(load) for load in stations) / scale
+    return results
+
+
+@benchmark('pricing', scale=100000, iterations=5)
+def pricing_benchmark(scale, iterations):
+    """Price every station once per tick, cold (new slice) and warm (cached)"""
+    from datetime import time as clock
+    from .models import PricingRule
+    from .pricing import PricingEngine, SLICES_PER_DAY
+
+    rng = random.Random(3)
+    operator_id = operator_directory.default().pk
+    rules = [
+        PricingRule(name='Evening peak', weekdays='01234', start_time=clock(17), end_time=clock(21), operator_id=operator_id, multiplier=Decimal('1.25')),
+        PricingRule(name='Overnight', start_time=clock(22), end_time=clock(6), operator_id=operator_id, multiplier=Decimal('0.80')),
+        PricingRule(name='Busy', min_occupancy=Decimal('0.75'), operator_id=operator_id, multiplier=Decimal('1.15')),
+        PricingRule(name='Full', min_occupancy=Decimal('1.00'), operator_id=operator_id, multiplier=Decimal('1.10')),
+        PricingRule(name='Super peak', charging_type='super', start_time=clock(7), end_time=clock(10), operator_id=operator_id, multiplier=Decimal('1.20')),
+    ]
+    rules += [
+        PricingRule(name=f'Site {i}', station_id=rng.randint(1, scale), operator_id=operator_id, multiplier=Decimal('0.90'))
+        for i in range(scale // 100)
+    ]
+    rows = []
+    for station_id in range(1, scale + 1):
+        ports = rng.randint(1, 8)
+        rows.append((station_id, operator_id, rng.choice(['slow', 'fast', 'super']), Decimal(f'{rng.uniform(0.2, 0.6):.2f}'), rng.randint(0, ports), ports))
+
+    engine = PricingEngine(rules=rules)
+    results = {}
+    cold = warm = 0.0
+    for tick in range(iterations):
+        slice_index = (tick * 7 + 4 * 18) % (7 * SLICES_PER_DAY)
+        start = time.perf_counter()
+        for row in rows:
+            engine.price_value(*row, slice_index)
+        cold += time.perf_counter() - start
+        start = time.perf_counter()
+        for row in rows:
+            engine.price_value(*row, slice_index)
+        warm += time.perf_counter() - start
+    results['cold tick seconds'] = cold / iterations
+    results['cached tick seconds'] = warm / iterations
+    results['cold prices per second'] = rate(scale * iterations, cold)
+    results['cached prices per second'] = rate(scale * iterations, warm)
+    return results
+
+
+def _peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@benchmark('export', scale=1000000, iterations=1)
+def export_benchmark(scale, iterations):
+    """Stream a user's full history through the export endpoint and watch peak RSS"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from .models import ChargingSession
+
+    station_ids = [row[0] for row in create_stations(50)]
+    user = create_users(1, prefix='fleet')[0]
+    first = timezone.now() - timedelta(days=3 * 365)
+    # Created in batches so generating the data does not raise the peak itself
+    for offset in range(0, scale, 20000):
+        ChargingSession.objects.bulk_create([
+            ChargingSession(
+                user=user, station_id=station_ids[i % len(station_ids)], status='completed',
+                energy_consumed=Decimal('24.50'), total_cost=Decimal('9.80'), price_per_kwh=Decimal('0.40')
+            )
+            for i in range(offset, min(offset + 20000, scale))
+        ])
+    # start_time is auto_now_add, so backdate the history afterwards
+    ChargingSession.objects.update(start_time=first)
+
+    client = APIClient()
+    client.force_authenticate(user)
+    results = {'peak rss before export mb': _peak_rss_mb()}
+    for export_format in ('csv', 'jsonl'):
+        start = time.perf_counter()
+        size = 0
+        for _ in range(iterations):
+            response = client.get('/api/sessions/export/', {'format': export_format})
+            for chunk in response.streaming_content:
+                size += len(chunk)
+        elapsed = time.perf_counter() - start
+        results[f'{export_format} rows per second'] = rate(scale * iterations, elapsed)
+        results[f'{export_format} megabytes'] = size / iterations / 1e6
+        results[f'peak rss after {export_format} export mb'] = _peak_rss_mb()
+
+    # For comparison, what materializing every row at once costs
+    rows = list(ChargingSession.objects.filter(user=user).values_list('id', 'station__name', 'start_time', 'total_cost'))
+    results['peak rss after materialized list mb'] = _peak_rss_mb()
+    del rows
+    return results
+
+
+@benchmark('fleet', scale=500, iterations=3)
+def fleet_benchmark(scale, iterations):
+    """Batch start and stop scale vehicles, counting queries per batch on every database"""
+    from rest_framework.test import APIClient
+    from users.models import Vehicle
+
+    station_ids = [row[0] for row in create_stations(max(scale // 4, 1))]
+    ChargingStation.objects.update(total_ports=8, available_ports=8)
+    owner = create_users(1, prefix='fleet')[0]
+    Vehicle.objects.bulk_create([
+        Vehicle(owner=owner, name=f'Van {i}', battery_capacity_kwh=Decimal('75.0'), connector='ccs')
+        for i in range(scale)
+    ])
+    vehicle_ids = list(Vehicle.objects.filter(owner=owner).values_list('id', flat=True))
+
+    client = APIClient()
+    client.force_authenticate(owner)
+    results = {}
+    # Half a batch first, the query count of a batch should not depend on its size
+    for label, vehicles in (('half batch', vehicle_ids[:max(scale // 2, 1)]), ('batch', vehicle_ids)):
+        payload = {'sessions': [{'vehicle': v, 'station': station_ids[i % len(station_ids)]} for i, v in enumerate(vehicles)]}
+        start_total = stop_total = 0.0
+        for _ in range(iterations):
+            with counted(results, f'{label} start queries'):
+                start = time.perf_counter()
+                response = client.post('/api/fleet/start/', payload, format='json')
+                start_total += time.perf_counter() - start
+            assert len(response.data['started']) == len(vehicles), response.data['failed'][:3]
+            with counted(results, f'{label} stop queries'):
+                start = time.perf_counter()
+                client.post('/api/fleet/stop/', {'vehicles': vehicles}, format='json')
+                stop_total += time.perf_counter() - start
+        results[f'{label} start seconds'] = start_total / iterations
+        results[f'{label} stop seconds'] = stop_total / iterations
+
+    # The same work through one start_charging call per vehicle, using one login per vehicle
+    users = create_users(scale, prefix='driver')
+    with counted(results, 'one-by-one start queries'):
+        start = time.perf_counter()
+        for i, user in enumerate(users):
+            client.force_authenticate(user)
+            client.post(f'/api/stations/{station_ids[i % len(station_ids)]}/start_charging/')
+        results['one-by-one start seconds'] = time.perf_counter() - start
+    client.force_authenticate(owner)
+    results['dashboard sessions completed'] = client.get('/api/fleet/dashboard/').data['sessions_completed']
+    return results
+
+
+@benchmark('requests', scale=500, iterations=2000)
+def requests_benchmark(scale, iterations):
+    """Mixed station browsing traffic through the full middleware and renderer stack"""
+    from django.db import connection
+    from django.test import Client
+
+    stations = create_stations(scale)
+    rng = random.Random(3)
+    client = Client()
+    results = {}
+    queries = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        station_id, lat, lng = rng.choice(stations)
+        if i % 3 == 0:
+            client.get('/api/stations/', {'page': rng.randint(1, max(scale // 20, 1))})
+        elif i % 3 == 1:
+            client.get(f'/api/stations/{station_id}/')
+        else:
+            client.post('/api/stations/nearby/', {'latitude': lat, 'longitude': lng, 'radius': 5}, content_type='application/json')
+        queries += len(connection.queries)
+    results['requests per second'] = rate(iterations, time.perf_counter() - start)
+    results['queries kept in memory'] = queries
+    results['peak rss mb'] = _peak_rss_mb()
+    return results
+
+
+@benchmark('profiles', scale=500, iterations=2000)
+def profiles_benchmark(scale, iterations):
+    """Startup time and request throughput of the dev and prod settings profiles, each in a fresh process"""
+    import os
+    import secrets
+    import subprocess
+    import sys
+    import tempfile
+    from django.conf import settings
+
+    manage = str(settings.BASE_DIR / 'manage.py')
+    results = {}
+    for profile in ('dev', 'prod'):
+        with tempfile.TemporaryDirectory() as tmp:
+            # A file database, so connection reuse and the journal mode take effect
+            env = dict(os.environ, SETTINGS_PROFILE=profile, DB_TEST_NAME=os.path.join(tmp, 'bench.sqlite3'))
+            # prod refuses to start without a private key of its own
+            env.setdefault('SECRET_KEY', secrets.token_urlsafe(50))
+            start = time.perf_counter()
+            subprocess.run([sys.executable, manage, 'check'], env=env, check=True, capture_output=True)
+            results[f'{profile} startup seconds'] = time.perf_counter() - start
+            output = subprocess.run(
+                [sys.executable, manage, 'benchmark', 'requests', '--scale', str(scale), '--iterations', str(iterations)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        for line in output.splitlines()[1:]:
+            label, value = line.strip().rsplit(': ', 1)
+            results[f'{profile} {label}'] = float(value.replace(',', ''))
+    return results
+
+
+@benchmark('replica_reads', scale=500, iterations=800)
+def replica_reads_benchmark(scale, iterations, threads=8, service_ms=5.0):
+    """
+    Concurrent station browsing against the configured DB_REPLICAS.
+
+    Each database alias is modelled as a server that runs one query at a time
+    for service_ms, so throughput shows how far the reads are spread out.
+    Needs SQLite with DB_TEST_NAME set, the replicas are copied from it.
+    """
+    import threading
+    from collections import Counter
+    from django.conf import settings
+    from django.db import connection, connections
+    from django.test import Client
+
+    stations = create_stations(scale)
+    for alias in settings.DATABASE_REPLICAS:
+        connections[alias].ensure_connection()
+        connection.connection.backup(connections[alias].connection)
+
+    servers = {alias: threading.Lock() for alias in connections}
+    served = Counter()
+
+    def database_server(execute, sql, params, many, context):
+        alias = context['connection'].alias
+        with servers[alias]:
+            time.sleep(service_ms / 1000)
+            served[alias] += 1
+        return execute(sql, params, many, context)
+
+    def browse(seed, count):
+        rng = random.Random(seed)
+        client = Client()
+        wrappers = [connections[alias].execute_wrapper(database_server) for alias in servers]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            for i in range(count):
+                station_id, _, _ = rng.choice(stations)
+                if i % 2:
+                    client.get(f'/api/stations/{station_id}/')
+                else:
+                    client.get('/api/stations/', {'page': rng.randint(1, max(scale // 20, 1))})
+        finally:
+            for wrapper in wrappers:
+                wrapper.__exit__(None, None, None)
+            connections.close_all()
+
+    workers = [threading.Thread(target=browse, args=(n, iterations // threads)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results = {'reads per second': rate(iterations // threads * threads, time.perf_counter() - start)}
+    for alias in servers:
+        results[f'queries on {alias}'] = served[alias]
+    return results
+
+
+@benchmark('replicas', scale=500, iterations=800)
+def replicas_benchmark(scale, iterations):
+    """Read throughput with 0, 1, 2 and 4 SQLite replicas, each count in a fresh process"""
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    from django.conf import settings
+
+    manage = str(settings.BASE_DIR / 'manage.py')
+    results = {}
+    for count in (0, 1, 2, 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ, DB_ENGINE='sqlite3', DB_TEST_NAME=os.path.join(tmp, 'primary.sqlite3'),
+                DB_REPLICAS=','.join(os.path.join(tmp, f'replica{n}.sqlite3') for n in range(count)),
+            )
+            output = subprocess.run(
+                [sys.executable, manage, 'benchmark', 'replica_reads', '--scale', str(scale), '--iterations', str(iterations)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        for line in output.splitlines()[1:]:
+            label, value = line.strip().rsplit(': ', 1)
+            if label == 'reads per second':
+                results[f'{count} replicas reads per second'] = float(value.replace(',', ''))
+    return results
+
+
+def _photo(width, height, seed=0):
+    """A photo-sized JPEG with gradients and grain, so it compresses like a real picture"""
+    import io
+    from PIL import Image
+
+    rng = random.Random(seed)
+    gradient = Image.radial_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    image = Image.merge('RGB', (gradient, noise, Image.linear_gradient('L').resize((width, height)).rotate(rng.randint(0, 90))))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+@benchmark('thumbnails', scale=4032, iterations=5)
+def thumbnails_benchmark(scale, iterations):
+    """Upload photos of scale pixels wide through the API and time until their thumbnails exist"""
+    import tempfile
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from evspot.images import build_derivatives
+    from tasks.queue import Worker
+
+    station_ids = [row[0] for row in create_stations(iterations)]
+    user = create_users(1, prefix='uploader')[0]
+    client = APIClient()
+    client.force_authenticate(user)
+    worker = Worker()
+    original = _photo(scale, scale * 3 // 4)
+    results = {'original bytes': len(original)}
+    upload_total = ready_total = 0.0
+    with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+        for station_id in station_ids:
+            start = time.perf_counter()
+            response = client.patch(
+                f'/api/stations/{station_id}/', {'image': SimpleUploadedFile('photo.jpg', original, 'image/jpeg')},
+                format='multipart'
+            )
+            upload_total += time.perf_counter() - start
+            assert response.status_code == 200, response.data
+            worker.drain()
+            ready_total += time.perf_counter() - start
+
+        station = ChargingStation.objects.get(pk=station_ids[0])
+        with timed(results, 'inline derivative build seconds'):
+            build_derivatives(station.image)
+        row = client.get(f'/api/stations/{station_ids[0]}/').data
+        storage = station.image.storage
+        for size_name, entry in station.image_derivatives.items():
+            if size_name == 'source':
+                continue
+            for extension in ('webp', 'jpeg'):
+                results[f'{size_name} {extension} bytes'] = storage.size(entry[extension])
+    results['upload request seconds'] = upload_total / iterations
+    results['upload to thumbnail seconds'] = ready_total / iterations
+    results['image bytes per list row saved'] = results['original bytes'] - results['thumb webp bytes']
+    results['thumb url in response'] = bool(row['image_thumb'])
+    return results
+
+
+@benchmark('conditional', scale=2000, iterations=300)
+def conditional_benchmark(scale, iterations):
+    """Bytes and CPU per repeat poll of the station endpoints, full responses against 304s"""
+    from django.db import connection
+    from django.test import Client
+
+    station_id, lat, lng = create_stations(scale)[scale // 2]
+    polls = {
+        'list': '/api/stations/?page=2',
+        'detail': f'/api/stations/{station_id}/',
+        'nearby': f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=10',
+    }
+    client = Client()
+    results = {}
+    for label, url in polls.items():
+        etag = client.get(url)['ETag']
+        for mode, headers in (('full', {}), ('304', {'HTTP_IF_NONE_MATCH': etag})):
+            sent = queries = 0
+            start = time.process_time()
+            for _ in range(iterations):
+                response = client.get(url, **headers)
+                assert response.status_code == (304 if headers else 200), response.status_code
+                sent += len(response.content)
+                queries += len(connection.queries)
+            results[f'{label} {mode} cpu ms'] = (time.process_time() - start) / iterations * 1000
+            results[f'{label} {mode} bytes'] = sent // iterations
+            results[f'{label} {mode} queries'] = queries / iterations
+
+    # Any change to a station in the response has to invalidate the ETag
+    etag = client.get(polls['detail'])['ETag']
+    ChargingStation.objects.filter(pk=station_id).update(available_ports=0)
+    ChargingStation.objects.get(pk=station_id).save()
+    results['edit invalidates etag'] = client.get(polls['detail'], HTTP_IF_NONE_MATCH=etag).status_code == 200
+    return results
+
+
+@benchmark('pins', scale=5000, iterations=20)
+def pins_benchmark(scale, iterations):
+    """Payload size and encode time of the pin columns against the station JSON for a map of scale stations"""
+    from django.test import Client
+    from rest_framework.renderers import JSONRenderer
+    from .pins import PinRenderer, pin_columns
+    from .serializers import ChargingStationSerializer
+
+    station_id, lat, lng = create_stations(scale)[0]
+    queryset = ChargingStation.objects.order_by('id')
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = JSONRenderer().render(ChargingStationSerializer(queryset, many=True).data)
+    results['json encode ms'] = (time.perf_counter() - start) / iterations * 1000
+    results['json bytes'] = len(body)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = PinRenderer().render(pin_columns(queryset))
+    results['pins encode ms'] = (time.perf_counter() - start) / iterations * 1000
+    results['pins bytes'] = len(body)
+    results['size ratio'] = results['json bytes'] / results['pins bytes']
+
+    # The same comparison through the nearby endpoint
+    client = Client()
+    url = f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=25'
+    for label, accept in (('json', 'application/json'), ('pins', PinRenderer.media_type)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            response = client.get(url, HTTP_ACCEPT=accept)
+        results[f'nearby {label} request ms'] = (time.perf_counter() - start) / iterations * 1000
+        results[f'nearby {label} bytes'] = len(response.content)
+    return results
+
+
+@benchmark('tiles', scale=1000000, iterations=100)
+def tiles_benchmark(scale, iterations):
+    """Panning a 4x3 tile viewport over scale stations at several zooms, plus incremental cell updates"""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from tasks.queue import Worker
+    from .assignment import reserve_port
+    from .models import StationCell
+    from .tiles import TILE_CLUSTER_DEPTH, cell_xy, queue_cell_refresh, rebuild_cells
+
+    results = {}
+    center, spread = (39.0, -98.0), 12
+    with timed(results, 'create stations seconds'):
+        stations = create_stations(scale, center=center, spread=spread, batch_size=20000)
+    with timed(results, 'initial cell build seconds'):
+        results['cells'] = rebuild_cells(batch_size=20000)
+
+    client = Client()
+    for zoom in (4, 7, 10):
+        # Pan a three tile high strip east and back across the stations, one column of tiles per step
+        west, row = cell_xy(center[0], center[1] - spread, zoom)
+        east, _ = cell_xy(center[0], center[1] + spread, zoom)
+        columns = list(range(west, east + 1)) + list(range(east - 1, west, -1))
+        steps = [columns[step % len(columns)] for step in range(max(iterations, len(columns)))]
+        cache.clear()
+        seen = set()
+        for x in steps:
+            for y in (row - 1, row, row + 1):
+                label = 'warm' if (x, y) in seen else 'cold'
+                seen.add((x, y))
+                start = time.perf_counter()
+                data = client.get(f'/api/stations/tiles/{zoom}/{x}/{y}/').json()
+                results[f'zoom {zoom} {label} ms per tile'] = results.get(f'zoom {zoom} {label} ms per tile', 0) + (time.perf_counter() - start) * 1000
+                results[f'zoom {zoom} {label} queries'] = results.get(f'zoom {zoom} {label} queries', 0) + len(connection.queries)
+                results[f'zoom {zoom} {label} tiles'] = results.get(f'zoom {zoom} {label} tiles', 0) + 1
+                results[f'zoom {zoom} max clusters per tile'] = max(results.get(f'zoom {zoom} max clusters per tile', 0), len(data['clusters']))
+        for label in ('cold', 'warm'):
+            tiles = results.pop(f'zoom {zoom} {label} tiles', 0)
+            if tiles:
+                results[f'zoom {zoom} {label} ms per tile'] /= tiles
+                results[f'zoom {zoom} {label} queries per tile'] = results.pop(f'zoom {zoom} {label} queries') / tiles
+
+    # What the endpoint replaces: clustering one zoom 4 tile straight from its stations
+    x, y = cell_xy(*center, 4)
+    zoom = 4 + TILE_CLUSTER_DEPTH
+    with timed(results, 'zoom 4 tile from stations seconds'):
+        buckets = {}
+        for lat, lng, available in ChargingStation.objects.values_list('latitude', 'longitude', 'available_ports').iterator(chunk_size=20000):
+            cell = cell_xy(lat, lng, zoom)
+            if cell[0] >> TILE_CLUSTER_DEPTH == x and cell[1] >> TILE_CLUSTER_DEPTH == y:
+                buckets[cell] = buckets.get(cell, 0) + available
+    results['zoom 4 tile clusters from stations'] = len(buckets)
+
+    # Port reservations flow into the cells through the task queue
+    rng = random.Random(5)
+    changed = [station_id for station_id, _, _ in rng.sample(stations, min(1000, len(stations)))]
+    with timed(results, 'reserve and queue seconds'):
+        for station_id in changed:
+            reserve_port(station_id)
+            queue_cell_refresh(stations=[station_id])
+    worker = Worker(prefetch=500)
+    with timed(results, 'cell refresh seconds'):
+        worker.drain()
+    results['cell refresh ms per station change'] = results['cell refresh seconds'] / len(changed) * 1000
+    root = StationCell.objects.get(zoom=0)
+    expected = ChargingStation.objects.filter(status='active').aggregate(ports=Sum('available_ports'))['ports']
+    results['root cell matches stations'] = root.available_ports == expected and root.station_count == scale
+    return results
+
+
+AMENITY_POOL = [
+    'WiFi', 'Restrooms', '24/7 Access', 'Coffee Shop', 'Shopping', 'Parking',
+    'Security', 'Food Court', 'Vending Machines', 'Restaurants', 'Lounge', 'Car Wash',
+]
+
+
+@benchmark('amenities', scale=1000000, iterations=20)
+def amenities_benchmark(scale, iterations):
+    """Multi-amenity filters and facet counts from the amenity index against scanning the JSON lists"""
+    from django.test import Client
+    from .amenities import FACETS, facet_counts, index_amenities, station_tags, with_amenities
+
+    results = {}
+    with timed(results, 'create stations seconds'):
+        station_id, lat, lng = create_stations(scale, batch_size=20000, amenities=AMENITY_POOL)[0]
+    with timed(results, 'index seconds'):
+        index_amenities(ChargingStation.objects.values_list('pk', 'amenities').iterator(chunk_size=20000), batch_size=20000)
+
+    # Without the index SQLite has to read every station's list
+    wanted = ['WiFi', 'Restrooms', '24/7 Access']
+    slugs = set(station_tags(wanted))
+    with timed(results, 'json scan seconds'):
+        scanned = sum(
+            1 for amenities in ChargingStation.objects.values_list('amenities', flat=True).iterator(chunk_size=20000)
+            if slugs <= station_tags(amenities).keys()
+        )
+
+    stations = ChargingStation.objects.all()
+    queries = {
+        'one amenity count': lambda: with_amenities(stations, wanted[:1]).count(),
+        'three amenity count': lambda: with_amenities(stations, wanted).count(),
+        'three amenity first page': lambda: list(with_amenities(stations, wanted).order_by('-created_at')[:20]),
+        'facets of all stations': lambda: facet_counts(stations, FACETS),
+        'facets of fast + wifi': lambda: facet_counts(with_amenities(stations.filter(charging_type='fast'), ['WiFi']), FACETS),
+    }
+    for label, query in queries.items():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            value = query()
+        results[f'{label} ms'] = (time.perf_counter() - start) / iterations * 1000
+        if label == 'three amenity count':
+            results['index matches json scan'] = value == scanned
+
+    client = Client()
+    for label, url in (
+        ('list with facets', '/api/stations/?amenities=wifi,restrooms&facets=amenities,charging_type'),
+        ('nearby with facets', f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=2&amenities=wifi,restrooms&facets=amenities,charging_type'),
+    ):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        results[f'{label} request ms'] = (time.perf_counter() - start) / iterations * 1000
+    return results
+
+
+@benchmark('ranges', scale=200000, iterations=20)
+def ranges_benchmark(scale, iterations):
+    """Selective and broad power, price and port ranges on the status composite indexes"""
+    from django.db import connection
+    from django.test import Client
+
+    station_id, lat, lng = create_stations(scale, batch_size=20000)[0]
+    results = {}
+    ranges = {
+        'selective price': {'price_per_kwh__gte': Decimal('0.30'), 'price_per_kwh__lte': Decimal('0.30')},
+        'broad price': {'price_per_kwh__gte': Decimal('0.20'), 'price_per_kwh__lte': Decimal('0.60')},
+        'selective ports': {'available_ports__gte': 8},
+        'broad ports': {'available_ports__gte': 1},
+        'selective power': {'power_output__gte': 100},
+        'broad power': {'power_output__gte': 1},
+    }
+    for label, lookups in ranges.items():
+        for variant, queryset in (
+            ('with status', ChargingStation.objects.filter(status='active', **lookups)),
+            # Without status the composite index cannot be used
+            ('without status', ChargingStation.objects.filter(**lookups)),
+        ):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                count = queryset.count()
+            results[f'{label} {variant} count ms'] = (time.perf_counter() - start) / iterations * 1000
+        results[f'{label} matches'] = count
+        start = time.perf_counter()
+        for _ in range(iterations):
+            list(ChargingStation.objects.filter(status='active', **lookups).order_by('-created_at')[:20])
+        results[f'{label} first page ms'] = (time.perf_counter() - start) / iterations * 1000
+        if connection.vendor == 'sqlite':
+            sql, params = ChargingStation.objects.filter(status='active', **lookups).values('pk').order_by().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                results[f'{label} index only'] = any('COVERING INDEX' in row[3] for row in cursor.fetchall())
+
+    client = Client()
+    for label, url in (
+        ('list selective', '/api/stations/?status=active&price_per_kwh_min=0.30&price_per_kwh_max=0.30&available_ports_min=8'),
+        ('list broad', '/api/stations/?status=active&price_per_kwh_min=0.20&power_output_min=1'),
+        ('nearby by distance', f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=1&available_ports_min=2'),
+        ('nearby by price', f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=1&available_ports_min=2&ordering=price_per_kwh,distance'),
+    ):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        results[f'{label} request ms'] = (time.perf_counter() - start) / iterations * 1000
+    return results
+
+
+@benchmark('reviews', scale=100000, iterations=500)
+def reviews_benchmark(scale, iterations):
+    """Offset and keyset pages of one station with scale reviews, upserts and the batched moderation drain"""
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.pagination import Cursor
+    from tasks.queue import Worker
+    from .models import Review
+    from .reviews import ReviewCursorPagination, upsert_review
+    from .serializers import ReviewSerializer
+
+    station_id = create_stations(1)[0][0]
+    users = create_users(scale, prefix='reviewer')
+    rng = random.Random(0)
+    Review.objects.bulk_create([
+        Review(user=user, station_id=station_id, rating=rng.randint(1, 5), comment=f'Review {i}', status='published')
+        for i, user in enumerate(users)
+    ], batch_size=5000)
+    results = {'reviews': Review.objects.filter(station_id=station_id).count()}
+
+    # What the global endpoint did: COUNT, OFFSET and a user and station lookup per row
+    reviews = Review.objects.filter(station_id=station_id).order_by('-created_at')
+    for label, offset in (('first', 0), ('last', scale - 20)):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            reviews.count()
+            ReviewSerializer(reviews[offset:offset + 20], many=True).data
+            results[f'offset {label} page ms'] = (time.perf_counter() - start) * 1000
+        results[f'offset {label} page queries'] = len(queries)
+
+    client = Client()
+    url = f'/api/stations/{station_id}/reviews/'
+    # Requests reset the query log, so count statements as they run
+    executed = []
+    with connection.execute_wrapper(lambda execute, sql, *args: executed.append(sql) or execute(sql, *args)):
+        response = client.get(url)
+    results['keyset page queries'] = len(executed)
+    pages = 1
+    start = time.perf_counter()
+    while pages < iterations and response.json()['next']:
+        response = client.get(response.json()['next'])
+        pages += 1
+    results['keyset next page request ms'] = (time.perf_counter() - start) / (pages - 1) * 1000
+
+    # A cursor pointing at the oldest page, the same work as following next links all the way
+    last = Review.objects.filter(station_id=station_id).order_by('-created_at', '-id')[scale - 21]
+    paginator = ReviewCursorPagination()
+    paginator.base_url = f'http://testserver{url}'
+    deep = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(last.created_at)))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        response = client.get(deep)
+    assert response.status_code == 200 and len(response.json()['results']) == 20, response.status_code
+    results['keyset last page request ms'] = (time.perf_counter() - start) / iterations * 1000
+
+    # Re-reviews replace the existing rows, every other one with enough links to be held
+    start = time.perf_counter()
+    for i, user in enumerate(users[:iterations]):
+        comment = 'Edited, see http://a.example and http://b.example' if i % 2 else 'Edited'
+        upsert_review(user, ChargingStation(pk=station_id), rating=5, comment=comment)
+    results['upsert mean ms'] = (time.perf_counter() - start) / iterations * 1000
+    results['reviews after upserts'] = Review.objects.filter(station_id=station_id).count()
+
+    with timed(results, 'moderation drain seconds'):
+        Worker(prefetch=500).drain()
+    results['reviews moderated per second'] = rate(iterations, results['moderation drain seconds'])
+    results['held'] = Review.objects.filter(status='held').count()
+    results['rollup'] = list(ChargingStation.objects.filter(pk=station_id).values_list('average_rating', 'total_reviews'))[0]
+    return results
+
+
+@benchmark('favorites', scale=5000, iterations=200)
+def favorites_benchmark(scale, iterations):
+    """Queries and latency of favorites and station lists for a user with 50 favorites, against per-row lookups"""
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from .favorites import favorite_ids
+    from .models import FavoriteStation
+    from .serializers import ChargingStationSerializer, FavoriteStationSerializer
+
+    class LegacyStationSerializer(ChargingStationSerializer):
+        def get_is_favorite(self, obj):
+            return FavoriteStation.objects.filter(user=self.context['request'].user, station=obj).exists()
+
+    class LegacyFavoriteSerializer(FavoriteStationSerializer):
+        station_details = LegacyStationSerializer(source='station', read_only=True)
+
+    stations = create_stations(scale)
+    station_id, lat, lng = stations[0]
+    user = create_users(1, prefix='favorites')[0]
+    FavoriteStation.objects.bulk_create([FavoriteStation(user=user, station_id=pk) for pk, _, _ in stations[:50]])
+    client = Client()
+    client.force_login(user)
+    results = {}
+
+    def measure(label, call):
+        executed = []
+        with connection.execute_wrapper(lambda execute, sql, *args: executed.append(sql) or execute(sql, *args)):
+            call()
+        results[f'{label} queries'] = len(executed)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        results[f'{label} ms'] = (time.perf_counter() - start) / iterations * 1000
+
+    class Request:
+        pass
+    request = Request()
+    request.user = user
+    request.operator = operator_directory.default()
+    # One page each, as the nested serializers ran before favorites were loaded in one go
+    measure('favorites page per-row lookups', lambda: LegacyFavoriteSerializer(
+        FavoriteStation.objects.filter(user=user)[:20], many=True, context={'request': request}
+    ).data)
+    measure('station page per-row lookups', lambda: LegacyStationSerializer(
+        ChargingStation.objects.all()[:20], many=True, context={'request': request}
+    ).data)
+
+    # The requests below include the session and user lookups of the login
+    for label, url in (
+        ('favorites request', '/api/favorites/'),
+        ('favorite ids request', '/api/favorites/ids/'),
+        ('station list request', '/api/stations/'),
+        ('nearby request', f'/api/stations/nearby/?latitude={lat}&longitude={lng}&radius=2'),
+    ):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        measure(label, lambda: client.get(url))
+
+    with timed(results, 'favorite ids miss seconds'):
+        for _ in range(iterations):
+            cache.delete(operator_key(request.operator.pk, f'favorites:{user.pk}'))
+            favorite_ids(user.pk, request.operator.pk)
+    with timed(results, 'favorite ids hit seconds'):
+        for _ in range(iterations):
+            favorite_ids(user.pk, request.operator.pk)
+    results['favorite ids miss ms'] = results.pop('favorite ids miss seconds') / iterations * 1000
+    results['favorite ids hit ms'] = results.pop('favorite ids hit seconds') / iterations * 1000
+    return results
+
+
+@benchmark('sync', scale=100000, iterations=5)
+def sync_benchmark(scale, iterations):
+    """Delta size and server time of station sync after typical change counts, against a full download"""
+    import json
+    import tempfile
+    from django.core.files.storage import default_storage
+    from django.db.models import F
+    from django.test import Client
+    from django.test.utils import override_settings
+    from .models import StationChange
+    from .sync import compact_changes, record_station_changes, write_snapshot
+
+    stations = [pk for pk, _, _ in create_stations(scale, batch_size=20000)]
+    results = {}
+    with timed(results, 'initial log seconds'):
+        compact_changes()
+    client = Client()
+
+    def download(url):
+        """Follow a sync from url to its last page, returns (bytes, requests, cursor)"""
+        size = requests = 0
+        while True:
+            response = client.get(url)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            size += len(body)
+            requests += 1
+            page = json.loads(body)
+            if not page['more']:
+                return size, requests, page['cursor']
+            url = f'/api/stations/sync/?since={page["cursor"]}'
+
+    with override_settings(SYNC_SETTLE_SECONDS=0, MEDIA_ROOT=tempfile.mkdtemp()):
+        start = time.perf_counter()
+        size, _, cursor = download('/api/stations/sync/')
+        results['full download ms'] = (time.perf_counter() - start) * 1000
+        results['full download kb'] = size / 1024
+        with timed(results, 'snapshot write seconds'):
+            name = write_snapshot(operator_directory.default())
+        results['snapshot gzip kb'] = default_storage.size(name) / 1024
+
+        rng = random.Random(0)
+        # Port changes dominate, a busy station changes many times between two syncs
+        for changes in (100, 1000, 10000, 100000):
+            changed = [rng.choice(stations[:max(len(stations) // 10, 1)]) for _ in range(changes)]
+            record_station_changes(changed)
+            ChargingStation.objects.filter(pk__in=set(changed)).update(available_ports=F('total_ports') - 1)
+            elapsed = 0
+            for _ in range(iterations):
+                start = time.perf_counter()
+                size, requests, next_cursor = download(f'/api/stations/sync/?since={cursor}')
+                elapsed += time.perf_counter() - start
+            results[f'{changes} changes stations sent'] = len(set(changed))
+            results[f'{changes} changes delta kb'] = size / 1024
+            results[f'{changes} changes requests'] = requests
+            results[f'{changes} changes delta ms'] = elapsed / iterations * 1000
+            cursor = next_cursor
+
+        results['log rows before compaction'] = StationChange.objects.count()
+        with timed(results, 'compaction seconds'):
+            compact_changes()
+        results['log rows after compaction'] = StationChange.objects.count()
+    return results
+
+
+@benchmark('events', scale=100000, iterations=500)
+def events_benchmark(scale, iterations):
+    """Write overhead of the event log on start_charging, and replay and rotation of scale events"""
+    import tempfile
+    from datetime import timedelta
+    from django.db import connection
+    from django.test.utils import override_settings
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from .events import replay, rotate_events, verify_ports
+    from .models import ChargingSession, StationEvent
+
+    station_ids = [row[0] for row in create_stations(max(iterations // 4, 1))]
+    ChargingStation.objects.update(total_ports=8, available_ports=8)
+    users = create_users(iterations, prefix='driver')
+    client = APIClient()
+    results = {}
+
+    # Alternate requests with and without the log, so warm-up and file growth hit both alike
+    totals = {False: [0.0, 0], True: [0.0, 0]}
+    for i, user in enumerate(users):
+        enabled = i % 2 == 1
+        executed = []
+        client.force_authenticate(user)
+        with override_settings(STATION_EVENTS=enabled):
+            with connection.execute_wrapper(lambda execute, sql, *args: executed.append(sql) or execute(sql, *args)):
+                start = time.perf_counter()
+                response = client.post(f'/api/stations/{station_ids[i % len(station_ids)]}/start_charging/')
+                totals[enabled][0] += time.perf_counter() - start
+            assert response.status_code == 201, response.data
+            totals[enabled][1] += len(executed)
+            client.post(f'/api/stations/{station_ids[i % len(station_ids)]}/stop_charging/')
+    for label, enabled in (('without events', False), ('with events', True)):
+        requests = len(users[enabled::2])
+        results[f'start_charging {label} ms'] = totals[enabled][0] / requests * 1000
+        results[f'start_charging {label} queries'] = totals[enabled][1] / requests
+    results['sessions'] = ChargingSession.objects.count()
+
+    # Synthetic history: a saved state per station followed by sessions starting and stopping
+    rng = random.Random(0)
+    history_stations = station_ids * (scale // (len(station_ids) * 20) + 1)
+    old = timezone.now() - timedelta(days=60)
+    events = [StationEvent(station_id=pk, kind='state', available_ports=8, total_ports=8, created_at=old) for pk in station_ids]
+    while len(events) < scale:
+        pk = rng.choice(history_stations)
+        kind, delta = rng.choice([('session_started', -1), ('session_stopped', 1)])
+        events.append(StationEvent(station_id=pk, kind=kind, ports_delta=delta, created_at=old))
+    StationEvent.objects.bulk_create(events, batch_size=5000)
+    # Stations start out matching their history, then five drift
+    replayed = replay(StationEvent.objects.order_by('id').values_list('station_id', 'kind', 'ports_delta', 'available_ports', 'total_ports'))
+    ChargingStation.objects.bulk_update(
+        [ChargingStation(pk=pk, available_ports=available) for pk, (available, _) in replayed.items()], ['available_ports']
+    )
+    for pk in station_ids[:5]:
+        ChargingStation.objects.filter(pk=pk).update(available_ports=(replayed[pk][0] + 1) % 9)
+    results['events'] = StationEvent.objects.count()
+    with timed(results, 'verify seconds'):
+        results['drifted stations found'] = len(verify_ports())
+    results['events replayed per second'] = rate(results['events'], results['verify seconds'])
+    with timed(results, 'rotate seconds'):
+        archived, _ = rotate_events(timezone.now() - timedelta(days=30), tempfile.mkdtemp())
+    results['events archived'] = archived
+    results['events after rotation'] = StationEvent.objects.count()
+    results['drifted stations found after rotation'] = len(verify_ports())
+    return results
+
+
+@benchmark('admin', scale=1000000, iterations=5)
+def admin_benchmark(scale, iterations):
+    """Changelist render time of the session and review admins over scale sessions, and force-closing the stale ones"""
+    from datetime import timedelta
+    from django.contrib import admin
+    from django.db import connection
+    from django.test import Client
+    from django.utils import timezone
+    from .models import ChargingSession, Review
+
+    station_ids = [row[0] for row in create_stations(500)]
+    users = create_users(1000, prefix='driver')
+    User.objects.create_superuser('admin', password='!')
+    client = Client()
+    client.force_login(User.objects.get(username='admin'))
+    first = timezone.now() - timedelta(days=3 * 365)
+    step = timedelta(days=3 * 365) / scale
+    # One in a hundred sessions was never stopped
+    for offset in range(0, scale, 20000):
+        ChargingSession.objects.bulk_create([
+            ChargingSession(
+                user=users[i % len(users)], station_id=station_ids[i * 7 % len(station_ids)],
+                status='active' if i % 100 == 0 else 'completed',
+                energy_consumed=Decimal('24.50'), total_cost=Decimal('9.80'), price_per_kwh=Decimal('0.40'),
+            )
+            for i in range(offset, min(offset + 20000, scale))
+        ])
+    # start_time is auto_now_add, so backdate the history afterwards a thousand rows at a time
+    last = ChargingSession.objects.order_by('-id').values_list('id', flat=True).first()
+    for start in range(last - scale, last, 1000):
+        ChargingSession.objects.filter(id__gt=start, id__lte=start + 1000).update(start_time=first + step * (start - last + scale + 1000))
+    ChargingSession.objects.filter(status='completed').update(end_time=timezone.now())
+    rng = random.Random(0)
+    Review.objects.bulk_create([
+        Review(user=users[i % len(users)], station_id=station_ids[i // len(users)], rating=rng.randint(1, 5), comment=f'Review {i}', status='published')
+        for i in range(min(scale // 10, len(users) * len(station_ids)))
+    ], batch_size=5000)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    results = {'sessions': ChargingSession.objects.count(), 'reviews': Review.objects.count()}
+
+    middle = first + timedelta(days=365 + 200)
+    # Halfway through the seeded sessions, so the OFFSET scales with the table at any --scale
+    per_page = admin.site._registry[ChargingSession].list_per_page
+    results['deep page'] = max(1, results['sessions'] // per_page // 2)
+    pages = [
+        ('session list', '/admin/stations/chargingsession/'),
+        ('deep session page', f'/admin/stations/chargingsession/?p={results["deep page"]}'),
+        ('active sessions', '/admin/stations/chargingsession/?status__exact=active'),
+        ('session search', '/admin/stations/chargingsession/?q=driver777'),
+        ('session month', f'/admin/stations/chargingsession/?start_time__year={middle.year}&start_time__month={middle.month}'),
+        ('review list', '/admin/stations/review/'),
+        ('review search', '/admin/stations/review/?q=driver777'),
+    ]
+    for label, url in pages:
+        executed = []
+        with connection.execute_wrapper(lambda execute, sql, *args: executed.append(sql) or execute(sql, *args)):
+            response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            client.get(url)
+        results[f'{label} ms'] = (time.perf_counter() - start) / iterations * 1000
+        results[f'{label} queries'] = len(executed)
+
+    # What the stock changelist adds to every page: a full count and every row's year truncated
+    with timed(results, 'full count ms'):
+        ChargingSession.objects.count()
+    with timed(results, 'truncated years ms'):
+        list(ChargingSession.objects.datetimes('start_time', 'year'))
+    results['full count ms'] *= 1000
+    results['truncated years ms'] *= 1000
+
+    stale = ChargingSession.objects.filter(status='active').values_list('pk', flat=True).first()
+    start = time.perf_counter()
+    response = client.post('/admin/stations/chargingsession/?status__exact=active', {
+        'action': 'force_close_stale', '_selected_action': [stale], 'select_across': '1', 'index': '0',
+    })
+    results['force close seconds'] = time.perf_counter() - start
+    assert response.status_code == 302, response.status_code
+    results['sessions force closed'] = ChargingSession.objects.filter(status='cancelled').count()
+    results['sessions still active'] = ChargingSession.objects.filter(status='active').count()
+    return results
+
+
+@benchmark('analytics', scale=1000000, iterations=20)
+def analytics_benchmark(scale, iterations):
+    """Analytics endpoints over a year of scale sessions against the live GROUP BY, and the incremental refresh"""
+    from datetime import timedelta
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from tasks.queue import Worker, enqueue_many
+    from .analytics import network_totals, rebuild_usage, region_of
+    from .models import ChargingSession
+
+    stations = create_stations(500, spread=4)
+    station_ids = [row[0] for row in stations]
+    user = create_users(1, prefix='driver')[0]
+    rng = random.Random(0)
+    now = timezone.now()
+    first = now - timedelta(days=365)
+    step = timedelta(days=365) / scale
+    for offset in range(0, scale, 20000):
+        sessions = []
+        for i in range(offset, min(offset + 20000, scale)):
+            energy = Decimal(rng.randint(500, 6000)) / 100
+            sessions.append(ChargingSession(
+                user=user, station_id=rng.choice(station_ids), status='completed', end_time=first + step * i,
+                energy_consumed=energy, total_cost=(energy * Decimal('0.40')).quantize(Decimal('0.01')),
+            ))
+        ChargingSession.objects.bulk_create(sessions)
+    results = {'sessions': ChargingSession.objects.count()}
+    with timed(results, 'rebuild seconds'):
+        results['station rows'], results['region rows'] = rebuild_usage()
+
+    admin = User.objects.create_superuser('analyst', password='!')
+    client = APIClient()
+    client.force_authenticate(admin)
+    start, end = timezone.localdate(first), timezone.localdate(now)
+    query = {'start': start.isoformat(), 'end': end.isoformat()}
+    completed = ChargingSession.objects.filter(
+        status='completed', end_time__gte=first.replace(hour=0, minute=0, second=0, microsecond=0)
+    ).order_by()
+    sums = {'sessions': Count('id'), 'energy_consumed': Sum('energy_consumed'), 'revenue': Sum('total_cost')}
+    regions = {pk: region_of(latitude, longitude) for pk, latitude, longitude in stations}
+
+    def live_regions():
+        totals = {}
+        for row in completed.values('station').annotate(**sums):
+            total = totals.setdefault(regions[row['station']], [0, 0, 0])
+            total[0] += row['sessions']
+            total[1] += row['energy_consumed']
+            total[2] += row['revenue']
+        return sorted(totals.items(), key=lambda item: -item[1][2])
+
+    cases = [
+        ('network', '/api/analytics/', lambda: completed.aggregate(**sums)),
+        ('top stations', '/api/analytics/stations/', lambda: list(completed.values('station').annotate(**sums).order_by('-revenue')[:20])),
+        ('regions', '/api/analytics/regions/', live_regions),
+        ('days', '/api/analytics/days/', lambda: list(completed.annotate(day=TruncDate('end_time')).values('day').annotate(**sums).order_by('day'))),
+    ]
+    for label, url, live in cases:
+        response = client.get(url, query)
+        assert response.status_code == 200, (url, response.data)
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            client.get(url, query)
+        results[f'{label} request ms'] = (time.perf_counter() - start_time) / iterations * 1000
+        with timed(results, f'{label} live group by ms'):
+            live()
+        results[f'{label} live group by ms'] *= 1000
+    operator_id = operator_directory.default().pk
+    materialized = network_totals(operator_id, start, end)
+    live = completed.aggregate(**sums)
+    results['network totals match live'] = all(materialized[field] == round(live[field], 2) for field in sums)
+
+    # Sessions stopped today, billed by the worker, which then refreshes their station days
+    for i in range(iterations * 50):
+        ChargingSession.objects.create(user=user, station_id=station_ids[i % len(station_ids)], price_per_kwh=Decimal('0.40'))
+    stopped = list(ChargingSession.objects.filter(status='active').values_list('pk', flat=True))
+    ChargingSession.objects.filter(pk__in=stopped).update(status='completed', end_time=timezone.now())
+    enqueue_many('stations.finalize_sessions', [(f'finalize:{pk}', {'session': pk}) for pk in stopped])
+    with timed(results, 'bill and refresh seconds'):
+        Worker(prefetch=500).drain()
+    results['sessions billed and refreshed'] = len(stopped)
+    results['refresh ms per session'] = results['bill and refresh seconds'] / len(stopped) * 1000
+    materialized = network_totals(operator_id, start, timezone.localdate())
+    live = ChargingSession.objects.filter(status='completed', end_time__gte=first.replace(hour=0, minute=0, second=0, microsecond=0)).aggregate(**sums)
+    results['network totals match live after refresh'] = all(materialized[field] == round(live[field], 2) for field in sums)
+    return results
+
+
+@benchmark('tenants', scale=100000, iterations=50)
+def tenants_benchmark(scale, iterations):
+    """Per-operator latency with one operator holding 90% of the stations, the small one alone first, and the cost of the scoping filter"""
+    from datetime import timedelta
+    from django.core.cache import cache
+    from django.test.utils import override_settings
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from .analytics import rebuild_usage
+    from .models import ChargingSession, Operator, StationChange
+    from .spatial import within_box
+    from .sync import compact_changes, record_station_changes
+    from .tiles import cell_xy, rebuild_cells
+
+    center = (37.77, -122.42)
+    small = Operator.objects.create(name='Small', slug='small')
+    big = Operator.objects.create(name='Big', slug='big')
+    driver = create_users(1, prefix='driver')[0]
+    client = APIClient()
+    client.force_authenticate(User.objects.create_superuser('platform', password='!'))
+    rng = random.Random(0)
+    results = {}
+
+    def populate(operator, count, seed):
+        stations = [pk for pk, _, _ in create_stations(count, seed=seed, center=center, batch_size=20000, operator=operator)]
+        now = timezone.now()
+        ChargingSession.objects.bulk_create([
+            ChargingSession(
+                user=driver, station_id=pk, status='completed', end_time=now - timedelta(days=rng.uniform(0, 28)),
+                energy_consumed=Decimal('24.50'), total_cost=Decimal('9.80'),
+            ) for pk in stations
+        ], batch_size=20000)
+        # Stations and sessions were bulk created, count them into cells, usage rows and the change log
+        rebuild_cells(batch_size=20000)
+        rebuild_usage()
+        compact_changes()
+        return set(stations)
+
+    x, y = cell_xy(*center, 7)
+
+    def measure(operator, stations, label):
+        headers = {'HTTP_X_OPERATOR': operator.slug}
+        # A port change at one station in a hundred since the client last synced
+        cursor = StationChange.objects.order_by('-id').values_list('id', flat=True).first()
+        record_station_changes(rng.sample(sorted(stations), max(len(stations) // 100, 1)))
+        seen = set()
+        for case, url in (
+            ('list', '/api/stations/?status=active&ordering=price_per_kwh'),
+            ('nearby', f'/api/stations/nearby/?latitude={center[0]}&longitude={center[1]}&radius=5'),
+            ('tile', f'/api/stations/tiles/7/{x}/{y}/'),
+            ('sync', f'/api/stations/sync/?since={cursor}'),
+            ('analytics', '/api/analytics/stations/'),
+        ):
+            response = client.get(url, **headers)
+            assert response.status_code == 200, (url, response.status_code)
+            data = response.json()
+            if case == 'list':
+                seen.update(row['id'] for row in data['results'])
+                results[f'{label} list count'] = data['count']
+            elif case == 'nearby':
+                seen.update(row['id'] for row in data)
+            elif case == 'sync':
+                seen.update(row[0] for row in data['stations'])
+            elif case == 'tile':
+                results[f'{label} tile stations'] = data['count']
+            start = time.perf_counter()
+            for _ in range(iterations):
+                # Tiles are cached, time building them
+                cache.clear()
+                client.get(url, **headers)
+            results[f'{label} {case} ms'] = (time.perf_counter() - start) / iterations * 1000
+        results[f'{label} sees only its stations'] = seen <= stations
+
+    with override_settings(SYNC_SETTLE_SECONDS=0):
+        small_stations = populate(small, scale // 10, seed=1)
+        measure(small, small_stations, 'small alone')
+        big_stations = populate(big, scale - scale // 10, seed=2)
+        measure(small, small_stations, 'small beside big')
+        measure(big, big_stations, 'big')
+
+    # The operator filter itself, against the same box query over every operator's stations
+    for label, stations in (
+        ('unscoped', ChargingStation.objects.all()),
+        ('big', ChargingStation.objects.filter(operator=big)),
+        ('small', ChargingStation.objects.filter(operator=small)),
+    ):
+        box = within_box(stations.filter(status='active'), *center, 5).order_by().values_list('pk', flat=True)
+        with timed(results, f'{label} box query ms'):
+            for _ in range(iterations):
+                results[f'{label} box query rows'] = len(list(box.all()))
+        results[f'{label} box query ms'] *= 1000 / iterations
+    return results
+
+
+@benchmark('idempotency', scale=50, iterations=200)
+def idempotency_benchmark(scale, iterations, threads=8):
+    """
+    Cost of Idempotency-Key on session start and stop, and scale rounds of
+    threads duplicates of one request fired at once, with and without a key.
+
+    Needs DB_TEST_NAME set on SQLite so the threads share the database.
+    """
+    import threading
+    from django.core.management.base import CommandError
+    from django.db import connection, connections
+    from rest_framework.test import APIClient
+    from .models import ChargingSession
+
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        # Threads writing the shared in-memory database fail instead of waiting, the counts would mean nothing
+        raise CommandError('The idempotency benchmark needs a database file, set DB_TEST_NAME')
+    station_id = create_stations(1)[0][0]
+    ChargingStation.objects.filter(pk=station_id).update(total_ports=threads * 4, available_ports=threads * 4)
+    driver = create_users(1, prefix='driver')[0]
+    client = APIClient()
+    client.force_authenticate(driver)
+    start_url, stop_url = f'/api/stations/{station_id}/start_charging/', f'/api/stations/{station_id}/stop_charging/'
+    results = {}
+
+    def ports():
+        return ChargingStation.objects.values_list('available_ports', flat=True).get(pk=station_id)
+
+    for label, keyed in (('without key', False), ('with key', True)):
+        elapsed = {'start': 0.0, 'stop': 0.0}
+        for i in range(iterations):
+            for action, url in (('start', start_url), ('stop', stop_url)):
+                headers = {'HTTP_IDEMPOTENCY_KEY': f'{label} {action} {i}'} if keyed else {}
+                begin = time.perf_counter()
+                response = client.post(url, **headers)
+                elapsed[action] += time.perf_counter() - begin
+                assert response.status_code in (200, 201), (url, response.status_code)
+        for action, seconds in elapsed.items():
+            results[f'{action} {label} ms'] = seconds / iterations * 1000
+
+    # Retries of the last keyed stop and start get the stored responses
+    for action, url in (('stop', stop_url), ('start', start_url)):
+        headers = {'HTTP_IDEMPOTENCY_KEY': f'with key {action} {iterations - 1}'}
+        with timed(results, f'{action} replay ms'):
+            for _ in range(iterations):
+                response = client.post(url, **headers)
+        results[f'{action} replay ms'] *= 1000 / iterations
+        assert response.status_code in (200, 201) and response['Idempotent-Replayed'] == 'true'
+
+    def duplicates(url, key):
+        """POST url from threads clients at once, returns the status codes and session ids"""
+        barrier = threading.Barrier(threads)
+        responses = [None] * threads
+
+        def send(n):
+            retry = APIClient()
+            retry.force_authenticate(driver)
+            headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+            try:
+                barrier.wait()
+                response = retry.post(url, **headers)
+                responses[n] = (response.status_code, response.json().get('id'))
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=send, args=(n,)) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return responses
+
+    for label, keyed in (('without key', False), ('with key', True)):
+        sessions_before = ChargingSession.objects.filter(user=driver).count()
+        free = ports()
+        replayed = errors = split = 0
+        start = time.perf_counter()
+        for n in range(scale):
+            for action, url, ok in (('start', start_url, 201), ('stop', stop_url, 200)):
+                responses = duplicates(url, f'parallel {action} {n}' if keyed else None)
+                codes = [code for code, _ in responses]
+                replayed += codes.count(ok) - 1
+                errors += len(codes) - codes.count(ok)
+                split += len({pk for code, pk in responses if code == ok}) > 1
+        results[f'parallel {label} rounds per second'] = rate(scale, time.perf_counter() - start)
+        results[f'parallel {label} sessions created per round'] = (
+            ChargingSession.objects.filter(user=driver).count() - sessions_before
+        ) / scale
+        results[f'parallel {label} ports leaked'] = free - ports()
+        results[f'parallel {label} duplicates answered with the first response'] = replayed
+        results[f'parallel {label} duplicates rejected'] = errors
+        results[f'parallel {label} rounds with two sessions'] = split
+    return results
@@ -0,0 +1,60 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .favorites import request_favorite_ids
+from .pricing import pricing_engine, slice_start, time_slice
+
+
+def rows_version(queryset):
+    """(latest updated_at, row count) of a station queryset, one aggregate query instead of serializing it"""
+    version = queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('id'))
+    return version['latest'], version['count']
+
+
+def station_etag(request, latest, count):
+    """
+    Weak ETag for a station representation.
+
+    Besides the operator and the rows it covers the inputs of the computed
+    fields: the pricing slice and rules behind effective_price_per_kwh, the
+    user's favorites behind is_favorite, and the renderer and query string.
+    """
+    rules, _ = pricing_engine.version()
+    parts = [request.operator.pk, latest, count, time_slice(), rules, request.accepted_media_type, request.get_full_path()]
+    if request.user.is_authenticated:
+        parts += [request.user.pk, sorted(request_favorite_ids(request))]
+    return 'W/' + quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_station_response(request, queryset, respond):
+    """Answer 304 when the client's copy of the stations in queryset is current, else call respond()"""
+    latest, count = rows_version(queryset)
+    etag = station_etag(request, latest, count)
+    last_modified = None
+    if not request.user.is_authenticated:
+        # Favorites do not show up in a timestamp, so only anonymous responses get one
+        _, rules_edited = pricing_engine.version()
+        last_modified = int(max(filter(None, (latest, slice_start(), rules_edited))).timestamp())
+
+    return conditional_response(request, etag, respond, last_modified)
+
+
+def conditional_response(request, etag, respond, last_modified=None, private=True):
+    """304 when the client's ETag or timestamp is current, else respond(), with validators set either way"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if private:
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+            patch_vary_headers(response, ['Accept'])
+    return response
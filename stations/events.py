@@ -0,0 +1,155 @@
+"""
+Append-only event log of station and session state changes.
+
+Events recorded inside a transaction are buffered in the process and
+written with a single INSERT once it commits, so the hot paths add no
+statement while they hold their locks and rolled back work leaves no
+events. Replaying the events rebuilds every station's available_ports,
+which verify_ports compares with the stored counts to find drift.
+"""
+import gzip
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import ChargingStation, StationEvent
+
+EVENT_FIELDS = ['id', 'station_id', 'session_id', 'kind', 'ports_delta', 'available_ports', 'total_ports', 'status', 'created_at']
+
+
+class _Batch(list):
+    """Events of one transaction, called on commit to write them"""
+
+    def __init__(self, savepoints):
+        super().__init__()
+        self.savepoints = savepoints
+
+    def __call__(self):
+        StationEvent.objects.bulk_create(self, batch_size=1000)
+
+
+class EventLog:
+    """Records events, buffered per thread and transaction until it commits"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def record(self, events):
+        if not events or not getattr(settings, 'STATION_EVENTS', True):
+            return
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            StationEvent.objects.bulk_create(events, batch_size=1000)
+            return
+        batch = getattr(self._local, 'batch', None)
+        savepoints = tuple(connection.savepoint_ids)
+        # A rollback discards the batch's commit callback, its events then start a new batch.
+        # Each savepoint gets its own batch, so rolling one back drops only its events.
+        if batch is None or batch.savepoints != savepoints or not any(entry[1] is batch for entry in connection.run_on_commit):
+            batch = self._local.batch = _Batch(savepoints)
+            transaction.on_commit(batch)
+        batch.extend(events)
+
+    def station_saved(self, station):
+        self.record([StationEvent(
+            station_id=station.pk, kind='state', available_ports=station.available_ports,
+            total_ports=station.total_ports, status=station.status,
+        )])
+
+    def station_deleted(self, station):
+        self.record([StationEvent(station_id=station.pk, kind='deleted')])
+
+    def sessions_started(self, sessions):
+        self.record([
+            StationEvent(station_id=session.station_id, session_id=session.pk, kind='session_started', ports_delta=-1)
+            for session in sessions
+        ])
+
+    def sessions_stopped(self, sessions):
+        # Releasing never goes above total_ports, replay applies the same cap
+        self.record([
+            StationEvent(station_id=session.station_id, session_id=session.pk, kind='session_stopped', ports_delta=1)
+            for session in sessions
+        ])
+
+
+event_log = EventLog()
+
+
+def replay(events):
+    """(available_ports, total_ports) of each station after (station_id, kind, ports_delta, available_ports, total_ports) rows in id order"""
+    state = {}
+    for station, kind, delta, available, total in events:
+        if kind in ('state', 'checkpoint'):
+            state[station] = [available, total]
+        elif kind == 'deleted':
+            state.pop(station, None)
+        elif station in state:
+            current = state[station]
+            current[0] = min(max(current[0] + delta, 0), current[1])
+    return state
+
+
+def _replay_rows(queryset):
+    return queryset.order_by('id').values_list('station_id', 'kind', 'ports_delta', 'available_ports', 'total_ports').iterator(chunk_size=10000)
+
+
+def verify_ports(station_ids=None):
+    """Stations whose stored available_ports differs from their replayed events, as {id: (stored, replayed)}"""
+    events = StationEvent.objects.all()
+    stations = ChargingStation.objects.all()
+    if station_ids is not None:
+        events = events.filter(station_id__in=station_ids)
+        stations = stations.filter(pk__in=station_ids)
+    expected = replay(_replay_rows(events))
+    drift = {}
+    for pk, available in stations.values_list('pk', 'available_ports').iterator(chunk_size=10000):
+        # Stations with no events predate the log or came from a bulk import
+        if pk in expected and expected[pk][0] != available:
+            drift[pk] = (available, expected[pk][0])
+    return drift
+
+
+def rotate_events(before, archive_dir, batch_size=10000):
+    """
+    Archive the events up to the last one created before `before` and replace them with checkpoints.
+
+    The events go to a gzipped JSON lines file in archive_dir. Each station's
+    last archived event stays in the table as a checkpoint of its replayed
+    counts, keeping its id so later events still replay after it. Returns
+    (archived, archive path), the path is None when nothing was old enough.
+    """
+    last = StationEvent.objects.filter(created_at__lt=before).aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0, None
+    old = StationEvent.objects.filter(id__lte=last)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'station-events-{last}.jsonl.gz')
+    archived = 0
+    with gzip.open(path, 'wt') as archive:
+        for row in old.order_by('id').values_list(*EVENT_FIELDS).iterator(chunk_size=batch_size):
+            archive.write(json.dumps(dict(zip(EVENT_FIELDS, row)), default=str) + '\n')
+            archived += 1
+
+    with transaction.atomic():
+        state = replay(_replay_rows(old))
+        keep = dict(old.values('station_id').annotate(last=Max('id')).values_list('station_id', 'last'))
+        checkpoints = [
+            StationEvent(
+                id=keep[station], station_id=station, session_id=None, kind='checkpoint', ports_delta=0,
+                available_ports=available, total_ports=total, status='',
+            )
+            for station, (available, total) in state.items()
+        ]
+        StationEvent.objects.bulk_update(
+            checkpoints, ['session_id', 'kind', 'ports_delta', 'available_ports', 'total_ports', 'status'], batch_size=batch_size
+        )
+        kept = {checkpoint.id for checkpoint in checkpoints}
+        ids = [pk for pk in old.values_list('id', flat=True).iterator(chunk_size=batch_size) if pk not in kept]
+        for start in range(0, len(ids), batch_size):
+            StationEvent.objects.filter(id__in=ids[start:start + batch_size]).delete()
+    return archived, path
@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+
+SESSION_EXPORT_FIELDS = [
+    'id', 'station_id', 'station__name', 'start_time', 'end_time', 'status',
+    'energy_consumed', 'total_cost', 'price_per_kwh',
+]
+SESSION_EXPORT_HEADER = [
+    'id', 'station_id', 'station_name', 'start_time', 'end_time', 'status',
+    'energy_consumed', 'total_cost', 'price_per_kwh',
+]
+
+
+class CSVRenderer(BaseRenderer):
+    """Lets content negotiation pick CSV, the export view streams the body itself"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode() if data is not None else b''
+
+
+class JSONLinesRenderer(CSVRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
+
+def _plain(value):
+    """Dates as ISO 8601 and decimals as strings, like the JSON API renders them"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(rows, rows_per_chunk=1000):
+    """Yield the CSV header and rows, a few hundred kilobytes at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SESSION_EXPORT_HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        count += 1
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_jsonl(rows, rows_per_chunk=1000):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(SESSION_EXPORT_HEADER, map(_plain, row)))))
+        if len(lines) == rows_per_chunk:
+            lines.append('')
+            yield '\n'.join(lines)
+            lines = []
+    if lines:
+        lines.append('')
+        yield '\n'.join(lines)
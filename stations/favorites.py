@@ -0,0 +1,44 @@
+"""
+Cached favorite station ids per user.
+
+Station listings mark every row with is_favorite. Instead of an EXISTS query
+per row they test membership in the user's favorite id set, read from the
+cache once per request and dropped from it when a favorite is added or
+removed. Only the process that made the change drops it from a local memory
+cache, so FAVORITES_CACHE_SECONDS is seconds unless the cache is shared.
+Each operator caches only the favorites among its own stations.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import FavoriteStation
+from .operators import operator_key
+
+def _cache_key(user_id, operator_id):
+    return operator_key(operator_id, f'favorites:{user_id}')
+
+
+def favorite_ids(user_id, operator_id):
+    """Ids of the operator's stations a user has favorited, from the cache when it has them"""
+    ids = cache.get(_cache_key(user_id, operator_id))
+    if ids is None:
+        ids = frozenset(FavoriteStation.objects.filter(
+            user=user_id, station__operator=operator_id
+        ).values_list('station', flat=True))
+        cache.set(_cache_key(user_id, operator_id), ids, getattr(settings, 'FAVORITES_CACHE_SECONDS', 5))
+    return ids
+
+
+def request_favorite_ids(request):
+    """favorite_ids of the request's user, looked up at most once per request"""
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_favorite_ids'):
+        request._favorite_ids = favorite_ids(request.user.pk, request.operator.pk)
+    return request._favorite_ids
+
+
+def forget_favorites(user_id, operator_id):
+    # After commit, so a concurrent request cannot cache the set from before the change
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id, operator_id)))
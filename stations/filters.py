@@ -0,0 +1,22 @@
+import django_filters
+
+from .amenities import with_amenities
+from .models import ChargingStation
+
+
+class ChargingStationFilter(django_filters.FilterSet):
+    amenities = django_filters.CharFilter(method='filter_amenities', help_text="Comma separated amenities, stations must have all of them")
+    # Inclusive ranges, each pairs with status in a composite index (see ChargingStation.Meta)
+    power_output_min = django_filters.NumberFilter(field_name='power_output', lookup_expr='gte')
+    power_output_max = django_filters.NumberFilter(field_name='power_output', lookup_expr='lte')
+    price_per_kwh_min = django_filters.NumberFilter(field_name='price_per_kwh', lookup_expr='gte')
+    price_per_kwh_max = django_filters.NumberFilter(field_name='price_per_kwh', lookup_expr='lte')
+    available_ports_min = django_filters.NumberFilter(field_name='available_ports', lookup_expr='gte')
+    available_ports_max = django_filters.NumberFilter(field_name='available_ports', lookup_expr='lte')
+    
+    class Meta:
+        model = ChargingStation
+        fields = ['charging_type', 'status', 'power_output']
+    
+    def filter_amenities(self, queryset, name, value):
+        return with_amenities(queryset, value.split(','))
@@ -0,0 +1,186 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from tasks.queue import enqueue_many
+from users.models import Vehicle
+from .assignment import charge_seconds
+from .events import event_log
+from .models import ChargingStation, ChargingSession, FleetSummary
+from .pricing import pricing_engine, time_slice
+
+# Fleet vehicles are assumed to arrive at 20% and charge to 80%
+FLEET_CHARGE_SHARE = 0.6
+
+
+class ReservationConflict(Exception):
+    """Port counts changed between reading and reserving, the whole batch was rolled back"""
+
+
+def _port_delta(counts):
+    return Case(*(When(pk=station_id, then=Value(count)) for station_id, count in counts.items()), default=Value(0))
+
+
+def start_fleet_sessions(user, requests, operator):
+    """
+    Start sessions for many (vehicle_id, station_id) pairs at an operator's stations in one transaction.
+
+    Port reservations for every station are a single UPDATE and the sessions
+    a single INSERT, so the number of queries does not grow with the batch.
+    Returns (sessions, failures) where failures are (vehicle_id, reason).
+    """
+    failures = []
+    now = timezone.now()
+    with transaction.atomic():
+        vehicle_ids = [vehicle_id for vehicle_id, _ in requests]
+        # Locked before the busy check, so a concurrent batch with any of these vehicles waits here
+        # until this one commits and then finds their sessions active
+        vehicles = Vehicle.objects.select_for_update().filter(owner=user, pk__in=vehicle_ids).order_by('pk').in_bulk()
+        busy = set(ChargingSession.objects.filter(vehicle_id__in=vehicles, status='active').values_list('vehicle_id', flat=True))
+        stations = ChargingStation.objects.select_for_update().filter(
+            pk__in={station_id for _, station_id in requests}, operator=operator, status='active'
+        ).in_bulk()
+
+        granted = []
+        remaining = {station_id: station.available_ports for station_id, station in stations.items()}
+        seen = set()
+        for vehicle_id, station_id in requests:
+            if vehicle_id not in vehicles:
+                failures.append((vehicle_id, 'Unknown vehicle'))
+            elif vehicle_id in busy or vehicle_id in seen:
+                failures.append((vehicle_id, 'Vehicle already has an active charging session'))
+            elif station_id not in stations:
+                failures.append((vehicle_id, 'Station is not available'))
+            elif remaining[station_id] <= 0:
+                failures.append((vehicle_id, 'No free port left at this station'))
+            else:
+                remaining[station_id] -= 1
+                seen.add(vehicle_id)
+                granted.append((vehicles[vehicle_id], stations[station_id]))
+        if not granted:
+            return [], failures
+
+        counts = Counter(station.pk for _, station in granted)
+        # Guarding each row with its own count stops an oversell even where rows are not locked
+        guard = Q()
+        for station_id, count in counts.items():
+            guard |= Q(pk=station_id, available_ports__gte=count)
+        updated = ChargingStation.objects.filter(guard).update(
+            available_ports=F('available_ports') - _port_delta(counts), updated_at=now
+        )
+        if updated != len(counts):
+            raise ReservationConflict()
+
+        slice_index = time_slice(now)
+        sessions = []
+        for vehicle, station in granted:
+            power = min(station.power_output, vehicle.max_charging_power_kw or station.power_output)
+            energy = float(vehicle.battery_capacity_kwh) * FLEET_CHARGE_SHARE
+            sessions.append(ChargingSession(
+                user=user, station=station, vehicle=vehicle,
+                expected_end_time=now + timedelta(seconds=charge_seconds(energy, power)),
+                price_per_kwh=pricing_engine.price_value(
+                    station.pk, station.operator_id, station.charging_type, station.price_per_kwh,
+                    station.available_ports, station.total_ports, slice_index
+                ),
+            ))
+        sessions = ChargingSession.objects.bulk_create(sessions)
+        event_log.sessions_started(sessions)
+
+        summary, _ = FleetSummary.objects.get_or_create(user=user, operator=operator)
+        FleetSummary.objects.filter(pk=summary.pk).update(
+            active_sessions=F('active_sessions') + len(sessions),
+            sessions_started=F('sessions_started') + len(sessions),
+            updated_at=now,
+        )
+    return sessions, failures
+
+
+def stop_fleet_sessions(user, vehicle_ids, operator):
+    """Stop the active sessions of many vehicles at an operator's stations with set-based updates, returns (sessions, failures)"""
+    now = timezone.now()
+    with transaction.atomic():
+        sessions = list(ChargingSession.objects.select_for_update(of=('self',)).select_related('station', 'user').filter(
+            user=user, vehicle_id__in=vehicle_ids, station__operator=operator, status='active'
+        ))
+        stopped = {session.vehicle_id for session in sessions}
+        failures = [(vehicle_id, 'No active charging session found') for vehicle_id in vehicle_ids if vehicle_id not in stopped]
+        if not sessions:
+            return [], failures
+
+        ChargingSession.objects.filter(pk__in=[session.pk for session in sessions]).update(status='completed', end_time=now)
+        counts = Counter(session.station_id for session in sessions)
+        ChargingStation.objects.filter(pk__in=counts).update(
+            available_ports=Least(F('available_ports') + _port_delta(counts), F('total_ports')), updated_at=now
+        )
+        event_log.sessions_stopped(sessions)
+
+        for session in sessions:
+            session.status, session.end_time = 'completed', now
+        # Energy and cost are added to the summary once finalize_sessions has billed the sessions
+        enqueue_many('stations.finalize_sessions', [
+            (f'finalize:{session.pk}', {'session': session.pk}) for session in sessions
+        ])
+        FleetSummary.objects.filter(user=user, operator=operator).update(
+            active_sessions=F('active_sessions') - len(sessions),
+            sessions_completed=F('sessions_completed') + len(sessions),
+            updated_at=now,
+        )
+    return sessions, failures
+
+
+def close_stale_sessions(sessions, before=None, batch_size=1000):
+    """
+    Cancel the active sessions among sessions that started before `before` with set-based updates.
+
+    Meant for sessions whose charger never reported a stop, so nothing is
+    billed. Runs one transaction per batch_size sessions, returns the closed
+    sessions for the caller to send sessions_finished.
+    """
+    if before is None:
+        before = timezone.now() - timedelta(hours=getattr(settings, 'STALE_SESSION_HOURS', 24))
+    ids = list(sessions.filter(status='active', start_time__lt=before).order_by().values_list('pk', flat=True))
+    closed = []
+    for start in range(0, len(ids), batch_size):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(ChargingSession.objects.select_for_update(of=('self',)).select_related('station').filter(
+                pk__in=ids[start:start + batch_size], status='active'
+            ).only('station_id', 'user_id', 'vehicle_id', 'expected_end_time', 'station__operator_id'))
+            if not batch:
+                continue
+            ChargingSession.objects.filter(pk__in=[session.pk for session in batch]).update(status='cancelled', end_time=now)
+            counts = Counter(session.station_id for session in batch)
+            ChargingStation.objects.filter(pk__in=counts).update(
+                available_ports=Least(F('available_ports') + _port_delta(counts), F('total_ports')), updated_at=now
+            )
+            event_log.sessions_stopped(batch)
+            fleets = Counter((session.user_id, session.station.operator_id) for session in batch if session.vehicle_id is not None)
+            for (user_id, operator_id), count in fleets.items():
+                FleetSummary.objects.filter(user_id=user_id, operator_id=operator_id).update(
+                    active_sessions=F('active_sessions') - count, updated_at=now
+                )
+        for session in batch:
+            session.status, session.end_time = 'cancelled', now
+        closed.extend(batch)
+    return closed
+
+
+def fleet_dashboard(user, operator):
+    """Fleet totals from the rollup row plus where each vehicle is charging at the operator's stations right now"""
+    summary = FleetSummary.objects.filter(user=user, operator=operator).values(
+        'active_sessions', 'sessions_started', 'sessions_completed', 'energy_consumed', 'total_cost', 'updated_at'
+    ).first() or {
+        'active_sessions': 0, 'sessions_started': 0, 'sessions_completed': 0,
+        'energy_consumed': 0, 'total_cost': 0, 'updated_at': None,
+    }
+    summary['vehicles'] = Vehicle.objects.filter(owner=user).count()
+    summary['charging'] = list(ChargingSession.objects.filter(
+        user=user, vehicle__isnull=False, station__operator=operator, status='active'
+    ).values('vehicle_id', 'station_id', 'start_time', 'expected_end_time'))
+    return summary
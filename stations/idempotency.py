@@ -0,0 +1,70 @@
+"""
+Idempotency keys for starting and stopping charging sessions.
+
+Mobile clients retry requests whose response got lost. A client that sends
+an Idempotency-Key header with start_charging or stop_charging gets the
+first response again on every retry with the same key, instead of a second
+session or a "No active charging session found".
+
+The key is looked up and claimed inside the transaction that reserves or
+releases the port. On SQLite the transaction holds the write lock from its
+start, so a concurrent duplicate waits and then finds the key. Elsewhere
+both may run, but only one can insert the key, and the loser's transaction
+rolls back before it replays the winner's response.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+def _lifetime():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_SECONDS', 24 * 3600))
+
+
+def request_key(request):
+    """The request's idempotency key, None without one"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise InvalidKey(f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters')
+    return key
+
+
+def find_key(user, key):
+    """The stored key of user, dropping it when it has expired so it can be claimed again"""
+    stored = IdempotencyKey.objects.select_related('session').filter(user=user, key=key).first()
+    if stored is not None and stored.created_at < timezone.now() - _lifetime():
+        stored.delete()
+        return None
+    return stored
+
+
+def claim_key(user, key, action, session, status_code):
+    """Record the outcome of a request, raises IntegrityError when a concurrent duplicate claimed the key first"""
+    return IdempotencyKey.objects.create(user=user, key=key, action=action, session=session, status_code=status_code)
+
+
+def store_response(stored, data):
+    IdempotencyKey.objects.filter(pk=stored.pk).update(response=data)
+
+
+def expire_keys(batch_size=5000):
+    """Delete the keys older than IDEMPOTENCY_KEY_SECONDS, batch_size rows per statement, returns how many"""
+    before = timezone.now() - _lifetime()
+    removed = 0
+    while True:
+        batch = list(IdempotencyKey.objects.filter(created_at__lt=before).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,214 @@
+import bisect
+import threading
+
+
+class StationLoad:
+    """Active sessions at one station and the kW each is allocated under the station's policy"""
+
+    def __init__(self, capacity_kw, port_power_kw, policy='equal'):
+        self.capacity_kw = float(capacity_kw)
+        self.port_power_kw = float(port_power_kw)
+        self.policy = policy
+        # Sort keys in allocation order (each ends with its session id), allocations keyed by session id
+        self._order = []
+        self._keys = {}
+        self._allocations = {}
+        self.recomputed = 0
+
+    def copy(self):
+        load = StationLoad(self.capacity_kw, self.port_power_kw, self.policy)
+        load._order, load._keys, load._allocations = list(self._order), dict(self._keys), dict(self._allocations)
+        return load
+
+    @property
+    def newest(self):
+        """Highest session id, 0 without sessions"""
+        return max(self._keys, default=0)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, session_id):
+        return session_id in self._keys
+
+    def _sort_key(self, session_id, started_at, priority):
+        if self.policy == 'priority':
+            return (-priority, started_at, session_id)
+        return (started_at, session_id)
+
+    @property
+    def equal_share(self):
+        if not self._keys:
+            return 0.0
+        return min(self.port_power_kw, self.capacity_kw / len(self._keys))
+
+    def allocation(self, session_id):
+        if session_id not in self._keys:
+            return None
+        if self.policy == 'equal':
+            return self.equal_share
+        return self._allocations[session_id]
+
+    def allocations(self):
+        return {session_id: self.allocation(session_id) for session_id in self._keys}
+
+    def headroom(self, priority=0):
+        """kW a session joining now would be allocated"""
+        if self.policy == 'equal':
+            return min(self.port_power_kw, self.capacity_kw / (len(self._keys) + 1))
+        used = sum(
+            self._allocations[key[-1]] for key in self._order
+            if self.policy != 'priority' or -key[0] >= priority
+        )
+        return max(0.0, min(self.port_power_kw, self.capacity_kw - used))
+
+    def add(self, session_id, started_at, priority=0):
+        key = self._sort_key(session_id, started_at, priority)
+        self._keys[session_id] = key
+        position = bisect.bisect(self._order, key)
+        self._order.insert(position, key)
+        # An equal share is computed on read, so only ordered policies need a refill
+        if self.policy != 'equal':
+            self._refill(position)
+
+    def remove(self, session_id):
+        key = self._keys.pop(session_id, None)
+        if key is None:
+            return
+        position = bisect.bisect_left(self._order, key)
+        del self._order[position]
+        self._allocations.pop(session_id, None)
+        if self.policy != 'equal':
+            self._refill(position)
+
+    def _refill(self, position):
+        """Greedily hand out capacity from position onward, stopping once later sessions are unaffected"""
+        remaining = self.capacity_kw - sum(self._allocations[key[-1]] for key in self._order[:position])
+        for key in self._order[position:]:
+            session_id = key[-1]
+            allocation = max(0.0, min(self.port_power_kw, remaining))
+            previous = self._allocations.get(session_id)
+            if previous == allocation == 0.0:
+                # Everything after a starved session is starved as well
+                break
+            self._allocations[session_id] = allocation
+            remaining -= allocation
+            self.recomputed += 1
+
+    def total_allocated(self):
+        return sum(self.allocations().values())
+
+
+class LoadManager:
+    """
+    Station loads kept between calls and checked against the database.
+
+    A cached load is valid for one version of its station: the capacity,
+    power, ports and policy, plus the count and highest id of its active
+    sessions. Session ids only grow, so every start or stop moves that pair,
+    whichever process made it. loads() reads the versions of the stations it
+    is asked for in one query and rebuilds only the stale ones, while starts
+    and stops in this process update their station's load in place.
+    """
+
+    def __init__(self):
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def _versions(self, station_ids):
+        """(capacity, power, policy, active sessions, highest active session id) of each station"""
+        from django.db import connections, router
+        from .models import ChargingStation, ChargingSession
+
+        station_ids = list(set(station_ids))
+        if not station_ids:
+            return {}
+        # Runs before every ranking and allocation, the plain SQL costs a fraction of compiling the ORM subqueries
+        sql = (
+            'SELECT s.id, s.grid_capacity_kw, s.power_output, s.total_ports, s.load_policy, COUNT(c.id), MAX(c.id) '
+            f'FROM {ChargingStation._meta.db_table} s LEFT JOIN {ChargingSession._meta.db_table} c '
+            'ON c.station_id = s.id AND c.status = %s '
+            f'WHERE s.id IN ({", ".join(["%s"] * len(station_ids))}) '
+            'GROUP BY s.id, s.grid_capacity_kw, s.power_output, s.total_ports, s.load_policy'
+        )
+        with connections[router.db_for_read(ChargingStation)].cursor() as cursor:
+            cursor.execute(sql, ['active', *station_ids])
+            rows = cursor.fetchall()
+        return {row[0]: (row[1] or row[2] * row[3], row[2], row[4], row[5], row[6] or 0) for row in rows}
+
+    @staticmethod
+    def _version(load):
+        return (load.capacity_kw, load.port_power_kw, load.policy, len(load), load.newest)
+
+    def loads(self, station_ids):
+        """StationLoad of every existing station in station_ids, rebuilding only those that changed since cached"""
+        from .models import ChargingSession
+
+        versions = self._versions(station_ids)
+        loads, stale = {}, {}
+        with self._lock:
+            for station_id, version in versions.items():
+                cached = self._loads.get(station_id)
+                if cached is not None and cached[0] == version:
+                    loads[station_id] = cached[1]
+                else:
+                    stale[station_id] = StationLoad(*version[:3])
+        if not stale:
+            return loads
+        sessions = ChargingSession.objects.filter(status='active', station_id__in=stale).order_by('start_time', 'id').values_list(
+            'id', 'station_id', 'start_time', 'priority'
+        )
+        for session_id, station_id, start_time, priority in sessions:
+            stale[station_id].add(session_id, start_time.timestamp(), priority)
+        with self._lock:
+            for station_id, load in stale.items():
+                # Versioned by the sessions actually read, a commit after the version query only means a rebuild next time
+                self._loads[station_id] = (self._version(load), load)
+        loads.update(stale)
+        return loads
+
+    def _apply(self, sessions, change):
+        """Copy each cached load the sessions belong to and change it, readers keep the load they were given"""
+        by_station = {}
+        for session in sessions:
+            by_station.setdefault(session.station_id, []).append(session)
+        with self._lock:
+            for station_id, changed in by_station.items():
+                cached = self._loads.get(station_id)
+                if cached is None:
+                    continue
+                load = cached[1].copy()
+                for session in changed:
+                    change(load, session)
+                self._loads[station_id] = (self._version(load), load)
+
+    def started(self, sessions):
+        """Add sessions committed by this process to the cached loads"""
+        self._apply(sessions, lambda load, session: load.add(session.pk, session.start_time.timestamp(), session.priority))
+
+    def finished(self, sessions):
+        self._apply(sessions, lambda load, session: load.remove(session.pk))
+
+    def forget(self, station_id=None):
+        with self._lock:
+            if station_id is None:
+                self._loads.clear()
+            else:
+                self._loads.pop(station_id, None)
+
+    def station(self, station_id):
+        return self.loads([station_id]).get(station_id)
+
+    def allocation(self, session, loads=None):
+        """kW allocated to an active session, from loads when the caller loaded its station already"""
+        if session.status != 'active':
+            return None
+        load = self.station(session.station_id) if loads is None else loads.get(session.station_id)
+        return load.allocation(session.pk) if load is not None else None
+
+    def headroom(self, station_id, priority=0, loads=None):
+        load = self.station(station_id) if loads is None else loads.get(station_id)
+        return load.headroom(priority) if load is not None else 0.0
+
+
+load_manager = LoadManager()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils.module_loading import autodiscover_modules
+from evspot.benchmarks import registry
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help='Benchmark to run, omit to list them')
+        parser.add_argument('--scale', type=int, help='Size of the generated dataset')
+        parser.add_argument('--iterations', type=int, help='Number of timed operations')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+
+    def handle(self, *args, **options):
+        autodiscover_modules('benchmarks')
+        name = options['name']
+        if not name:
+            for key in sorted(registry):
+                self.stdout.write(key)
+            return
+        if name not in registry:
+            raise CommandError(f'Unknown benchmark "{name}", choose from: {", ".join(sorted(registry))}')
+
+        func, defaults = registry[name]
+        params = dict(defaults)
+        for key in ('scale', 'iterations'):
+            if options[key] is not None:
+                params[key] = options[key]
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        try:
+            results = func(**params)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(self.style.SUCCESS(f'{name} ({", ".join(f"{k}={v}" for k, v in params.items())})'))
+        for label, value in results.items():
+            if isinstance(value, float):
+                value = f'{value:,.4f}'
+            self.stdout.write(f'  {label}: {value}')
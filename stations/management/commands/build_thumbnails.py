@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from stations.models import ChargingStation
+from tasks.queue import enqueue_many
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Queue thumbnail builds for station and profile images that have none yet'
+
+    def handle(self, *args, **options):
+        stations = ChargingStation.objects.exclude(Q(image='') | Q(image__isnull=True)).filter(image_derivatives={})
+        users = CustomUser.objects.exclude(Q(profile_picture='') | Q(profile_picture__isnull=True)).filter(profile_picture_derivatives={})
+        station_ids = list(stations.values_list('pk', flat=True))
+        user_ids = list(users.values_list('pk', flat=True))
+        enqueue_many('stations.build_thumbnails', [(f'thumbnails:station:{pk}', {'station': pk}) for pk in station_ids])
+        enqueue_many('users.build_thumbnails', [(f'thumbnails:user:{pk}', {'user': pk}) for pk in user_ids])
+        self.stdout.write(self.style.SUCCESS(f'Queued {len(station_ids)} station and {len(user_ids)} profile images'))
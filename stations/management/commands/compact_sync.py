@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from stations.models import Operator
+from stations.sync import compact_changes, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Compact the station change log and write a fresh sync snapshot per operator, run periodically from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-snapshot', action='store_true', help='Only compact the change log')
+
+    def handle(self, *args, **options):
+        removed, added = compact_changes()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} superseded changes, logged {added} new stations'))
+        if not options['skip_snapshot']:
+            for operator in Operator.objects.all():
+                self.stdout.write(self.style.SUCCESS(f'Wrote {write_snapshot(operator)}'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from stations.idempotency import expire_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_SECONDS, run periodically from cron'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Removed {expire_keys()} expired idempotency keys'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from stations.models import ChargingStation, Review
+from stations.operators import operator_directory
 from decimal import Decimal
 import random
 
@@ -140,12 +141,13 @@ class Command(BaseCommand):
             }
         ]
 
-        # Create charging stations
+        # Create charging stations, owned by the operator commands act for
+        operator = operator_directory.default()
         stations = []
         for data in stations_data:
             station, created = ChargingStation.objects.get_or_create(
                 name=data['name'],
-                defaults=data
+                defaults={**data, 'operator': operator}
             )
             if created:
                 stations.append(station)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from stations.tiles import rebuild_cells
+
+
+class Command(BaseCommand):
+    help = 'Recount the map tile cells of every station, needed after imports that bypass model signals'
+
+    def handle(self, *args, **options):
+        created = rebuild_cells()
+        self.stdout.write(self.style.SUCCESS(f'Built {created} tile cells'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from stations.analytics import rebuild_usage
+
+
+class Command(BaseCommand):
+    help = 'Recount the analytics usage rows from every completed session, needed after session imports or edits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Stations whose sessions are grouped per query')
+
+    def handle(self, *args, **options):
+        stations, regions = rebuild_usage(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {stations} station and {regions} region usage rows'))
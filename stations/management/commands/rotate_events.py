@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from stations.events import rotate_events
+
+
+class Command(BaseCommand):
+    help = 'Move station events older than --days to a gzipped archive file, leaving a checkpoint per station'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Events newer than this many days stay in the database')
+        parser.add_argument('--archive-dir', default=settings.STATION_EVENT_ARCHIVE_DIR, help='Directory for archive files')
+
+    def handle(self, *args, **options):
+        archived, path = rotate_events(timezone.now() - timedelta(days=options['days']), options['archive_dir'])
+        if path is None:
+            self.stdout.write('No events old enough to rotate')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} events to {path}'))
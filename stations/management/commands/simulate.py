@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from stations.models import ChargingStation
+from stations.simulation import DemandModel, Simulation, synthesize_network, write_columns
+
+
+# Options that decide the outcome, recorded with the results so a run can be repeated
+SIMULATION_OPTIONS = ['stations', 'from_db', 'clusters', 'seed', 'arrival_rate', 'demand_samples', 'days', 'max_queue', 'patience']
+
+
+class Command(BaseCommand):
+    help = 'Simulate a period of charging demand and write per-station results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=1000, help='Size of the synthetic network')
+        parser.add_argument('--from-db', action='store_true', help='Simulate the active stations in the database instead')
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--arrival-rate', type=float, default=0.3, help='Mean arrivals per station per hour')
+        parser.add_argument('--clusters', type=int, default=50, help='Demand hotspots for the synthetic network')
+        parser.add_argument('--max-queue', type=int, default=3)
+        parser.add_argument('--patience', type=int, default=20, help='Minutes a queued driver waits before leaving')
+        parser.add_argument('--demand-samples', type=int, default=200000, help='Demand points dropped to weight the stations')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='simulation_results.zip')
+
+    def handle(self, *args, **options):
+        if options['from_db']:
+            stations = list(ChargingStation.objects.filter(status='active'))
+            hotspots = None
+            if not stations:
+                raise CommandError('There are no active stations to simulate')
+            for station in stations:
+                # Sessions charging right now hold some of the live ports, the simulated period starts with all of them free
+                station.available_ports = station.total_ports
+        else:
+            stations, hotspots = synthesize_network(options['stations'], options['clusters'], seed=options['seed'])
+
+        self.stdout.write(f'Generating demand for {len(stations)} stations...')
+        demand = DemandModel(
+            stations, options['arrival_rate'], hotspots=hotspots, demand_samples=options['demand_samples'], seed=options['seed']
+        )
+        simulation = Simulation(
+            stations, demand, days=options['days'],
+            max_queue=options['max_queue'], patience_minutes=options['patience']
+        )
+        self.stdout.write(f'Simulating {options["days"]} days...')
+        simulation.run()
+
+        summary = simulation.summary()
+        parameters = {name: options[name] for name in SIMULATION_OPTIONS}
+        write_columns(options['output'], simulation.columns(), metadata={'options': parameters, 'summary': summary})
+        for key, value in summary.items():
+            self.stdout.write(f'  {key}: {value:,.4f}' if isinstance(value, float) else f'  {key}: {value:,}')
+        self.stdout.write(self.style.SUCCESS(f'Wrote per-station results to {options["output"]}'))
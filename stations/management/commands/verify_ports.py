@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from stations.events import verify_ports
+from stations.models import ChargingStation
+from stations.sync import record_station_changes
+
+
+class Command(BaseCommand):
+    help = 'Replay the station event log and report stations whose available_ports drifted from it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('stations', nargs='*', type=int, help='Station ids to check, all stations when omitted')
+        parser.add_argument('--repair', action='store_true', help='Set drifted stations to their replayed counts')
+
+    def handle(self, *args, **options):
+        drift = verify_ports(options['stations'] or None)
+        for pk, (stored, replayed) in sorted(drift.items()):
+            self.stdout.write(f'Station {pk}: available_ports is {stored}, events replay to {replayed}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Every station matches its events'))
+            return
+        if options['repair']:
+            now = timezone.now()
+            for pk, (_, replayed) in drift.items():
+                ChargingStation.objects.filter(pk=pk).update(available_ports=replayed, updated_at=now)
+            record_station_changes(drift)
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drift)} stations'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} stations drifted, run with --repair to fix them'))
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingsession',
+            name='expected_end_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.AddIndex(
+            model_name='chargingsession',
+            index=models.Index(fields=['station', 'status'], name='session_station_status_idx'),
+        ),
+    ]
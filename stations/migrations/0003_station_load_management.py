@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0002_session_expected_end_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingsession',
+            name='priority',
+            field=models.IntegerField(default=0, help_text='Higher priority sessions are served first under the priority load policy'),
+        ),
+        migrations.AddField(
+            model_name='chargingstation',
+            name='grid_capacity_kw',
+            field=models.IntegerField(blank=True, help_text='Grid connection cap shared by all ports in kW, empty means uncapped', null=True),
+        ),
+        migrations.AddField(
+            model_name='chargingstation',
+            name='load_policy',
+            field=models.CharField(choices=[('equal', 'Equal Share'), ('fifo', 'First Come First Served'), ('priority', 'Session Priority')], default='equal', max_length=10),
+        ),
+    ]
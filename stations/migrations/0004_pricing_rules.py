@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:09
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0003_station_load_management'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingsession',
+            name='price_per_kwh',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Price locked in when the session started', max_digits=5, null=True),
+        ),
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('charging_type', models.CharField(blank=True, choices=[('slow', 'Slow Charging'), ('fast', 'Fast Charging'), ('super', 'Super Fast Charging')], max_length=10)),
+                ('weekdays', models.CharField(default='0123456', help_text='Days the rule applies, Monday is 0', max_length=7)),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, help_text='Windows may wrap past midnight, leave both times empty for all day', null=True)),
+                ('min_occupancy', models.DecimalField(decimal_places=2, default=0, max_digits=3, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)])),
+                ('multiplier', models.DecimalField(decimal_places=2, max_digits=4, validators=[django.core.validators.MinValueValidator(0)])),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('station', models.ForeignKey(blank=True, help_text='Empty applies the rule to every station', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='stations.chargingstation')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0004_pricing_rules'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chargingsession',
+            index=models.Index(fields=['user', 'start_time'], name='session_user_start_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0002_vehicle'),
+        ('stations', '0005_session_user_start_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingsession',
+            name='vehicle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessions', to='users.vehicle'),
+        ),
+        migrations.CreateModel(
+            name='FleetSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('active_sessions', models.IntegerField(default=0)),
+                ('sessions_started', models.IntegerField(default=0)),
+                ('sessions_completed', models.IntegerField(default=0)),
+                ('energy_consumed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fleet_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
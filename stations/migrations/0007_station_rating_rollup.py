@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:39
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_ratings(apps, schema_editor):
+    ChargingStation = apps.get_model('stations', 'ChargingStation')
+    Review = apps.get_model('stations', 'Review')
+    for row in Review.objects.values('station').annotate(average=Avg('rating'), count=Count('id')):
+        ChargingStation.objects.filter(pk=row['station']).update(average_rating=row['average'], total_reviews=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0006_fleet_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingstation',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chargingstation',
+            name='total_reviews',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
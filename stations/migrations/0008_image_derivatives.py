@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0007_station_rating_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingstation',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Thumbnail paths built from image by a background task'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+def build_cells(apps, schema_editor):
+    from stations.tiles import rebuild_cells
+    rebuild_cells(apps.get_model('stations', 'ChargingStation'), apps.get_model('stations', 'StationCell'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0008_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargingstation',
+            name='grid_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='StationCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('key', models.BigIntegerField(help_text='x * 2**zoom + y')),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('station_count', models.IntegerField(default=0)),
+                ('available_stations', models.IntegerField(default=0)),
+                ('available_ports', models.IntegerField(default=0)),
+                ('total_ports', models.IntegerField(default=0)),
+                ('latitude_sum', models.FloatField(default=0)),
+                ('longitude_sum', models.FloatField(default=0)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['zoom', 'x', 'y'], name='station_cell_xy_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stationcell',
+            constraint=models.UniqueConstraint(fields=('zoom', 'key'), name='station_cell_unique'),
+        ),
+        migrations.RunPython(build_cells, migrations.RunPython.noop),
+    ]
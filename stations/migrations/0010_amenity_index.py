@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_existing_amenities(apps, schema_editor):
+    from stations.amenities import index_amenities
+    ChargingStation = apps.get_model('stations', 'ChargingStation')
+    index_amenities(
+        ChargingStation.objects.values_list('pk', 'amenities').iterator(),
+        amenity_model=apps.get_model('stations', 'Amenity'), link_model=apps.get_model('stations', 'StationAmenity'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0009_station_cells'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=60, unique=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+            options={
+                'ordering': ['slug'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StationAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amenity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='station_links', to='stations.amenity')),
+                ('station', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='amenity_links', to='stations.chargingstation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['station', 'amenity'], name='station_amenity_station_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stationamenity',
+            constraint=models.UniqueConstraint(fields=('amenity', 'station'), name='station_amenity_unique'),
+        ),
+        migrations.RunPython(index_existing_amenities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0010_amenity_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['status', 'power_output'], name='station_status_power_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['status', 'price_per_kwh'], name='station_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['status', 'available_ports'], name='station_status_ports_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['status', 'latitude', 'longitude'], name='station_status_location_idx'),
+        ),
+    ]
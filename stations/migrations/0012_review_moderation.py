@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0011_station_range_indexes'),
+    ]
+
+    operations = [
+        # Reviews written before moderation stay visible, new ones start out pending
+        migrations.AddField(
+            model_name='review',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('published', 'Published'), ('held', 'Held for moderation'), ('rejected', 'Rejected')], default='published', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('published', 'Published'), ('held', 'Held for moderation'), ('rejected', 'Rejected')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['station', 'status', '-created_at', '-id'], name='review_station_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['status', 'created_at'], name='review_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:40
+
+from django.db import migrations, models
+
+
+def log_existing_stations(apps, schema_editor):
+    from stations.sync import compact_changes
+    compact_changes(change_model=apps.get_model('stations', 'StationChange'), station_model=apps.get_model('stations', 'ChargingStation'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0012_review_moderation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['station_id', 'id'], name='station_change_station_idx')],
+            },
+        ),
+        migrations.RunPython(log_existing_stations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def record_existing_stations(apps, schema_editor):
+    ChargingStation = apps.get_model('stations', 'ChargingStation')
+    StationEvent = apps.get_model('stations', 'StationEvent')
+    rows = ChargingStation.objects.values_list('pk', 'available_ports', 'total_ports', 'status').iterator(chunk_size=5000)
+    StationEvent.objects.bulk_create((
+        StationEvent(station_id=pk, kind='state', available_ports=available, total_ports=total, status=status)
+        for pk, available, total, status in rows
+    ), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0013_station_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_id', models.BigIntegerField()),
+                ('session_id', models.BigIntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('state', 'Station saved'), ('session_started', 'Session started'), ('session_stopped', 'Session stopped'), ('deleted', 'Station deleted'), ('checkpoint', 'Replayed state of rotated events')], max_length=20)),
+                ('ports_delta', models.SmallIntegerField(default=0)),
+                ('available_ports', models.IntegerField(blank=True, null=True)),
+                ('total_ports', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['station_id', 'id'], name='station_event_station_idx'), models.Index(fields=['created_at'], name='station_event_created_idx')],
+            },
+        ),
+        migrations.RunPython(record_existing_stations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0014_station_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chargingsession',
+            index=models.Index(fields=['start_time', 'id'], name='session_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingsession',
+            index=models.Index(fields=['status', 'start_time', 'id'], name='session_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_existing_sessions(apps, schema_editor):
+    from stations.analytics import rebuild_usage
+    rebuild_usage(
+        session_model=apps.get_model('stations', 'ChargingSession'), station_model=apps.get_model('stations', 'ChargingStation'),
+        station_usage_model=apps.get_model('stations', 'StationUsage'), region_usage_model=apps.get_model('stations', 'RegionUsage'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0015_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.BigIntegerField()),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('sessions', models.IntegerField(default=0)),
+                ('energy_consumed', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StationUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.BigIntegerField()),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('start', models.DateField()),
+                ('sessions', models.IntegerField(default=0)),
+                ('energy_consumed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chargingsession',
+            index=models.Index(fields=['station', 'end_time'], name='session_station_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='stationusage',
+            name='station',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='stations.chargingstation'),
+        ),
+        migrations.AddIndex(
+            model_name='regionusage',
+            index=models.Index(fields=['region', 'period', 'start'], name='region_usage_region_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='regionusage',
+            constraint=models.UniqueConstraint(fields=('period', 'start', 'region'), name='region_usage_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='stationusage',
+            index=models.Index(fields=['station', 'period', 'start'], name='station_usage_station_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationusage',
+            index=models.Index(fields=['period', 'region', 'start'], name='station_usage_region_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stationusage',
+            constraint=models.UniqueConstraint(fields=('period', 'start', 'station'), name='station_usage_unique'),
+        ),
+        migrations.RunPython(count_existing_sessions, migrations.RunPython.noop),
+    ]
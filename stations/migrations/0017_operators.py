@@ -0,0 +1,182 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import stations.models
+
+
+def assign_default_operator(apps, schema_editor):
+    Operator = apps.get_model('stations', 'Operator')
+    operator, _ = Operator.objects.get_or_create(slug=settings.DEFAULT_OPERATOR, defaults={'name': settings.DEFAULT_OPERATOR})
+    for name in ['ChargingStation', 'PricingRule', 'StationCell', 'StationUsage', 'RegionUsage']:
+        apps.get_model('stations', name).objects.update(operator=operator)
+    apps.get_model('stations', 'StationChange').objects.update(operator_id=operator.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0016_usage_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Operator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=60, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='regionusage',
+            name='region_usage_unique',
+        ),
+        migrations.RemoveConstraint(
+            model_name='stationcell',
+            name='station_cell_unique',
+        ),
+        migrations.RemoveIndex(
+            model_name='chargingstation',
+            name='station_status_power_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chargingstation',
+            name='station_status_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chargingstation',
+            name='station_status_ports_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chargingstation',
+            name='station_status_location_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='regionusage',
+            name='region_usage_region_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stationcell',
+            name='station_cell_xy_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stationusage',
+            name='station_usage_region_idx',
+        ),
+        migrations.AddField(
+            model_name='chargingstation',
+            name='operator',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stations', to='stations.operator'),
+        ),
+        migrations.AddField(
+            model_name='pricingrule',
+            name='operator',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='stations.operator'),
+        ),
+        migrations.AddField(
+            model_name='stationcell',
+            name='operator',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AddField(
+            model_name='stationusage',
+            name='operator',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AddField(
+            model_name='regionusage',
+            name='operator',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AddField(
+            model_name='stationchange',
+            name='operator_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(assign_default_operator, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chargingstation',
+            name='operator',
+            field=models.ForeignKey(db_index=False, default=stations.models.default_operator_id, on_delete=django.db.models.deletion.PROTECT, related_name='stations', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='pricingrule',
+            name='operator',
+            field=models.ForeignKey(default=stations.models.default_operator_id, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='pricingrule',
+            name='station',
+            field=models.ForeignKey(blank=True, help_text='Empty applies the rule to every station of the operator', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='stations.chargingstation'),
+        ),
+        migrations.AlterField(
+            model_name='stationcell',
+            name='operator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='stationusage',
+            name='operator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='regionusage',
+            name='operator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='stationchange',
+            name='operator_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['operator', 'created_at'], name='station_operator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['operator', 'status', 'power_output'], name='station_operator_power_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['operator', 'status', 'price_per_kwh'], name='station_operator_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['operator', 'status', 'available_ports'], name='station_operator_ports_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chargingstation',
+            index=models.Index(fields=['operator', 'status', 'latitude', 'longitude'], name='station_operator_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='regionusage',
+            index=models.Index(fields=['operator', 'region', 'period', 'start'], name='region_usage_op_region_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationcell',
+            index=models.Index(fields=['operator', 'zoom', 'x', 'y'], name='station_cell_operator_xy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationchange',
+            index=models.Index(fields=['operator_id', 'id'], name='station_change_operator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stationusage',
+            index=models.Index(fields=['operator', 'period', 'start'], name='station_usage_operator_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='regionusage',
+            constraint=models.UniqueConstraint(fields=('operator', 'period', 'start', 'region'), name='region_usage_operator_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='stationcell',
+            constraint=models.UniqueConstraint(fields=('operator', 'zoom', 'key'), name='station_cell_operator_unique'),
+        ),
+    ]
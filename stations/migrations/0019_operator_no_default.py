@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0018_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chargingstation',
+            name='operator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='stations', to='stations.operator'),
+        ),
+        migrations.AlterField(
+            model_name='pricingrule',
+            name='operator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='stations.operator'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-19 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+
+
+def rebuild_fleet_summaries(apps, schema_editor):
+    # The old rows mixed every operator's sessions, count each operator's again from the sessions
+    FleetSummary = apps.get_model('stations', 'FleetSummary')
+    ChargingSession = apps.get_model('stations', 'ChargingSession')
+    FleetSummary.objects.all().delete()
+    rows = ChargingSession.objects.filter(vehicle__isnull=False).order_by().values('user', 'station__operator').annotate(
+        active=Count('id', filter=Q(status='active')), started=Count('id'), completed=Count('id', filter=Q(status='completed')),
+        energy=Sum('energy_consumed'), cost=Sum('total_cost'),
+    )
+    FleetSummary.objects.bulk_create([
+        FleetSummary(
+            user_id=row['user'], operator_id=row['station__operator'], active_sessions=row['active'],
+            sessions_started=row['started'], sessions_completed=row['completed'],
+            energy_consumed=row['energy'], total_cost=row['cost'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('stations', '0019_operator_no_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fleetsummary',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fleet_summaries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='fleetsummary',
+            name='operator',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fleet_summaries', to='stations.operator'),
+        ),
+        migrations.RunPython(rebuild_fleet_summaries, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fleetsummary',
+            name='operator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fleet_summaries', to='stations.operator'),
+        ),
+        migrations.AddConstraint(
+            model_name='fleetsummary',
+            constraint=models.UniqueConstraint(fields=('user', 'operator'), name='fleet_summary_unique'),
+        ),
+    ]
@@ -1,10 +1,45 @@
+from decimal import Decimal
 from django.db import models
-from django.contrib.auth.models import get_user_model
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 User = get_user_model()
 
 
+class Operator(models.Model):
+    """
+    A charging network hosted on this deployment, the tenant its stations belong to.
+
+    Requests name their operator with the X-Operator header and only see its
+    stations and what hangs off them, see stations.operators. Rows live in
+    the default database even for operators moved to their own.
+    """
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=60, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+
+def default_operator_id():
+    # No longer a field default, migration 0017 still names it
+    from .operators import operator_directory
+    return operator_directory.default().pk
+
+
+class StationQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates skip auto_now, bump updated_at so station ETags and sync cursors move"""
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+
 class ChargingStation(models.Model):
     CHARGING_TYPES = [
         ('slow', 'Slow Charging'),
@@ -18,6 +53,13 @@ class ChargingStation(models.Model):
         ('inactive', 'Inactive'),
     ]
     
+    LOAD_POLICIES = [
+        ('equal', 'Equal Share'),
+        ('fifo', 'First Come First Served'),
+        ('priority', 'Session Priority'),
+    ]
+    
+    operator = models.ForeignKey(Operator, on_delete=models.PROTECT, related_name='stations', db_index=False)
     name = models.CharField(max_length=200)
     address = models.TextField()
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
@@ -28,14 +70,34 @@ class ChargingStation(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     total_ports = models.IntegerField(default=1)
     available_ports = models.IntegerField(default=1)
+    grid_capacity_kw = models.IntegerField(blank=True, null=True, help_text="Grid connection cap shared by all ports in kW, empty means uncapped")
+    load_policy = models.CharField(max_length=10, choices=LOAD_POLICIES, default='equal')
     image = models.ImageField(upload_to='station_images/', blank=True, null=True)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False, help_text="Thumbnail paths built from image by a background task")
     description = models.TextField(blank=True)
     amenities = models.JSONField(default=list, blank=True)
+    # Review rollup, refreshed in the background by the stations.refresh_ratings task
+    average_rating = models.FloatField(default=0)
+    total_reviews = models.IntegerField(default=0)
+    # Map tile cell at the finest clustering zoom, see stations.tiles
+    grid_cell = models.BigIntegerField(blank=True, null=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = StationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        # Every request filters on its operator, so each index starts with it and one operator's
+        # queries never read another's rows. Ranges sit behind status, which nearby always filters
+        # on and map clients pass as status=active.
+        indexes = [
+            models.Index(fields=['operator', 'created_at'], name='station_operator_created_idx'),
+            models.Index(fields=['operator', 'status', 'power_output'], name='station_operator_power_idx'),
+            models.Index(fields=['operator', 'status', 'price_per_kwh'], name='station_operator_price_idx'),
+            models.Index(fields=['operator', 'status', 'available_ports'], name='station_operator_ports_idx'),
+            models.Index(fields=['operator', 'status', 'latitude', 'longitude'], name='station_operator_location_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.address}"
@@ -43,6 +105,23 @@ class ChargingStation(models.Model):
     @property
     def is_available(self):
         return self.available_ports > 0 and self.status == 'active'
+    
+    @property
+    def effective_price_per_kwh(self):
+        """Price after time-of-use and occupancy rules for the current time slice"""
+        from .pricing import pricing_engine
+        return pricing_engine.price(self)
+    
+    def occupy_port(self):
+        """Take a port on this instance only, assignment.reserve_port does the same in the database"""
+        if not self.is_available:
+            return False
+        self.available_ports -= 1
+        return True
+    
+    def free_port(self):
+        if self.available_ports < self.total_ports:
+            self.available_ports += 1
 
 
 class ChargingSession(models.Model):
@@ -54,29 +133,65 @@ class ChargingSession(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     station = models.ForeignKey(ChargingStation, on_delete=models.CASCADE)
+    vehicle = models.ForeignKey('users.Vehicle', on_delete=models.SET_NULL, blank=True, null=True, related_name='sessions')
     start_time = models.DateTimeField(auto_now_add=True)
     end_time = models.DateTimeField(blank=True, null=True)
     energy_consumed = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     total_cost = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    expected_end_time = models.DateTimeField(blank=True, null=True)
+    price_per_kwh = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True, help_text="Price locked in when the session started")
+    priority = models.IntegerField(default=0, help_text="Higher priority sessions are served first under the priority load policy")
     
     class Meta:
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['station', 'status'], name='session_station_status_idx'),
+            models.Index(fields=['user', 'start_time'], name='session_user_start_idx'),
+            models.Index(fields=['start_time', 'id'], name='session_start_idx'),
+            models.Index(fields=['status', 'start_time', 'id'], name='session_status_start_idx'),
+            models.Index(fields=['station', 'end_time'], name='session_station_end_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.station.name}"
+    
+    def finish(self, end_time, energy_kwh=None):
+        """Close the session, billing energy_kwh at the locked-in price when it is known"""
+        self.status = 'completed'
+        self.end_time = end_time
+        if energy_kwh is not None:
+            price = self.price_per_kwh if self.price_per_kwh is not None else self.station.price_per_kwh
+            self.energy_consumed = Decimal(energy_kwh).quantize(Decimal('0.01'))
+            self.total_cost = (self.energy_consumed * price).quantize(Decimal('0.01'))
 
 
 class Review(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('published', 'Published'),
+        ('held', 'Held for moderation'),
+        ('rejected', 'Rejected'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     station = models.ForeignKey(ChargingStation, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True)
+    # Only published reviews are listed and counted in the station's rating
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'station']
+        indexes = [
+            # A station's published reviews, newest first, in index order for keyset pages
+            models.Index(fields=['station', 'status', '-created_at', '-id'], name='review_station_recent_idx'),
+            models.Index(fields=['status', 'created_at'], name='review_status_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.station.name} - {self.rating} stars"
@@ -91,4 +206,262 @@ class FavoriteStation(models.Model):
         unique_together = ['user', 'station']
     
     def __str__(self):
-        return f"{self.user.username} - {self.station.name}" 
\ No newline at end of file
+        return f"{self.user.username} - {self.station.name}"
+
+
+class PricingRule(models.Model):
+    """
+    Multiplier applied to a station's base price_per_kwh.
+
+    A rule applies inside its weekly time window and, when min_occupancy is
+    set, only once that share of the station's ports is busy. Every matching
+    rule of the station's operator multiplies the price.
+    """
+    name = models.CharField(max_length=100)
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='pricing_rules')
+    station = models.ForeignKey(ChargingStation, on_delete=models.CASCADE, blank=True, null=True, related_name='pricing_rules', help_text="Empty applies the rule to every station of the operator")
+    charging_type = models.CharField(max_length=10, choices=ChargingStation.CHARGING_TYPES, blank=True)
+    weekdays = models.CharField(max_length=7, default='0123456', help_text="Days the rule applies, Monday is 0")
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True, help_text="Windows may wrap past midnight, leave both times empty for all day")
+    min_occupancy = models.DecimalField(max_digits=3, decimal_places=2, default=0, validators=[MinValueValidator(0), MaxValueValidator(1)])
+    multiplier = models.DecimalField(max_digits=4, decimal_places=2, validators=[MinValueValidator(0)])
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} (x{self.multiplier})"
+
+
+class FleetSummary(models.Model):
+    """Running totals of a fleet owner's vehicle sessions at one operator's stations, kept current by the batch endpoints"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fleet_summaries')
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='fleet_summaries')
+    active_sessions = models.IntegerField(default=0)
+    sessions_started = models.IntegerField(default=0)
+    sessions_completed = models.IntegerField(default=0)
+    energy_consumed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'operator'], name='fleet_summary_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} fleet at {self.operator}"
+
+
+class StationCell(models.Model):
+    """
+    Station totals of one operator in one web map tile cell at one zoom level.
+
+    Cells exist for every zoom up to tiles.CELL_MAX_ZOOM, so a tile's clusters
+    are read from a few dozen rows. Rows are kept current with deltas by the
+    stations.refresh_cells task, version grows with every change.
+    """
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='+', db_index=False)
+    zoom = models.PositiveSmallIntegerField()
+    key = models.BigIntegerField(help_text="x * 2**zoom + y")
+    x = models.IntegerField()
+    y = models.IntegerField()
+    station_count = models.IntegerField(default=0)
+    available_stations = models.IntegerField(default=0)
+    available_ports = models.IntegerField(default=0)
+    total_ports = models.IntegerField(default=0)
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    version = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['operator', 'zoom', 'key'], name='station_cell_operator_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['operator', 'zoom', 'x', 'y'], name='station_cell_operator_xy_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.operator_id}:{self.zoom}/{self.x}/{self.y} ({self.station_count})"
+
+
+class Amenity(models.Model):
+    """A normalized amenity tag, slug is what filters and facets use"""
+    slug = models.SlugField(max_length=60, unique=True)
+    name = models.CharField(max_length=100)
+    
+    class Meta:
+        ordering = ['slug']
+    
+    def __str__(self):
+        return self.name
+
+
+class StationAmenity(models.Model):
+    """
+    Inverted index from amenity tags to stations.
+
+    Rows mirror ChargingStation.amenities and are rewritten when a station is
+    saved. The unique (amenity, station) index lists a tag's stations, the
+    (station, amenity) index covers facet counts over a set of stations.
+    """
+    amenity = models.ForeignKey(Amenity, on_delete=models.CASCADE, related_name='station_links')
+    station = models.ForeignKey(ChargingStation, on_delete=models.CASCADE, related_name='amenity_links', db_index=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['amenity', 'station'], name='station_amenity_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['station', 'amenity'], name='station_amenity_station_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.station_id} - {self.amenity_id}"
+
+
+class StationChange(models.Model):
+    """
+    One entry of the station change log read by the sync API.
+
+    Every station write appends a row, deletes append a tombstone. The id is
+    the sync cursor, each operator's clients read only its rows. Compaction
+    drops rows superseded by a later row of the same station, leaving one row
+    per station ever created.
+    """
+    station_id = models.BigIntegerField()
+    operator_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['station_id', 'id'], name='station_change_station_idx'),
+            models.Index(fields=['operator_id', 'id'], name='station_change_operator_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.pk} station {self.station_id}{' deleted' if self.deleted else ''}"
+
+
+class StationEvent(models.Model):
+    """
+    Append-only history of station and session state changes.
+
+    Station saves record the counts they wrote, session starts and stops the
+    port they took or freed, so replaying a station's events in id order
+    rebuilds its available_ports. Rotation archives old events and leaves
+    one checkpoint per station in their place.
+    """
+    KINDS = [
+        ('state', 'Station saved'),
+        ('session_started', 'Session started'),
+        ('session_stopped', 'Session stopped'),
+        ('deleted', 'Station deleted'),
+        ('checkpoint', 'Replayed state of rotated events'),
+    ]
+    
+    station_id = models.BigIntegerField()
+    session_id = models.BigIntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KINDS)
+    ports_delta = models.SmallIntegerField(default=0)
+    available_ports = models.IntegerField(null=True, blank=True)
+    total_ports = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['station_id', 'id'], name='station_event_station_idx'),
+            models.Index(fields=['created_at'], name='station_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.pk} station {self.station_id} {self.kind}"
+
+
+class StationUsage(models.Model):
+    """
+    Completed sessions, energy and revenue of one station over a day or a calendar month.
+
+    Materialized from the sessions by the stations.refresh_usage task once
+    they are billed, `manage.py rebuild_usage` recomputes every row. region
+    is the station's analytics region when the row was written.
+    """
+    PERIODS = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+    
+    station = models.ForeignKey(ChargingStation, on_delete=models.CASCADE, related_name='usage')
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='+', db_index=False)
+    region = models.BigIntegerField()
+    period = models.CharField(max_length=5, choices=PERIODS)
+    start = models.DateField()
+    sessions = models.IntegerField(default=0)
+    energy_consumed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start', 'station'], name='station_usage_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['station', 'period', 'start'], name='station_usage_station_idx'),
+            models.Index(fields=['operator', 'period', 'start'], name='station_usage_operator_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.station_id} {self.period} {self.start}"
+
+
+class RegionUsage(models.Model):
+    """Totals of one operator's StationUsage rows in an analytics region and period, kept with them"""
+    operator = models.ForeignKey(Operator, on_delete=models.CASCADE, related_name='+', db_index=False)
+    region = models.BigIntegerField()
+    period = models.CharField(max_length=5, choices=StationUsage.PERIODS)
+    start = models.DateField()
+    sessions = models.IntegerField(default=0)
+    energy_consumed = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['operator', 'period', 'start', 'region'], name='region_usage_operator_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['operator', 'region', 'period', 'start'], name='region_usage_op_region_idx'),
+        ]
+    
+    def __str__(self):
+        return f"region {self.region} {self.period} {self.start}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A session start or stop sent with an Idempotency-Key header, kept so retries get the same answer.
+
+    The row is written in the transaction that reserves or releases the port,
+    so of two concurrent duplicates only one commits and the other replays
+    its response. Keys are forgotten after IDEMPOTENCY_KEY_SECONDS.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    action = models.CharField(max_length=20)
+    session = models.ForeignKey(ChargingSession, on_delete=models.CASCADE, related_name='+')
+    status_code = models.PositiveSmallIntegerField()
+    # Stored once the session signals have run, until then a replay serializes the session
+    response = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.key}"
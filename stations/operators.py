@@ -0,0 +1,91 @@
+"""
+Charging operators sharing one deployment.
+
+Every station belongs to an operator. OperatorMiddleware reads the request's
+operator from the X-Operator header, DEFAULT_OPERATOR without one, and the
+views only see its stations and the sessions, reviews, favorites, map cells,
+sync changes and analytics hanging off them. Cached data is keyed under the
+operator with operator_key.
+
+An operator listed in OPERATOR_DATABASES is served by processes of its own,
+started with DEFAULT_OPERATOR set to its slug, whose default database is the
+operator's. Its data then grows and scales apart from everyone else's, and
+the shared processes answer its requests with 421 so a misrouted client
+learns it at once.
+"""
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import BasePermission
+
+from .models import Operator
+
+OPERATOR_HEADER = 'X-Operator'
+
+
+def operator_key(operator_id, key):
+    """Cache key in the namespace of one operator"""
+    return f'operator:{operator_id}:{key}'
+
+
+class OperatorDirectory:
+    """Operators by slug, kept in the process for ttl seconds so requests resolve theirs without a query"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, slug):
+        entry = self._entries.get(slug)
+        if entry is None or entry[1] < time.monotonic():
+            operator = Operator.objects.filter(slug=slug).first()
+            if operator is None:
+                # Unknown slugs come from clients, remembering them would let clients fill the process
+                return None
+            entry = self._entries[slug] = (operator, time.monotonic() + self.ttl)
+        return entry[0]
+
+    def default(self):
+        """The DEFAULT_OPERATOR, created on first use"""
+        operator = self.get(settings.DEFAULT_OPERATOR)
+        if operator is None:
+            operator, _ = Operator.objects.get_or_create(slug=settings.DEFAULT_OPERATOR, defaults={'name': settings.DEFAULT_OPERATOR})
+            self._entries[operator.slug] = (operator, time.monotonic() + self.ttl)
+        return operator
+
+    def forget(self):
+        self._entries.clear()
+
+
+operator_directory = OperatorDirectory()
+
+
+class OperatorMiddleware:
+    """Sets request.operator, responses vary with the header since each operator sees other data"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slug = request.headers.get(OPERATOR_HEADER) or settings.DEFAULT_OPERATOR
+        if slug in settings.OPERATOR_DATABASES and slug != settings.DEFAULT_OPERATOR:
+            return JsonResponse({'error': f'Operator {slug} is served by its own deployment'}, status=421)
+        operator = operator_directory.default() if slug == settings.DEFAULT_OPERATOR else operator_directory.get(slug)
+        if operator is None:
+            return JsonResponse({'error': 'Unknown operator'}, status=404)
+        request.operator = operator
+        response = self.get_response(request)
+        patch_vary_headers(response, [OPERATOR_HEADER])
+        return response
+
+
+def is_operator_staff(user, operator):
+    """Staff of the operator, or platform staff who belong to no operator"""
+    return bool(user and user.is_staff and user.operator_id in (None, operator.pk))
+
+
+class IsOperatorStaff(BasePermission):
+    def has_permission(self, request, view):
+        return is_operator_staff(request.user, request.operator)
@@ -0,0 +1,71 @@
+"""
+Compact pin format for map clients.
+
+Instead of one object per station the response holds one array per field,
+so field names are sent once and only what a map pin needs is included.
+Rows come straight from values_list(), no serializer or model instances.
+"""
+import math
+
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from rest_framework.renderers import JSONRenderer
+
+from .pricing import pricing_engine, time_slice
+from .spatial import haversine_km, within_box
+
+PIN_FIELDS = ['id', 'operator_id', 'latitude', 'longitude', 'charging_type', 'available_ports', 'total_ports', 'price_per_kwh']
+PIN_COLUMNS = ['id', 'lat', 'lng', 'type', 'available_ports', 'price']
+# Enough for a city-wide map, filters or a smaller radius narrow larger sets
+MAX_PINS = 10000
+
+
+class PinRenderer(JSONRenderer):
+    """Selected with Accept: application/vnd.evspot.pins+json or ?format=pins"""
+    media_type = 'application/vnd.evspot.pins+json'
+    format = 'pins'
+
+
+def pin_columns(queryset, origin=None, radius=None):
+    """
+    Parallel arrays of pin fields for the stations in queryset.
+
+    At most MAX_PINS stations are read and priced, in the queryset's order.
+    With an origin the pins are limited to radius km, gain a distance column
+    and are the closest ones, sorted closest first like the nearby endpoint.
+    """
+    if origin is None:
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        # A unique last key, so the cap always keeps the same stations
+        rows = queryset.order_by(*ordering, '-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+    else:
+        lat, lng = float(origin[0]), float(origin[1])
+        # Closest first by a flat-earth approximation, which decides which rows to read, haversine the exact distance
+        north = Cast('latitude', FloatField()) - lat
+        east = (Cast('longitude', FloatField()) - lng) * math.cos(math.radians(lat))
+        rows = within_box(queryset, lat, lng, radius).annotate(offset=north * north + east * east).order_by('offset', 'pk')
+
+    slice_index = time_slice()
+    pins = []
+    for pk, operator_id, lat, lng, charging_type, available, total, base_price in rows.values_list(*PIN_FIELDS)[:MAX_PINS + 1]:
+        price = pricing_engine.price_value(pk, operator_id, charging_type, base_price, available, total, slice_index)
+        pin = [pk, float(lat), float(lng), charging_type, available, float(price)]
+        if origin is not None:
+            distance = haversine_km(origin[0], origin[1], lat, lng)
+            if distance > radius:
+                continue
+            pin.append(round(distance, 2))
+        pins.append(pin)
+
+    names = PIN_COLUMNS
+    if origin is not None:
+        names = PIN_COLUMNS + ['distance']
+        pins.sort(key=lambda pin: pin[-1])
+    # The row past the cap only tells whether more stations matched
+    truncated = len(pins) > MAX_PINS
+    pins = pins[:MAX_PINS]
+    return {
+        'count': len(pins),
+        'truncated': truncated,
+        'columns': {name: [pin[index] for pin in pins] for index, name in enumerate(names)},
+    }
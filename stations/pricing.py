@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+SLICE_MINUTES = 15
+SLICES_PER_DAY = 24 * 60 // SLICE_MINUTES
+SLICE_SECONDS = SLICE_MINUTES * 60
+# Slices whose prices stay cached, so pricing another time does not evict the current one
+PRICE_SLICES = 4
+CENT = Decimal('0.01')
+
+
+def time_slice(when=None):
+    """Index of the 15 minute slice of the week that when falls in, Monday 00:00 is 0"""
+    when = timezone.localtime(when)
+    return when.weekday() * SLICES_PER_DAY + (when.hour * 60 + when.minute) // SLICE_MINUTES
+
+
+def slice_start(when=None):
+    """Local time at which the slice containing when began"""
+    when = timezone.localtime(when)
+    return when.replace(minute=when.minute - when.minute % SLICE_MINUTES, second=0, microsecond=0)
+
+
+def _rule_slices(rule):
+    """Every slice of the week covered by a rule's weekday and time window"""
+    if rule.start_time is None or rule.end_time is None:
+        first, last = 0, SLICES_PER_DAY
+    else:
+        first = (rule.start_time.hour * 60 + rule.start_time.minute) // SLICE_MINUTES
+        last = (rule.end_time.hour * 60 + rule.end_time.minute) // SLICE_MINUTES
+    if first < last:
+        windows = [(0, range(first, last))]
+    else:
+        # The part past midnight falls on the next day, Sunday's on Monday
+        windows = [(0, range(first, SLICES_PER_DAY)), (1, range(0, last))]
+    return {
+        (int(day) + offset) % 7 * SLICES_PER_DAY + index
+        for day in rule.weekdays if day.isdigit() for offset, day_slices in windows for index in day_slices
+    }
+
+
+class SliceTable:
+    """Rule multipliers for one time slice, folded by scope so a price is a few dict lookups"""
+
+    def __init__(self):
+        # Flat multipliers keyed by (operator id, charging type), '' for every type, and by station id
+        self.by_type = {}
+        self.by_station = {}
+        # Occupancy surges as sorted (threshold, multiplier) lists under the same scopes
+        self.surge_by_type = {}
+        self.surge_by_station = {}
+
+    def add(self, rule):
+        multiplier = float(rule.multiplier)
+        threshold = float(rule.min_occupancy)
+        if rule.station_id is not None:
+            flat, surge, key = self.by_station, self.surge_by_station, rule.station_id
+        else:
+            flat, surge, key = self.by_type, self.surge_by_type, (rule.operator_id, rule.charging_type)
+        if threshold > 0:
+            surge.setdefault(key, []).append((threshold, multiplier))
+            surge[key].sort()
+        else:
+            flat[key] = flat.get(key, 1.0) * multiplier
+
+    def multiplier(self, station_id, operator_id, charging_type, occupancy):
+        every, typed = (operator_id, ''), (operator_id, charging_type)
+        result = self.by_type.get(every, 1.0) * self.by_type.get(typed, 1.0) * self.by_station.get(station_id, 1.0)
+        for surges in (self.surge_by_type.get(every), self.surge_by_type.get(typed), self.surge_by_station.get(station_id)):
+            for threshold, multiplier in surges or ():
+                if threshold > occupancy:
+                    break
+                result *= multiplier
+        return result
+
+
+class PricingEngine:
+    """
+    Compiles active PricingRule rows into per-slice tables and caches the
+    effective price of each station per slice. The cache key includes
+    available_ports and the base price, so it never goes stale within a
+    slice. Once per wall-clock slice a single aggregate query checks
+    whether another process edited the rules, and only then is anything
+    recompiled.
+    """
+
+    def __init__(self, rules=None):
+        self._lock = threading.Lock()
+        self._rules = rules
+        self._generation = 0
+        self._reset()
+        self._check_at = 0
+
+    def _reset(self):
+        self._slices = None
+        self._version = None
+        self._stored = None
+        self._tables = {}
+        # Price caches of the most recently used slices, oldest first
+        self._prices = OrderedDict()
+        self._generation += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def _stored_version(self):
+        """(count, newest id, last edit) of the PricingRule table, None for rules given up front"""
+        from .models import PricingRule
+
+        if self._rules is not None:
+            return None
+        return tuple(PricingRule.objects.aggregate(Count('pk'), Max('pk'), Max('updated_at')).values())
+
+    def _refresh(self):
+        """Drop the compiled rules if they were edited since, at most once per slice; called under the lock"""
+        now = time.time()
+        if now < self._check_at:
+            return
+        self._check_at = (now // SLICE_SECONDS + 1) * SLICE_SECONDS
+        if self._slices is not None and self._stored != self._stored_version():
+            self._reset()
+
+    def _compile(self):
+        from .models import PricingRule
+
+        # Read before the rules, so an edit in between is caught by the next check
+        self._stored = self._stored_version()
+        rules = self._rules if self._rules is not None else list(PricingRule.objects.filter(is_active=True))
+        self._slices = [(rule, _rule_slices(rule)) for rule in rules]
+        edits = [(rule.pk, getattr(rule, 'updated_at', None)) for rule in rules]
+        self._version = (repr(sorted(edits, key=repr)), max((edited for _, edited in edits if edited), default=None))
+        self._tables = {}
+
+    def version(self):
+        """(fingerprint, last edit) of the compiled rules, identical in every process that loaded the same rules"""
+        with self._lock:
+            self._refresh()
+            if self._slices is None:
+                self._compile()
+            return self._version
+
+    def table(self, slice_index):
+        table = self._tables.get(slice_index)
+        if table is None:
+            with self._lock:
+                if self._slices is None:
+                    self._compile()
+                table = self._tables.get(slice_index)
+                if table is None:
+                    table = SliceTable()
+                    for rule, slices in self._slices:
+                        if slice_index in slices:
+                            table.add(rule)
+                    self._tables[slice_index] = table
+        return table
+
+    def price_value(self, station_id, operator_id, charging_type, base_price, available_ports, total_ports, slice_index):
+        if time.time() >= self._check_at:
+            with self._lock:
+                self._refresh()
+        key = (station_id, available_ports, base_price)
+        prices = self._prices.get(slice_index)
+        price = prices.get(key) if prices is not None else None
+        if price is None:
+            generation = self._generation
+            occupancy = 1 - available_ports / total_ports if total_ports else 1.0
+            multiplier = self.table(slice_index).multiplier(station_id, operator_id, charging_type, occupancy)
+            price = (base_price * Decimal(multiplier)).quantize(CENT, rounding=ROUND_HALF_UP)
+            with self._lock:
+                # A price worked out from rules dropped meanwhile is returned but not kept
+                if generation == self._generation:
+                    prices = self._prices.get(slice_index)
+                    if prices is None:
+                        prices = self._prices[slice_index] = {}
+                        if len(self._prices) > PRICE_SLICES:
+                            self._prices.popitem(last=False)
+                    prices[key] = price
+        return price
+
+    def price(self, station, when=None):
+        """Effective price_per_kwh of a station at when (default now)"""
+        return self.price_value(
+            station.pk, station.operator_id, station.charging_type, station.price_per_kwh,
+            station.available_ports, station.total_ports, time_slice(when)
+        )
+
+
+pricing_engine = PricingEngine()
@@ -0,0 +1,63 @@
+"""
+Review writes, moderation and paging.
+
+A user has at most one review per station, writing again replaces it in
+place. Every new or edited review starts out pending and is screened in
+batches by the stations.moderate_reviews task: clean text is published
+straight away, text matching the REVIEW_MODERATION rules is held for staff,
+who publish or reject held reviews in bulk.
+"""
+import re
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.pagination import CursorPagination
+
+from tasks.queue import enqueue_many
+from .models import Review
+
+DEFAULT_MODERATION = {'BLOCKED_TERMS': [], 'MAX_LINKS': 1}
+LINK = re.compile(r'https?://|www\.', re.IGNORECASE)
+
+
+class ReviewCursorPagination(CursorPagination):
+    """Newest first, each page continues after the last (created_at, id) seen instead of counting an offset"""
+    ordering = ('-created_at', '-id')
+    page_size = 20
+
+
+def upsert_review(user, station, rating, comment=''):
+    """Create the user's review of station or replace it in place, returns (review, created)"""
+    # A concurrent first review loses the insert race and updates the winner's row instead of failing
+    return Review.objects.update_or_create(
+        user=user, station=station, defaults={'rating': rating, 'comment': comment, 'status': 'pending'}
+    )
+
+
+def _blocked_pattern(terms):
+    if not terms:
+        return None
+    return re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+
+
+def screen(comments):
+    """Status each comment is given by the automatic check, 'published' or 'held'"""
+    rules = {**DEFAULT_MODERATION, **getattr(settings, 'REVIEW_MODERATION', {})}
+    blocked = _blocked_pattern(rules['BLOCKED_TERMS'])
+    return [
+        'held' if (blocked and blocked.search(comment)) or len(LINK.findall(comment)) > rules['MAX_LINKS'] else 'published'
+        for comment in comments
+    ]
+
+
+def queue_rating_refresh(station_ids):
+    enqueue_many('stations.refresh_ratings', [(f'rating:{station}', {'station': station}) for station in set(station_ids)])
+
+
+def decide(reviews, status):
+    """Give every review in the queryset the same status with one UPDATE, returns how many changed"""
+    station_ids = list(reviews.exclude(status=status).values_list('station', flat=True).distinct())
+    changed = reviews.exclude(status=status).update(status=status, updated_at=timezone.now())
+    # Updates skip the save signals, published reviews move the station's rating
+    queue_rating_refresh(station_ids)
+    return changed
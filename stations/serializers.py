@@ -1,56 +1,100 @@
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.utils import timezone
+from evspot.images import derivative_urls
+from .favorites import request_favorite_ids
+from .load_management import load_manager
 from .models import ChargingStation, ChargingSession, Review, FavoriteStation
-from django.contrib.auth.models import get_user_model
+from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class OperatorStationsMixin:
+    """Only stations of the request's operator can be referenced"""
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None and 'station' in fields and not fields['station'].read_only:
+            fields['station'].queryset = ChargingStation.objects.filter(operator=request.operator)
+        return fields
+
+
 class ChargingStationSerializer(serializers.ModelSerializer):
-    average_rating = serializers.SerializerMethodField()
-    total_reviews = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
+    effective_price_per_kwh = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
+    image_thumb = serializers.SerializerMethodField()
     
     class Meta:
         model = ChargingStation
-        fields = '__all__'
+        exclude = ['image_derivatives', 'grid_cell']
+        # Stations are created for the request's operator and stay with it
+        read_only_fields = ['operator', 'average_rating', 'total_reviews']
     
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
-    
-    def get_total_reviews(self, obj):
-        return obj.reviews.count()
+    def get_image_thumb(self, obj):
+        # Small WebP/JPEG renditions for lists and maps, null until the background task has built them
+        return derivative_urls(obj.image_derivatives)
     
     def get_is_favorite(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return FavoriteStation.objects.filter(user=request.user, station=obj).exists()
-        return False
+        # A set lookup, the user's favorite ids are loaded once for the whole response
+        return obj.pk in request_favorite_ids(self.context.get('request'))
 
 
-class ChargingSessionSerializer(serializers.ModelSerializer):
+class ChargingSessionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        sessions = list(data.all() if hasattr(data, 'all') else data)
+        # Allocations of the whole page from one load of their stations, not two queries per station
+        self.context['station_loads'] = load_manager.loads({session.station_id for session in sessions if session.status == 'active'})
+        return super().to_representation(sessions)
+
+
+class ChargingSessionSerializer(OperatorStationsMixin, serializers.ModelSerializer):
     station_name = serializers.CharField(source='station.name', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
+    allocated_power_kw = serializers.SerializerMethodField()
     
     class Meta:
         model = ChargingSession
         fields = '__all__'
-        read_only_fields = ['user', 'start_time', 'energy_consumed', 'total_cost']
+        read_only_fields = ['user', 'start_time', 'energy_consumed', 'total_cost', 'expected_end_time', 'priority', 'price_per_kwh']
+        list_serializer_class = ChargingSessionListSerializer
+    
+    def get_allocated_power_kw(self, obj):
+        allocation = load_manager.allocation(obj, self.context.get('station_loads'))
+        return round(allocation, 2) if allocation is not None else None
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(OperatorStationsMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     station_name = serializers.CharField(source='station.name', read_only=True)
     
     class Meta:
         model = Review
         fields = '__all__'
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'status']
+
+
+class StationReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Review
+        fields = ['rating', 'comment']
+
+
+class ModerationSerializer(serializers.Serializer):
+    publish = serializers.ListField(child=serializers.IntegerField(), default=list, max_length=1000)
+    reject = serializers.ListField(child=serializers.IntegerField(), default=list, max_length=1000)
+    
+    def validate(self, data):
+        if not data['publish'] and not data['reject']:
+            raise serializers.ValidationError('Nothing to publish or reject')
+        if set(data['publish']) & set(data['reject']):
+            raise serializers.ValidationError('A review cannot be both published and rejected')
+        return data
 
 
-class FavoriteStationSerializer(serializers.ModelSerializer):
+class FavoriteStationSerializer(OperatorStationsMixin, serializers.ModelSerializer):
     station_details = ChargingStationSerializer(source='station', read_only=True)
     
     class Meta:
@@ -62,4 +106,44 @@ class FavoriteStationSerializer(serializers.ModelSerializer):
 class NearbyStationsSerializer(serializers.Serializer):
     latitude = serializers.DecimalField(max_digits=9, decimal_places=6)
     longitude = serializers.DecimalField(max_digits=9, decimal_places=6)
-    radius = serializers.IntegerField(default=10, min_value=1, max_value=100) 
\ No newline at end of file
+    radius = serializers.IntegerField(default=10, min_value=1, max_value=100)
+
+
+class AssignmentRequestSerializer(serializers.Serializer):
+    latitude = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-90, max_value=90)
+    longitude = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-180, max_value=180)
+    energy_kwh = serializers.FloatField(default=30, min_value=1, max_value=200)
+    max_power_kw = serializers.IntegerField(required=False, min_value=1)
+    charging_type = serializers.ChoiceField(choices=ChargingStation.CHARGING_TYPES, required=False)
+    radius = serializers.IntegerField(default=10, min_value=1, max_value=100)
+    neighbours = serializers.IntegerField(default=5, min_value=0, max_value=20)
+
+
+class FleetStartItemSerializer(serializers.Serializer):
+    vehicle = serializers.IntegerField()
+    station = serializers.IntegerField()
+
+
+class FleetStartSerializer(serializers.Serializer):
+    sessions = FleetStartItemSerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class FleetStopSerializer(serializers.Serializer):
+    vehicles = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    station = serializers.IntegerField(required=False)
+    region = serializers.IntegerField(required=False)
+    ordering = serializers.ChoiceField(choices=['sessions', 'energy_consumed', 'revenue'], default='revenue')
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=1000)
+    
+    def validate(self, data):
+        # The last 30 days up to today unless given
+        data['end'] = data.get('end') or timezone.localdate()
+        data['start'] = data.get('start') or data['end'] - timedelta(days=29)
+        if data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
@@ -0,0 +1,128 @@
+import time
+
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+from evspot.images import needs_derivatives
+from tasks.queue import enqueue
+from .models import ChargingStation, FavoriteStation, Operator, PricingRule, Review
+from .amenities import sync_station_amenities
+from .assignment import scheduler
+from .events import event_log
+from .favorites import forget_favorites
+from .load_management import load_manager
+from .operators import operator_directory
+from .pricing import pricing_engine
+from .spatial import update_station_index
+from .sync import record_station_changes
+from .tiles import grid_cell, queue_cell_refresh
+
+# Sent with session= once a session and its port reservation are committed
+session_started = Signal()
+
+# Sent with sessions= once a batch of sessions and their port reservations are committed
+sessions_started = Signal()
+
+# Sent with session= once a finished session's port has been released
+session_finished = Signal()
+
+# Sent with sessions= once the ports of a batch of finished sessions have been released
+sessions_finished = Signal()
+
+
+@receiver(pre_save, sender=ChargingStation)
+def place_station(sender, instance, **kwargs):
+    # A moved station leaves its old map cell, both need recounting
+    instance._previous_grid_cell = instance.grid_cell
+    instance.grid_cell = grid_cell(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=ChargingStation)
+def station_saved(sender, instance, **kwargs):
+    update_station_index(instance)
+    sync_station_amenities(instance)
+    record_station_changes([instance.pk], operator_id=instance.operator_id)
+    event_log.station_saved(instance)
+    queue_cell_refresh(instance.operator_id, cells={getattr(instance, '_previous_grid_cell', None), instance.grid_cell})
+    # Ports may have changed, reload them lazily
+    scheduler.forget(instance.pk)
+    if needs_derivatives(instance.image, instance.image_derivatives):
+        enqueue('stations.build_thumbnails', {'station': instance.pk}, key=f'thumbnails:station:{instance.pk}')
+
+
+@receiver(post_delete, sender=ChargingStation)
+def station_deleted(sender, instance, **kwargs):
+    update_station_index(instance, deleted=True)
+    load_manager.forget(instance.pk)
+    record_station_changes([instance.pk], deleted=True, operator_id=instance.operator_id)
+    event_log.station_deleted(instance)
+    queue_cell_refresh(instance.operator_id, cells=[instance.grid_cell])
+    scheduler.forget(instance.pk)
+
+
+@receiver(post_save, sender=Operator)
+@receiver(post_delete, sender=Operator)
+def operators_changed(sender, **kwargs):
+    operator_directory.forget()
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def pricing_rules_changed(sender, **kwargs):
+    pricing_engine.invalidate()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    # Reviews of a busy station coalesce into one queued rollup refresh
+    enqueue('stations.refresh_ratings', {'station': instance.station_id}, key=f'rating:{instance.station_id}')
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    # New and edited reviews are listed once the moderation task has screened them
+    if instance.status == 'pending':
+        enqueue('stations.moderate_reviews', {'review': instance.pk}, key=f'moderate:{instance.pk}')
+
+
+@receiver(post_save, sender=FavoriteStation)
+@receiver(post_delete, sender=FavoriteStation)
+def favorites_changed(sender, instance, **kwargs):
+    # Loaded with the favorite by the views, and still there while a deleted station takes its favorites along
+    forget_favorites(instance.user_id, instance.station.operator_id)
+
+
+@receiver(session_started)
+def track_started_session(sender, session, **kwargs):
+    track_started_sessions(sender, [session])
+
+
+@receiver(sessions_started)
+def track_started_sessions(sender, sessions, **kwargs):
+    load_manager.started(sessions)
+    for session in sessions:
+        if session.expected_end_time is not None:
+            scheduler.reserve(session.station_id, session.expected_end_time.timestamp())
+    # The reservations took ports, map clusters and synced stations show availability
+    stations = {session.station_id for session in sessions}
+    queue_cell_refresh(stations=stations)
+    record_station_changes(stations)
+
+
+@receiver(session_finished)
+def track_finished_session(sender, session, **kwargs):
+    track_finished_sessions(sender, [session])
+
+
+@receiver(sessions_finished)
+def track_finished_sessions(sender, sessions, **kwargs):
+    load_manager.finished(sessions)
+    for session in sessions:
+        if session.expected_end_time is not None:
+            scheduler.release(session.station_id, session.expected_end_time.timestamp(), time.time())
+        else:
+            scheduler.forget(session.station_id)
+    # One recount and one change row per station however many of its sessions finished
+    stations = {session.station_id for session in sessions}
+    queue_cell_refresh(stations=stations)
+    record_station_changes(stations)
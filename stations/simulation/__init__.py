@@ -0,0 +1,9 @@
+"""
+Discrete-event simulation of charging demand against the station network.
+
+Runs the model-level domain logic in memory, without the database or HTTP,
+see the `simulate` management command.
+"""
+from .demand import DemandModel, synthesize_network
+from .engine import Simulation
+from .results import read_columns, write_columns
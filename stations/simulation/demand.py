@@ -0,0 +1,92 @@
+import bisect
+import itertools
+import math
+import random
+from decimal import Decimal
+
+from ..models import ChargingStation
+from ..spatial import StationGridIndex, StationPoint
+
+# Relative arrival rate for each hour of the day, morning and evening commute peaks
+HOURLY_PROFILE = [
+    0.2, 0.1, 0.1, 0.1, 0.2, 0.4, 0.9, 1.5, 1.8, 1.4, 1.1, 1.1,
+    1.2, 1.2, 1.1, 1.2, 1.5, 1.9, 2.0, 1.6, 1.1, 0.8, 0.5, 0.3,
+]
+
+
+def synthesize_network(count, clusters=50, seed=0, center=(39.5, -98.35), spread=(8.0, 20.0), cluster_sigma=0.15):
+    """Build unsaved stations grouped around random urban hotspots, returns (stations, hotspots)"""
+    rng = random.Random(seed)
+    hotspots = [
+        (center[0] + rng.uniform(-spread[0], spread[0]), center[1] + rng.uniform(-spread[1], spread[1]))
+        for _ in range(clusters)
+    ]
+    types = [('slow', 11, Decimal('0.25')), ('fast', 50, Decimal('0.38')), ('super', 150, Decimal('0.50'))]
+    stations = []
+    for station_id in range(1, count + 1):
+        lat, lng = rng.choice(hotspots)
+        charging_type, power, price = rng.choice(types)
+        ports = rng.randint(1, 8)
+        stations.append(ChargingStation(
+            id=station_id,
+            name=f'Simulated {station_id}',
+            latitude=round(rng.gauss(lat, cluster_sigma), 6),
+            longitude=round(rng.gauss(lng, cluster_sigma), 6),
+            charging_type=charging_type,
+            power_output=power,
+            price_per_kwh=price,
+            total_ports=ports,
+            available_ports=ports,
+            grid_capacity_kw=int(power * ports * rng.uniform(0.5, 1.0)),
+        ))
+    return stations, hotspots
+
+
+class DemandModel:
+    """Non-homogeneous Poisson arrivals whose destinations follow clustered demand hotspots"""
+
+    def __init__(self, stations, arrivals_per_station_hour=0.3, hotspots=None, hourly_profile=HOURLY_PROFILE,
+                 demand_samples=200000, hotspot_sigma=0.2, seed=0):
+        self.rng = random.Random(seed)
+        mean = sum(hourly_profile) / len(hourly_profile)
+        base_rate = arrivals_per_station_hour * len(stations) / 3600
+        self.rates = [base_rate * weight / mean for weight in hourly_profile]
+        self._cumulative = list(itertools.accumulate(self._station_weights(
+            stations, hotspots, demand_samples, hotspot_sigma
+        )))
+
+    def _station_weights(self, stations, hotspots, samples, sigma):
+        """Drop demand points around hotspots and credit each to its nearest station"""
+        index = StationGridIndex(cell_size=0.05)
+        for position, station in enumerate(stations):
+            index.add(StationPoint(position, station.latitude, station.longitude, 0, 0, ''))
+        if not hotspots:
+            hotspots = [(float(s.latitude), float(s.longitude)) for s in self.rng.sample(stations, min(50, len(stations)))]
+
+        # Every station sees a trickle of demand even away from the hotspots
+        weights = [1.0] * len(stations)
+        for _ in range(samples):
+            lat, lng = self.rng.choice(hotspots)
+            nearest = index.nearest(self.rng.gauss(lat, sigma), self.rng.gauss(lng, sigma), 1, 50)
+            if nearest:
+                weights[nearest[0][1].id] += 1
+        return weights
+
+    def next_arrival(self, now):
+        """Time of the next arrival after now, exact for a rate that is constant within each hour"""
+        remaining = self.rng.expovariate(1.0)
+        while True:
+            hour = int(now // 3600)
+            rate = self.rates[hour % 24]
+            hour_end = (hour + 1) * 3600
+            if rate * (hour_end - now) >= remaining:
+                return now + remaining / rate
+            remaining -= rate * (hour_end - now)
+            now = hour_end
+
+    def pick_station(self):
+        return bisect.bisect(self._cumulative, self.rng.random() * self._cumulative[-1])
+
+    def energy_request(self):
+        """kWh a driver wants, most top up a partly charged battery"""
+        return min(90.0, max(5.0, self.rng.lognormvariate(math.log(25), 0.5)))
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from ..assignment import charge_seconds
+from ..load_management import StationLoad
+from ..models import ChargingSession
+
+ARRIVAL = 0
+DEPARTURE = 1
+
+COUNT_COLUMNS = ['arrivals', 'served', 'rejected', 'abandoned', 'max_queue']
+TOTAL_COLUMNS = ['wait_seconds', 'busy_port_seconds', 'energy_kwh', 'revenue']
+
+
+class Simulation:
+    """
+    Heap-driven discrete-event simulation of drivers arriving at stations.
+
+    Drivers who find every port busy join the station queue unless it is
+    already max_queue long, and give up after patience_minutes. Charging
+    power is fixed at start from the station's load policy headroom.
+    """
+
+    def __init__(self, stations, demand, days=30, max_queue=3, patience_minutes=20,
+                 start=datetime(2024, 1, 1, tzinfo=dt_timezone.utc)):
+        self.stations = stations
+        self.demand = demand
+        self.horizon = days * 86400
+        self.max_queue = max_queue
+        self.patience = patience_minutes * 60
+        self.start = start
+        self.loads = [
+            StationLoad(s.grid_capacity_kw or s.power_output * s.total_ports, s.power_output, s.load_policy)
+            for s in stations
+        ]
+        self.queues = [deque() for _ in stations]
+        self.stats = {name: array('q', [0]) * len(stations) for name in COUNT_COLUMNS}
+        self.stats.update({name: array('d', [0.0]) * len(stations) for name in TOTAL_COLUMNS})
+        self.events = []
+        self._sequence = itertools.count()
+        self.processed = 0
+        self.wall_seconds = 0.0
+
+    def _push(self, when, kind, payload):
+        heapq.heappush(self.events, (when, next(self._sequence), kind, payload))
+
+    def _start_session(self, index, now, energy_kwh):
+        station = self.stations[index]
+        station.occupy_port()
+        load = self.loads[index]
+        session = ChargingSession(station=station)
+        power = max(load.headroom(session.priority), 0.1)
+        load.add(id(session), now, session.priority)
+        duration = charge_seconds(energy_kwh, power)
+        self._push(now + duration, DEPARTURE, (index, session, now, energy_kwh))
+        self.stats['served'][index] += 1
+
+    def _arrive(self, now):
+        index = self.demand.pick_station()
+        energy_kwh = self.demand.energy_request()
+        self.stats['arrivals'][index] += 1
+        if self.stations[index].is_available:
+            self._start_session(index, now, energy_kwh)
+            return
+
+        queue = self.queues[index]
+        # Everyone queues with the same patience, so expired drivers are always at the front
+        while queue and queue[0][0] + self.patience < now:
+            queue.popleft()
+            self.stats['abandoned'][index] += 1
+        if len(queue) >= self.max_queue:
+            self.stats['rejected'][index] += 1
+            return
+        queue.append((now, energy_kwh))
+        if len(queue) > self.stats['max_queue'][index]:
+            self.stats['max_queue'][index] = len(queue)
+
+    def _depart(self, now, index, session, started, energy_kwh):
+        session.finish(self.start + timedelta(seconds=now), energy_kwh)
+        self.stations[index].free_port()
+        self.loads[index].remove(id(session))
+        self.stats['busy_port_seconds'][index] += now - started
+        self.stats['energy_kwh'][index] += energy_kwh
+        self.stats['revenue'][index] += float(session.total_cost)
+
+        queue = self.queues[index]
+        while queue:
+            queued_at, queued_energy = queue.popleft()
+            if queued_at + self.patience < now:
+                self.stats['abandoned'][index] += 1
+                continue
+            self.stats['wait_seconds'][index] += now - queued_at
+            self._start_session(index, now, queued_energy)
+            break
+
+    def run(self):
+        started = time.perf_counter()
+        self._push(self.demand.next_arrival(0.0), ARRIVAL, None)
+        while self.events and self.events[0][0] <= self.horizon:
+            now, _, kind, payload = heapq.heappop(self.events)
+            self.processed += 1
+            if kind == ARRIVAL:
+                self._arrive(now)
+                self._push(self.demand.next_arrival(now), ARRIVAL, None)
+            else:
+                self._depart(now, *payload)
+
+        # Sessions still charging at the horizon count towards utilization up to it
+        for _, _, kind, payload in self.events:
+            if kind == DEPARTURE:
+                self.stats['busy_port_seconds'][payload[0]] += self.horizon - payload[2]
+        self.wall_seconds = time.perf_counter() - started
+        return self
+
+    def columns(self):
+        """Per-station results as typed arrays, ready for results.write_columns"""
+        columns = {
+            'station_id': array('q', (s.pk for s in self.stations)),
+            'total_ports': array('q', (s.total_ports for s in self.stations)),
+        }
+        columns.update(self.stats)
+        columns['utilization'] = array('d', (
+            busy / (s.total_ports * self.horizon) if s.total_ports else 0.0
+            for busy, s in zip(self.stats['busy_port_seconds'], self.stations)
+        ))
+        return columns
+
+    def summary(self):
+        arrivals = sum(self.stats['arrivals'])
+        served = sum(self.stats['served'])
+        ports = sum(s.total_ports for s in self.stations)
+        return {
+            'stations': len(self.stations),
+            'arrivals': arrivals,
+            'served': served,
+            'rejection_rate': sum(self.stats['rejected']) / arrivals if arrivals else 0.0,
+            'abandonment_rate': sum(self.stats['abandoned']) / arrivals if arrivals else 0.0,
+            'mean_wait_minutes': sum(self.stats['wait_seconds']) / served / 60 if served else 0.0,
+            'mean_utilization': sum(self.stats['busy_port_seconds']) / (ports * self.horizon) if ports else 0.0,
+            'energy_kwh': sum(self.stats['energy_kwh']),
+            'revenue': sum(self.stats['revenue']),
+            'events': self.processed,
+            'wall_seconds': self.wall_seconds,
+        }
@@ -0,0 +1,28 @@
+import json
+import zipfile
+from array import array
+
+
+def write_columns(path, columns, metadata=None):
+    """Store equal-length typed arrays as one raw member per column inside a deflated zip"""
+    schema = {
+        'columns': [{'name': name, 'type': values.typecode, 'itemsize': values.itemsize} for name, values in columns.items()],
+        'rows': len(next(iter(columns.values()))) if columns else 0,
+        'metadata': metadata or {},
+    }
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('schema.json', json.dumps(schema, indent=2))
+        for name, values in columns.items():
+            archive.writestr(f'{name}.bin', values.tobytes())
+
+
+def read_columns(path):
+    """Load a file written by write_columns, returns (columns, metadata)"""
+    with zipfile.ZipFile(path) as archive:
+        schema = json.loads(archive.read('schema.json'))
+        columns = {}
+        for column in schema['columns']:
+            values = array(column['type'])
+            values.frombytes(archive.read(f"{column['name']}.bin"))
+            columns[column['name']] = values
+    return columns, schema['metadata']
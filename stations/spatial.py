@@ -0,0 +1,218 @@
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+StationPoint = namedtuple('StationPoint', ['id', 'latitude', 'longitude', 'power_output', 'total_ports', 'charging_type'])
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Calculate distance between two points using Haversine formula"""
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    dlat = lat2 - lat1
+    dlng = math.radians(lng2) - math.radians(lng1)
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def degree_span(lat, radius_km):
+    """Degrees of latitude and longitude that radius_km covers around lat"""
+    return radius_km / KM_PER_DEGREE, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+
+def within_box(queryset, lat, lng, radius_km):
+    """Narrow a station queryset to the bounding box of a radius so the database skips distant rows"""
+    lat, lng = float(lat), float(lng)
+    dlat, dlng = degree_span(lat, radius_km)
+    queryset = queryset.filter(latitude__range=(lat - dlat, lat + dlat))
+    if -180 <= lng - dlng and lng + dlng <= 180:
+        # A box across the antimeridian keeps every longitude
+        queryset = queryset.filter(longitude__range=(lng - dlng, lng + dlng))
+    return queryset
+
+
+class StationGridIndex:
+    """In-memory grid of station coordinates for radius and nearest-neighbour lookups"""
+
+    def __init__(self, cell_size=0.1):
+        # Cell size is in degrees (0.1 deg is roughly 11 km of latitude)
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, station_id):
+        return station_id in self._points
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def get(self, station_id):
+        return self._points.get(station_id)
+
+    def add(self, point):
+        self.remove(point.id)
+        point = point._replace(latitude=float(point.latitude), longitude=float(point.longitude))
+        self._points[point.id] = point
+        self._cells[self._cell(point.latitude, point.longitude)].add(point.id)
+
+    def remove(self, station_id):
+        point = self._points.pop(station_id, None)
+        if point is not None:
+            cell = self._cell(point.latitude, point.longitude)
+            self._cells[cell].discard(station_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def within(self, lat, lng, radius_km):
+        """Return (distance, point) pairs within radius_km of the origin, closest first"""
+        lat, lng = float(lat), float(lng)
+        dlat, dlng = degree_span(lat, radius_km)
+        min_row, min_col = self._cell(lat - dlat, lng - dlng)
+        max_row, max_col = self._cell(lat + dlat, lng + dlng)
+
+        results = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for station_id in self._cells.get((row, col), ()):
+                    point = self._points[station_id]
+                    distance = haversine_km(lat, lng, point.latitude, point.longitude)
+                    if distance <= radius_km:
+                        results.append((distance, point))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, lat, lng, k, radius_km):
+        """Return the k closest (distance, point) pairs within radius_km, searching outward ring by ring"""
+        lat, lng = float(lat), float(lng)
+        center_row, center_col = self._cell(lat, lng)
+        # Narrowest extent of a cell, anything beyond ring r is at least r of these away
+        cell_km = self.cell_size * KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = int(radius_km / cell_km) + 1
+
+        found = []
+        for ring in range(max_ring + 1):
+            for row in range(center_row - ring, center_row + ring + 1):
+                edge = abs(row - center_row) == ring
+                cols = range(center_col - ring, center_col + ring + 1) if edge else (center_col - ring, center_col + ring)
+                for col in cols:
+                    for station_id in self._cells.get((row, col), ()):
+                        point = self._points[station_id]
+                        distance = haversine_km(lat, lng, point.latitude, point.longitude)
+                        if distance <= radius_km:
+                            found.append((distance, point))
+            found.sort(key=lambda item: item[0])
+            if len(found) >= k and found[k - 1][0] <= ring * cell_km:
+                break
+        return found[:k]
+
+    @classmethod
+    def from_queryset(cls, queryset, cell_size=0.1):
+        index = cls(cell_size=cell_size)
+        for row in queryset.values_list(*StationPoint._fields).iterator():
+            index.add(StationPoint(*row))
+        return index
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def _build_index(operator_id):
+    from .models import ChargingStation
+    from .sync import settled_cursor
+
+    # Taken before the stations are read, so the first catch-up covers writes made while they were
+    cursor = settled_cursor(operator_id)
+    index = StationGridIndex.from_queryset(ChargingStation.objects.filter(operator=operator_id, status='active'))
+    index.cursor, index.checked_at = cursor, time.monotonic()
+    return index
+
+
+def _catch_up(index, operator_id):
+    """Apply the operator's station change log since the index's cursor, picking up writes of other processes"""
+    from .sync import SYNC_FIELDS, changes_since
+
+    fields = [SYNC_FIELDS.index(field) for field in StationPoint._fields]
+    status = SYNC_FIELDS.index('status')
+    while True:
+        page = changes_since(operator_id, index.cursor)
+        for row in page['stations']:
+            if row[status] == 'active':
+                index.add(StationPoint(*(row[position] for position in fields)))
+            else:
+                index.remove(row[0])
+        for station_id in page['deleted']:
+            index.remove(station_id)
+        done = not page['more'] or page['cursor'] == index.cursor
+        index.cursor = page['cursor']
+        if done:
+            break
+    index.checked_at = time.monotonic()
+
+
+def get_station_index(operator_id, refresh=False):
+    """
+    Return the per-process index of an operator's active stations, building it on first use.
+
+    Stations saved in this process are applied by the post_save signal, the
+    ones saved elsewhere from the change log at most STATION_INDEX_REFRESH_SECONDS
+    later, or at once with refresh.
+    """
+    from django.conf import settings
+
+    index = _indexes.get(operator_id)
+    max_age = getattr(settings, 'STATION_INDEX_REFRESH_SECONDS', 1)
+    if index is not None and not refresh and time.monotonic() - index.checked_at < max_age:
+        return index
+    with _index_lock:
+        index = _indexes.get(operator_id)
+        if index is None:
+            index = _indexes[operator_id] = _build_index(operator_id)
+        elif refresh or time.monotonic() - index.checked_at >= max_age:
+            _catch_up(index, operator_id)
+    return index
+
+
+def find_station_point(operator_id, station_id):
+    """The indexed point of an active station, catching up with the database when this process has not seen it"""
+    point = get_station_index(operator_id).get(station_id)
+    if point is None:
+        point = get_station_index(operator_id, refresh=True).get(station_id)
+    if point is None:
+        from .models import ChargingStation
+
+        # Bulk imports bypass the change log until the next compaction
+        row = ChargingStation.objects.filter(pk=station_id, operator=operator_id, status='active').values_list(
+            *StationPoint._fields
+        ).first()
+        if row is not None:
+            point = StationPoint(*row)
+            with _index_lock:
+                _indexes[operator_id].add(point)
+            point = _indexes[operator_id].get(station_id)
+    return point
+
+
+def update_station_index(station, deleted=False):
+    """Keep the index in step with a saved or deleted station"""
+    index = _indexes.get(station.operator_id)
+    if index is None:
+        return
+    with _index_lock:
+        if deleted or station.status != 'active':
+            index.remove(station.pk)
+        else:
+            index.add(StationPoint(*(getattr(station, field) for field in StationPoint._fields)))
+
+
+def reset_station_index():
+    with _index_lock:
+        _indexes.clear()
@@ -0,0 +1,196 @@
+"""
+Incremental station sync for offline-capable clients.
+
+Clients start from a snapshot of every station, then ask for the stations
+changed since the cursor they hold. Rows are arrays in SYNC_FIELDS order so
+field names are sent once per page. The cursor is the id of the last
+StationChange applied; it only moves past changes older than
+SYNC_SETTLE_SECONDS, so a write that took an id but had not committed yet
+cannot be skipped. Applying a station twice is harmless, skipping one is not.
+
+A cursor past the end of the log, left over from before the database was
+restored from a backup, cannot be answered with changes. The client is sent
+a snapshot instead, and pages with "full" set replace its whole copy.
+
+Snapshots are gzipped files named after their cursor. They never change
+once written, so the web server or a CDN can serve them with far-future
+caching.
+
+Each operator syncs its own stations: change rows carry the station's
+operator and every operator has its own snapshots under sync/<slug>/.
+"""
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import BigIntegerField, Exists, F, Max, OuterRef, Value
+from django.utils import timezone
+
+from .models import ChargingStation, StationChange
+from .operators import operator_key
+
+SYNC_FIELDS = [
+    'id', 'name', 'address', 'latitude', 'longitude', 'charging_type', 'power_output', 'price_per_kwh',
+    'status', 'total_ports', 'available_ports', 'amenities', 'average_rating', 'total_reviews',
+]
+SYNC_PAGE_SIZE = 1000
+SNAPSHOT_DIR = 'sync'
+SNAPSHOTS_KEPT = 2
+SNAPSHOT_CACHE_KEY = 'sync:snapshot'
+
+
+def record_station_changes(station_ids, deleted=False, operator_id=None):
+    """Append one change log row per station with a single INSERT, looking up their operators unless given"""
+    station_ids = list(station_ids)
+    if operator_id is None:
+        # Stations gone meanwhile logged their deletion already
+        operators = dict(ChargingStation.objects.filter(pk__in=set(station_ids)).values_list('pk', 'operator'))
+    else:
+        operators = dict.fromkeys(station_ids, operator_id)
+    StationChange.objects.bulk_create([
+        StationChange(station_id=pk, operator_id=operators[pk], deleted=deleted) for pk in station_ids if pk in operators
+    ])
+
+
+def _compact(row):
+    return [float(value) if isinstance(value, Decimal) else value for value in row]
+
+
+def _settled():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 5))
+
+
+def settled_cursor(operator_id):
+    """Id of the operator's newest change older than the settle window, where a snapshot taken now can start"""
+    return StationChange.objects.filter(
+        operator_id=operator_id, created_at__lte=_settled()
+    ).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def cursor_expired(cursor):
+    """Whether cursor lies past the end of the change log, so only a full sync brings the client up to date"""
+    # Compaction never drops the newest row, a cursor the log handed out stays at or below it
+    return cursor > 0 and not StationChange.objects.filter(id__gte=cursor).exists()
+
+
+def changes_since(operator_id, cursor, limit=SYNC_PAGE_SIZE):
+    """Current rows of the operator's stations changed after cursor and ids of the deleted ones, with the cursor to ask from next"""
+    # Only each station's newest change, a busy station is sent once however often it changed
+    newer = StationChange.objects.filter(station_id=OuterRef('station_id'), id__gt=OuterRef('id'))
+    rows = list(StationChange.objects.filter(operator_id=operator_id, id__gt=cursor).exclude(Exists(newer)).order_by('id').values_list(
+        'id', 'station_id', 'deleted', 'created_at'
+    )[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    settled = _settled()
+    next_cursor = cursor
+    for pk, _, _, created_at in rows:
+        if created_at > settled:
+            # Later changes are sent now and again on the next request
+            more = False
+            break
+        next_cursor = pk
+
+    latest = {station: deleted for _, station, deleted, _ in rows}
+    stations = [
+        _compact(row) for row in ChargingStation.objects.filter(
+            pk__in=[station for station, deleted in latest.items() if not deleted]
+        ).order_by('pk').values_list(*SYNC_FIELDS)
+    ]
+    found = {row[0] for row in stations}
+    return {
+        'cursor': next_cursor,
+        'more': more,
+        'full': False,
+        'fields': SYNC_FIELDS,
+        'stations': stations,
+        # A station deleted after its newest change was read has no row left either
+        'deleted': sorted(station for station in latest if station not in found),
+    }
+
+
+def compact_changes(batch_size=50000, change_model=StationChange, station_model=ChargingStation):
+    """Drop change rows superseded by a later row of the same station and log stations missing from the log, returns (removed, added)"""
+    removed = 0
+    last = change_model.objects.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last, batch_size):
+        newer = change_model.objects.filter(station_id=OuterRef('station_id'), id__gt=OuterRef('id'))
+        removed += change_model.objects.filter(id__gt=start, id__lte=start + batch_size).filter(Exists(newer)).delete()[0]
+
+    # Stations from bulk imports never passed through the save signal
+    # Migration 0013 compacts with the models from before operators, its rows go without one
+    scoped = any(field.name == 'operator_id' for field in change_model._meta.fields)
+    unlogged = station_model.objects.exclude(pk__in=change_model.objects.values('station_id')).values_list(
+        'pk', F('operator') if scoped else Value(None, output_field=BigIntegerField())
+    )
+    added = 0
+    batch = []
+    for pk, operator in unlogged.iterator(chunk_size=batch_size):
+        batch.append(change_model(station_id=pk) if operator is None else change_model(station_id=pk, operator_id=operator))
+        if len(batch) == batch_size:
+            added += len(change_model.objects.bulk_create(batch))
+            batch = []
+    added += len(change_model.objects.bulk_create(batch))
+    return removed, added
+
+
+def snapshot_chunks(operator_id, cursor, rows_per_chunk=1000):
+    """A sync page holding every station of the operator, as JSON text a few hundred kilobytes at a time"""
+    header = json.dumps({'cursor': cursor, 'more': False, 'full': True, 'fields': SYNC_FIELDS, 'deleted': []}, separators=(',', ':'))
+    yield header[:-1] + ',"stations":['
+    separator = ''
+    rows = []
+    for row in ChargingStation.objects.filter(operator=operator_id).order_by('pk').values_list(*SYNC_FIELDS).iterator(chunk_size=2000):
+        rows.append(json.dumps(_compact(row), separators=(',', ':')))
+        if len(rows) == rows_per_chunk:
+            yield separator + ','.join(rows)
+            separator = ','
+            rows = []
+    if rows:
+        yield separator + ','.join(rows)
+    yield ']}'
+
+
+def _snapshot_names(operator):
+    directory = f'{SNAPSHOT_DIR}/{operator.slug}'
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return []
+    names = [name for name in files if name.startswith('stations-') and name.endswith('.json.gz') and name[9:-8].isdigit()]
+    return [f'{directory}/{name}' for name in sorted(names, key=lambda name: int(name[9:-8]))]
+
+
+def write_snapshot(operator):
+    """Store a gzipped snapshot of the operator at its settled cursor and drop all but its newest SNAPSHOTS_KEPT, returns its name"""
+    cursor = settled_cursor(operator.pk)
+    name = f'{SNAPSHOT_DIR}/{operator.slug}/stations-{cursor}.json.gz'
+    if not default_storage.exists(name):
+        with tempfile.TemporaryFile() as buffer:
+            with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as archive:
+                for chunk in snapshot_chunks(operator.pk, cursor):
+                    archive.write(chunk.encode())
+            buffer.seek(0)
+            name = default_storage.save(name, File(buffer))
+    # Clients still downloading the previous snapshot can finish
+    for old in _snapshot_names(operator)[:-SNAPSHOTS_KEPT]:
+        default_storage.delete(old)
+    cache.set(operator_key(operator.pk, SNAPSHOT_CACHE_KEY), name, None)
+    return name
+
+
+def latest_snapshot(operator):
+    """Name of the operator's newest stored snapshot, or None before the first one is written"""
+    cache_key = operator_key(operator.pk, SNAPSHOT_CACHE_KEY)
+    name = cache.get(cache_key)
+    if name is None:
+        names = _snapshot_names(operator)
+        name = names[-1] if names else ''
+        cache.set(cache_key, name, 300)
+    return name or None
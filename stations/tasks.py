@@ -0,0 +1,119 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Avg, Count, F
+from django.utils import timezone
+
+from evspot.images import build_derivatives, needs_derivatives
+from tasks.queue import task
+from .analytics import queue_usage_refresh, refresh_usage
+from .assignment import DEFAULT_ENERGY_KWH
+from .fleet import FLEET_CHARGE_SHARE
+from .models import ChargingStation, ChargingSession, FleetSummary, Review, StationCell
+from .reviews import queue_rating_refresh, screen
+from .sync import record_station_changes
+from .tiles import CELL_MAX_ZOOM, refresh_cells
+
+
+@task('stations.refresh_ratings', batch=500)
+def refresh_ratings(payloads):
+    """Recompute the review rollup of every station in the batch with one GROUP BY"""
+    station_ids = {payload['station'] for payload in payloads}
+    rollups = {
+        row['station']: row for row in Review.objects.filter(station__in=station_ids, status='published').values('station').annotate(
+            average=Avg('rating'), count=Count('id')
+        )
+    }
+    now = timezone.now()
+    stations = list(ChargingStation.objects.filter(pk__in=station_ids).only('pk'))
+    for station in stations:
+        rollup = rollups.get(station.pk, {'average': 0, 'count': 0})
+        station.average_rating = rollup['average']
+        station.total_reviews = rollup['count']
+        station.updated_at = now
+    ChargingStation.objects.bulk_update(stations, ['average_rating', 'total_reviews', 'updated_at'])
+    record_station_changes(station.pk for station in stations)
+
+
+@task('stations.moderate_reviews', batch=500)
+def moderate_reviews(payloads):
+    """Screen a batch of pending reviews, publishing clean ones and holding the rest for staff"""
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked so an edit arriving meanwhile waits and is screened again by its own task
+        pending = list(Review.objects.select_for_update().filter(
+            pk__in={payload['review'] for payload in payloads}, status='pending'
+        ).values_list('pk', 'station', 'comment'))
+        verdicts = defaultdict(list)
+        for (pk, station, comment), verdict in zip(pending, screen([comment for _, _, comment in pending])):
+            verdicts[verdict].append((pk, station))
+        for verdict, reviews in verdicts.items():
+            Review.objects.filter(pk__in=[pk for pk, _ in reviews]).update(status=verdict, updated_at=now)
+        queue_rating_refresh(station for _, station in verdicts['published'])
+
+
+@task('stations.refresh_cells', batch=500)
+def refresh_station_cells(payloads):
+    """Bring the map tile cells of changed stations up to date"""
+    cells = {(payload['operator'], payload['cell']) for payload in payloads if 'operator' in payload}
+    stations = {payload['station'] for payload in payloads if 'station' in payload}
+    if stations:
+        cells.update(ChargingStation.objects.filter(pk__in=stations).exclude(grid_cell=None).values_list('operator', 'grid_cell'))
+    # Queued before operators, recount the cell for every operator counted or with stations there
+    unscoped = {payload['cell'] for payload in payloads if 'cell' in payload and 'operator' not in payload}
+    if unscoped:
+        cells.update(StationCell.objects.filter(zoom=CELL_MAX_ZOOM, key__in=unscoped).values_list('operator', 'key'))
+        cells.update(ChargingStation.objects.filter(grid_cell__in=unscoped).order_by().values_list('operator', 'grid_cell').distinct())
+    refresh_cells(cells)
+
+
+def delivered_kwh(session):
+    """Energy a finished session delivered, from its duration at full power capped by what the vehicle asked for"""
+    power = session.station.power_output
+    wanted = DEFAULT_ENERGY_KWH
+    if session.vehicle is not None:
+        power = min(power, session.vehicle.max_charging_power_kw or power)
+        wanted = float(session.vehicle.battery_capacity_kwh) * FLEET_CHARGE_SHARE
+    hours = (session.end_time - session.start_time).total_seconds() / 3600
+    return min(max(hours, 0) * power, wanted)
+
+
+@task('stations.finalize_sessions', batch=500)
+def finalize_sessions(payloads):
+    """Bill completed sessions that were stopped without a meter reading"""
+    sessions = list(ChargingSession.objects.select_related('station', 'vehicle').filter(
+        pk__in={payload['session'] for payload in payloads},
+        status='completed', end_time__isnull=False, energy_consumed=0,
+    ))
+    fleet_totals = defaultdict(lambda: [Decimal('0'), Decimal('0')])
+    for session in sessions:
+        session.finish(session.end_time, delivered_kwh(session))
+        if session.vehicle_id is not None:
+            fleet_totals[session.user_id, session.station.operator_id][0] += session.energy_consumed
+            fleet_totals[session.user_id, session.station.operator_id][1] += session.total_cost
+    ChargingSession.objects.bulk_update(sessions, ['energy_consumed', 'total_cost'])
+    for (user_id, operator_id), (energy, cost) in fleet_totals.items():
+        FleetSummary.objects.filter(user_id=user_id, operator_id=operator_id).update(
+            energy_consumed=F('energy_consumed') + energy, total_cost=F('total_cost') + cost
+        )
+    queue_usage_refresh(sessions)
+
+
+@task('stations.refresh_usage', batch=500)
+def refresh_station_usage(payloads):
+    """Recount the analytics rows of the station days whose sessions were billed"""
+    refresh_usage({(payload['station'], date.fromisoformat(payload['day'])) for payload in payloads})
+
+
+@task('stations.build_thumbnails', max_attempts=3)
+def build_station_thumbnails(station):
+    station = ChargingStation.objects.filter(pk=station).only('pk', 'image', 'image_derivatives').first()
+    if station is None or not needs_derivatives(station.image, station.image_derivatives):
+        return
+    derivatives = build_derivatives(station.image) if station.image else {}
+    # Skip the write if another upload replaced the image meanwhile, its own task will handle it
+    ChargingStation.objects.filter(pk=station.pk, image=station.image.name or '').update(
+        image_derivatives=derivatives, updated_at=timezone.now()
+    )
@@ -0,0 +1,655 @@
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from evspot.db.replicas import ReplicaMiddleware, ReplicaRouter
+from rest_framework.test import APIClient
+from users.models import Vehicle
+
+from .analytics import queue_usage_refresh, region_of
+from .assignment import rank_candidates
+from .favorites import favorite_ids
+from .load_management import load_manager
+from .models import (
+    ChargingSession, ChargingStation, FavoriteStation, FleetSummary, Operator, PricingRule, RegionUsage, Review, StationChange,
+    StationUsage,
+)
+from .operators import operator_directory
+from .pricing import PricingEngine, _rule_slices, time_slice
+from .serializers import ChargingSessionSerializer
+from .simulation import read_columns
+from .spatial import get_station_index, reset_station_index
+from .sync import changes_since, record_station_changes
+
+User = get_user_model()
+
+
+def make_station(operator, **fields):
+    fields = {
+        'name': 'Station', 'address': '1 Test St', 'latitude': Decimal('37.770000'), 'longitude': Decimal('-122.420000'),
+        'charging_type': 'fast', 'power_output': 50, 'price_per_kwh': Decimal('0.40'), 'total_ports': 2, 'available_ports': 2,
+        **fields,
+    }
+    return ChargingStation.objects.create(operator=operator, **fields)
+
+
+class StationsTestCase(TestCase):
+    def setUp(self):
+        # Process-wide state outlives the rolled back rows of earlier tests
+        cache.clear()
+        operator_directory.forget()
+        reset_station_index()
+        load_manager.forget()
+        self.operator = operator_directory.default()
+
+
+class StationIndexTests(StationsTestCase):
+    @override_settings(STATION_INDEX_REFRESH_SECONDS=0)
+    def test_stations_saved_by_another_process_are_ranked(self):
+        station = make_station(self.operator)
+        get_station_index(self.operator.pk)
+        # Written without this process's post_save signal, as another worker would
+        other = ChargingStation.objects.bulk_create([ChargingStation(
+            operator=self.operator, name='Elsewhere', address='2 Test St', latitude=Decimal('37.771000'),
+            longitude=Decimal('-122.421000'), charging_type='fast', power_output=50, price_per_kwh=Decimal('0.40'),
+        )])[0]
+        record_station_changes([other.pk], operator_id=self.operator.pk)
+        candidates = rank_candidates(self.operator.pk, station.pk, 37.77, -122.42)
+        self.assertEqual({c.station_id for c in candidates}, {station.pk, other.pk})
+
+    def test_unlogged_station_falls_back_to_the_database(self):
+        get_station_index(self.operator.pk)
+        other = ChargingStation.objects.bulk_create([ChargingStation(
+            operator=self.operator, name='Imported', address='3 Test St', latitude=Decimal('37.772000'),
+            longitude=Decimal('-122.422000'), charging_type='slow', power_output=11, price_per_kwh=Decimal('0.30'),
+        )])[0]
+        self.assertEqual([c.station_id for c in rank_candidates(self.operator.pk, other.pk, 37.77, -122.42)], [other.pk])
+
+
+class LoadManagementTests(StationsTestCase):
+    def test_grid_cap_holds_for_sessions_started_by_other_processes(self):
+        for policy in ('equal', 'fifo', 'priority'):
+            station = make_station(
+                self.operator, name=policy, power_output=50, total_ports=6, available_ports=6, grid_capacity_kw=120, load_policy=policy
+            )
+            users = [User.objects.create(username=f'{policy}{i}') for i in range(6)]
+            client = APIClient()
+            for user in users[:3]:
+                client.force_authenticate(user)
+                self.assertEqual(client.post(f'/api/stations/{station.pk}/start_charging/').status_code, 201)
+            # Started by another worker, this process sees them only in the database
+            for priority, user in enumerate(users[3:], 1):
+                ChargingSession.objects.create(user=user, station=station, priority=priority)
+
+            sessions = ChargingSession.objects.filter(station=station, status='active')
+            allocations = [row['allocated_power_kw'] for row in ChargingSessionSerializer(sessions, many=True).data]
+            self.assertEqual(len(allocations), 6)
+            self.assertLessEqual(sum(allocations), 120 + 0.01, policy)
+            self.assertTrue(all(0 <= allocation <= 50 for allocation in allocations), policy)
+            for session in sessions:
+                client.force_authenticate(session.user)
+                single = client.get(f'/api/sessions/{session.pk}/').json()['allocated_power_kw']
+                self.assertIn(single, allocations)
+
+    def test_loads_are_kept_until_their_station_changes(self):
+        station = make_station(self.operator, power_output=50, total_ports=4, available_ports=4, grid_capacity_kw=60, load_policy='fifo')
+        user = User.objects.create(username='driver')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.post(f'/api/stations/{station.pk}/start_charging/').status_code, 201)
+        load = load_manager.station(station.pk)
+        # Only the version query, the load was built once and updated in place by the start
+        with self.assertNumQueries(1):
+            self.assertIs(load_manager.station(station.pk), load)
+        self.assertEqual(list(load.allocations().values()), [50])
+
+        # A start by another worker moves the version, that station alone is rebuilt
+        other = ChargingSession.objects.create(user=User.objects.create(username='other'), station=station)
+        with self.assertNumQueries(2):
+            rebuilt = load_manager.station(station.pk)
+        self.assertEqual(rebuilt.allocation(other.pk), 10)
+        self.assertEqual(client.post(f'/api/stations/{station.pk}/stop_charging/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(load_manager.station(station.pk).allocations(), {other.pk: 50})
+
+    def test_session_list_loads_allocations_once(self):
+        user = User.objects.create(username='driver')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        def list_queries(stations):
+            for i in range(stations):
+                ChargingSession.objects.create(user=user, station=make_station(self.operator, name=f'S{i}'))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(client.get('/api/sessions/').status_code, 200)
+            ChargingSession.objects.all().delete()
+            return len(queries)
+
+        self.assertEqual(list_queries(2), list_queries(8))
+
+
+class PricingRuleTests(TestCase):
+    def covers(self, rule, *moment):
+        return time_slice(timezone.make_aware(datetime(*moment))) in _rule_slices(rule)
+
+    def test_window_past_midnight_continues_on_the_next_day(self):
+        # 2024-01-05 is a Friday
+        rule = PricingRule(weekdays='4', start_time=time(22), end_time=time(2), multiplier=Decimal('1.5'))
+        self.assertTrue(self.covers(rule, 2024, 1, 5, 22, 0))
+        self.assertTrue(self.covers(rule, 2024, 1, 6, 1, 45))
+        self.assertFalse(self.covers(rule, 2024, 1, 6, 2, 0))
+        self.assertFalse(self.covers(rule, 2024, 1, 5, 1, 0))
+        self.assertFalse(self.covers(rule, 2024, 1, 5, 21, 45))
+
+    def test_sunday_window_wraps_to_monday(self):
+        rule = PricingRule(weekdays='6', start_time=time(23), end_time=time(1), multiplier=Decimal('0.8'))
+        self.assertTrue(self.covers(rule, 2024, 1, 8, 0, 30))
+        self.assertFalse(self.covers(rule, 2024, 1, 7, 0, 30))
+
+
+class PricingEngineTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rule = PricingRule.objects.create(name='Peak', operator=self.operator, multiplier=Decimal('1.50'))
+        self.engine = PricingEngine()
+        self.clock = 1_000_000_000.0
+
+    def price(self, slice_index):
+        with mock.patch('stations.pricing.time.time', return_value=self.clock):
+            return self.engine.price_value(1, self.operator.pk, 'fast', Decimal('0.40'), 2, 4, slice_index)
+
+    def test_other_slices_leave_the_current_one_cached(self):
+        self.assertEqual(self.price(10), Decimal('0.60'))
+        with self.assertNumQueries(0):
+            for slice_index in (11, 12, 10, 300, 10):
+                self.assertEqual(self.price(slice_index), Decimal('0.60'))
+        self.assertIn(10, self.engine._prices)
+
+    def test_edits_by_other_processes_are_seen_in_the_next_slice(self):
+        self.price(10)
+        # Written straight to the table, as another process would, so no signal reaches this engine
+        PricingRule.objects.filter(pk=self.rule.pk).update(multiplier=Decimal('2.00'), updated_at=timezone.now())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.price(10), Decimal('0.60'))
+        self.clock += 15 * 60
+        self.assertEqual(self.price(10), Decimal('0.80'))
+        # Unchanged rules cost one aggregate query per slice and no recompile
+        self.clock += 15 * 60
+        with self.assertNumQueries(1):
+            self.assertEqual(self.price(11), Decimal('0.80'))
+
+    def test_concurrent_slice_changes_keep_one_cache(self):
+        errors = []
+
+        def price_slices(offset):
+            try:
+                for i in range(200):
+                    self.assertEqual(self.engine.price_value(i % 50, self.operator.pk, 'fast', Decimal('0.40'), 2, 4, (i + offset) % 6), Decimal('0.60'))
+            except Exception as exc:
+                errors.append(exc)
+
+        self.price(0)
+        threads = [threading.Thread(target=price_slices, args=(offset,)) for offset in range(4)]
+        with mock.patch('stations.pricing.time.time', return_value=self.clock):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.engine._prices), 4)
+
+
+class SessionExportTests(StationsTestCase):
+    def test_errors_are_json(self):
+        client = APIClient()
+        for query in ('', '?format=csv', '?format=jsonl'):
+            response = client.get(f'/api/sessions/export/{query}')
+            self.assertEqual(response.status_code, 401, query)
+            self.assertEqual(response['Content-Type'], 'application/json', query)
+            self.assertIn('detail', response.json())
+        client.force_authenticate(User.objects.create(username='driver'))
+        response = client.get('/api/sessions/export/?format=csv&start=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid start date'})
+        response = client.get('/api/sessions/export/?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+
+class StationRetrieveTests(StationsTestCase):
+    def test_non_numeric_id_is_not_found(self):
+        response = APIClient().get('/api/stations/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_repaired_ports_change_the_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            station = make_station(self.operator, total_ports=4, available_ports=4)
+        # Drift written with the old timestamp, as a lost update would leave it
+        ChargingStation.objects.filter(pk=station.pk).update(available_ports=1, updated_at=station.updated_at)
+        client = APIClient()
+        etag = client.get(f'/api/stations/{station.pk}/')['ETag']
+        call_command('verify_ports', station.pk, repair=True, stdout=StringIO())
+        self.assertEqual(ChargingStation.objects.get(pk=station.pk).available_ports, 4)
+        response = client.get(f'/api/stations/{station.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['available_ports'], 4)
+
+    def test_bulk_updates_bump_updated_at(self):
+        station = make_station(self.operator)
+        ChargingStation.objects.filter(pk=station.pk).update(available_ports=0)
+        self.assertGreater(ChargingStation.objects.get(pk=station.pk).updated_at, station.updated_at)
+
+
+class OperatorOwnershipTests(StationsTestCase):
+    def test_unsaved_stations_need_no_database(self):
+        # The simulator builds stations before, or without, a migrated database
+        operator_directory.forget()
+        with self.assertNumQueries(0):
+            ChargingStation(name='Simulated')
+            PricingRule(name='Peak')
+
+    def test_admin_add_form_starts_with_the_request_operator(self):
+        client = APIClient()
+        client.force_login(User.objects.create_superuser('admin', password='!'))
+        for url in ('/admin/stations/chargingstation/add/', '/admin/stations/pricingrule/add/'):
+            response = client.get(url)
+            self.assertEqual(response.context['adminform'].form.initial['operator'], self.operator.pk, url)
+
+
+class ParallelIdempotencyTests(TransactionTestCase):
+    """Duplicates sent at once from threads, each on its own connection to the test database file"""
+    threads = 6
+
+    def setUp(self):
+        cache.clear()
+        operator_directory.forget()
+        reset_station_index()
+        load_manager.forget()
+        self.addCleanup(operator_directory.forget)
+        self.station = make_station(operator_directory.default(), total_ports=4, available_ports=4)
+        self.user = User.objects.create(username='driver')
+
+    def post_at_once(self, url, key):
+        barrier = threading.Barrier(self.threads)
+        responses = [None] * self.threads
+
+        def send(n):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                response = client.post(url, HTTP_IDEMPOTENCY_KEY=key)
+                responses[n] = (response.status_code, response.json())
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=send, args=(n,)) for n in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return responses
+
+    def available_ports(self):
+        return ChargingStation.objects.values_list('available_ports', flat=True).get(pk=self.station.pk)
+
+    def test_duplicate_starts_and_stops_act_once(self):
+        self.assertFalse(connection.is_in_memory_db())
+        started = self.post_at_once(f'/api/stations/{self.station.pk}/start_charging/', 'start-1')
+        self.assertEqual([code for code, _ in started], [201] * self.threads)
+        self.assertEqual(len({repr(data) for _, data in started}), 1)
+        self.assertEqual(ChargingSession.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.available_ports(), 3)
+
+        stopped = self.post_at_once(f'/api/stations/{self.station.pk}/stop_charging/', 'stop-1')
+        self.assertEqual([code for code, _ in stopped], [200] * self.threads)
+        self.assertEqual(len({repr(data) for _, data in stopped}), 1)
+        self.assertEqual(stopped[0][1]['id'], started[0][1]['id'])
+        self.assertEqual(ChargingSession.objects.get(user=self.user).status, 'completed')
+        self.assertEqual(self.available_ports(), 4)
+
+
+class FavoriteCacheTests(StationsTestCase):
+    @override_settings(FAVORITES_CACHE_SECONDS=5)
+    def test_favorites_added_by_another_worker_show_up_after_the_ttl(self):
+        user = User.objects.create(username='driver')
+        station = make_station(self.operator)
+        self.assertEqual(favorite_ids(user.pk, self.operator.pk), frozenset())
+        # No signal here, as in a worker whose local cache this process cannot clear
+        FavoriteStation.objects.bulk_create([FavoriteStation(user=user, station=station)])
+        self.assertEqual(favorite_ids(user.pk, self.operator.pk), frozenset())
+        later = timezone.now().timestamp() + 6
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(favorite_ids(user.pk, self.operator.pk), {station.pk})
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class ReplicaPinTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+
+    def request(self, user, method='get'):
+        """Run a request for user through ReplicaMiddleware, return the response and where its read went"""
+        reads = []
+
+        def view(request):
+            # Token clients are only authenticated inside the view
+            request.user = user
+            if method == 'post':
+                self.router.db_for_write(ChargingStation)
+            reads.append(self.router.db_for_read(ChargingStation))
+            return HttpResponse()
+
+        def handler(request):
+            # What Django's handler does between the middleware call and the view
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaMiddleware(handler)
+        return middleware(getattr(RequestFactory(), method)('/api/stations/')), reads[0]
+
+    def test_token_clients_read_their_writes(self):
+        writer, other = User(pk=7, username='writer'), User(pk=8, username='other')
+        self.assertEqual(self.request(writer)[1], 'replica1')
+        self.assertIn('pin_primary', self.request(writer, 'post')[0].cookies)
+        # No cookie sent back, the user alone keeps the reads on the primary
+        self.assertEqual(self.request(writer)[1], 'default')
+        self.assertEqual(self.request(other)[1], 'replica1')
+        cache.clear()
+        self.assertEqual(self.request(writer)[1], 'replica1')
+
+
+class SimulationTests(SimpleTestCase):
+    def simulate(self, directory, name, **options):
+        path = os.path.join(directory, name)
+        options = {'stations': 60, 'clusters': 5, 'days': 2, 'demand_samples': 2000, 'seed': 7, **options}
+        call_command('simulate', output=path, stdout=StringIO(), **options)
+        return read_columns(path)
+
+    def test_seeded_run_is_repeatable_and_round_trips(self):
+        # A SimpleTestCase fails on any query, the synthetic network needs no database
+        with tempfile.TemporaryDirectory() as directory:
+            columns, metadata = self.simulate(directory, 'first.zip')
+            again, _ = self.simulate(directory, 'second.zip')
+            other, _ = self.simulate(directory, 'other.zip', seed=8)
+        self.assertEqual(metadata['options'], {
+            'stations': 60, 'from_db': False, 'clusters': 5, 'seed': 7, 'arrival_rate': 0.3, 'demand_samples': 2000,
+            'days': 2, 'max_queue': 3, 'patience': 20,
+        })
+        self.assertEqual(columns, again)
+        self.assertNotEqual(columns, other)
+        self.assertEqual({len(values) for values in columns.values()}, {60})
+        self.assertGreater(metadata['summary']['served'], 0)
+
+
+class PinTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # One station every ~1.1 km north of the origin, the cheapest the farthest
+        self.stations = [
+            make_station(self.operator, name=f'P{i}', latitude=Decimal(f'{37.77 + i * 0.01:.6f}'), price_per_kwh=Decimal(f'{0.60 - i * 0.05:.2f}'))
+            for i in range(5)
+        ]
+
+    def pins(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/vnd.evspot.pins+json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @mock.patch('stations.pins.MAX_PINS', 3)
+    def test_list_cap_is_applied_in_the_query_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.pins('/api/stations/')
+        self.assertTrue(any('LIMIT 4' in query['sql'] for query in queries))
+        self.assertEqual((data['count'], data['truncated']), (3, True))
+        self.assertEqual(data['columns']['id'], [station.pk for station in self.stations[::-1][:3]])
+        data = self.pins('/api/stations/?ordering=price_per_kwh')
+        self.assertEqual(data['columns']['id'], [station.pk for station in self.stations[::-1][:3]])
+        data = self.pins('/api/stations/?ordering=-price_per_kwh')
+        self.assertEqual(data['columns']['id'], [station.pk for station in self.stations[:3]])
+
+    @mock.patch('stations.pins.MAX_PINS', 3)
+    def test_nearby_keeps_the_closest_pins(self):
+        data = self.pins('/api/stations/nearby/?latitude=37.77&longitude=-122.42&radius=10')
+        self.assertEqual((data['count'], data['truncated']), (3, True))
+        self.assertEqual(data['columns']['id'], [station.pk for station in self.stations[:3]])
+        # The farthest two are out of range, so nothing was left out
+        data = self.pins('/api/stations/nearby/?latitude=37.77&longitude=-122.42&radius=3')
+        self.assertEqual((data['count'], data['truncated']), (3, False))
+
+
+@override_settings(TASKS_EAGER=True)
+class FleetTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create(username='fleet')
+        self.vehicles = [
+            Vehicle.objects.create(owner=self.owner, name=f'Van {i}', battery_capacity_kwh=Decimal('60.0'), connector='ccs')
+            for i in range(3)
+        ]
+        self.station = make_station(self.operator, total_ports=4, available_ports=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def dashboard(self, **headers):
+        return self.client.get('/api/fleet/dashboard/', **headers).json()
+
+    def test_batch_start_stop_and_billed_totals(self):
+        first, second, _ = self.vehicles
+        response = self.client.post('/api/fleet/start/', {'sessions': [
+            {'vehicle': first.pk, 'station': self.station.pk},
+            {'vehicle': second.pk, 'station': self.station.pk},
+            {'vehicle': first.pk, 'station': self.station.pk},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['started']), 2)
+        self.assertEqual(response.json()['failed'], [{'vehicle': first.pk, 'error': 'Vehicle already has an active charging session'}])
+        self.assertEqual(ChargingStation.objects.get(pk=self.station.pk).available_ports, 2)
+        dashboard = self.dashboard()
+        self.assertEqual((dashboard['active_sessions'], dashboard['sessions_started']), (2, 2))
+        self.assertEqual({row['vehicle_id'] for row in dashboard['charging']}, {first.pk, second.pk})
+
+        # Two hours at 50 kW covers the 36 kWh a fleet van is assumed to take
+        ChargingSession.objects.filter(vehicle=first).update(start_time=timezone.now() - timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/fleet/stop/', {'vehicles': [first.pk, self.vehicles[2].pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['failed'], [{'vehicle': self.vehicles[2].pk, 'error': 'No active charging session found'}])
+        self.assertEqual(ChargingStation.objects.get(pk=self.station.pk).available_ports, 3)
+        billed = ChargingSession.objects.get(vehicle=first)
+        self.assertEqual(billed.energy_consumed, Decimal('36.00'))
+        dashboard = self.dashboard()
+        self.assertEqual((dashboard['active_sessions'], dashboard['sessions_completed']), (1, 1))
+        # Counted once, by the billing task
+        self.assertEqual(Decimal(str(dashboard['energy_consumed'])), billed.energy_consumed)
+        self.assertEqual(Decimal(str(dashboard['total_cost'])), billed.total_cost)
+
+    def test_each_operator_has_its_own_totals(self):
+        other = Operator.objects.create(name='Other', slug='other')
+        station = make_station(other, total_ports=2, available_ports=2)
+        response = self.client.post('/api/fleet/start/', {'sessions': [{'vehicle': self.vehicles[0].pk, 'station': station.pk}]},
+                                    format='json', HTTP_X_OPERATOR='other')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.dashboard(HTTP_X_OPERATOR='other')['active_sessions'], 1)
+        self.assertEqual(self.dashboard()['active_sessions'], 0)
+        self.assertEqual(FleetSummary.objects.get(user=self.owner).operator, other)
+
+
+@override_settings(TASKS_EAGER=True, REVIEW_MODERATION={'BLOCKED_TERMS': ['scam'], 'MAX_LINKS': 1})
+class ReviewTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.station = make_station(self.operator)
+
+    def review(self, user, rating, comment=''):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post('/api/reviews/', {'station': self.station.pk, 'rating': rating, 'comment': comment}, format='json')
+
+    def moderate(self, **decisions):
+        client = APIClient()
+        client.force_authenticate(User.objects.get_or_create(username='staff', is_staff=True)[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post('/api/reviews/moderation/', decisions, format='json')
+
+    def rating(self):
+        station = ChargingStation.objects.get(pk=self.station.pk)
+        return station.average_rating, station.total_reviews
+
+    def listed(self):
+        return [review['id'] for review in APIClient().get('/api/reviews/').json()['results']]
+
+    def test_reviewing_again_updates_the_review(self):
+        driver = User.objects.create(username='driver')
+        first = self.review(driver, 2, 'Slow')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(self.rating(), (2.0, 1))
+        second = self.review(driver, 5, 'Fixed now')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        review = Review.objects.get(user=driver, station=self.station)
+        self.assertEqual((review.rating, review.comment, review.status), (5, 'Fixed now', 'published'))
+        self.assertEqual(self.rating(), (5.0, 1))
+
+    def test_moderation_hides_reviews_and_moves_the_rating(self):
+        clean = self.review(User.objects.create(username='fan'), 4, 'Quick and cheap').json()['id']
+        flagged = self.review(User.objects.create(username='critic'), 1, 'A scam').json()['id']
+        self.assertEqual(Review.objects.get(pk=flagged).status, 'held')
+        self.assertEqual(self.listed(), [clean])
+        self.assertEqual(self.rating(), (4.0, 1))
+
+        response = self.moderate(publish=[flagged], reject=[clean])
+        self.assertEqual(response.json(), {'published': 1, 'rejected': 1})
+        self.assertEqual(self.listed(), [flagged])
+        self.assertEqual(self.rating(), (1.0, 1))
+
+
+class SyncTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def settle(self):
+        StationChange.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+
+    def sync(self, since=None):
+        response = APIClient().get('/api/stations/sync/', {} if since is None else {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content)) if response.streaming else response.json()
+
+    def test_expired_cursor_gets_a_full_sync(self):
+        stations = [make_station(self.operator, name=f'Site {i}') for i in range(2)]
+        self.settle()
+        page = self.sync(0)
+        self.assertEqual((page['full'], len(page['stations'])), (False, 2))
+        self.assertEqual(self.sync(page['cursor'])['stations'], [])
+        # A cursor handed out before the database was restored from an older backup
+        page = self.sync(page['cursor'] + 100)
+        self.assertTrue(page['full'])
+        self.assertEqual(sorted(row[0] for row in page['stations']), sorted(station.pk for station in stations))
+
+    def test_deletes_are_replayed(self):
+        kept, removed = make_station(self.operator), make_station(self.operator)
+        self.settle()
+        cursor = self.sync(0)['cursor']
+        removed_id = removed.pk
+        removed.delete()
+        self.settle()
+        page = self.sync(cursor)
+        self.assertEqual((page['stations'], page['deleted']), ([], [removed_id]))
+        self.assertEqual([row[0] for row in self.sync(0)['stations']], [kept.pk])
+
+    def test_changes_committing_during_a_read_are_not_skipped(self):
+        first, late, last = (make_station(self.operator) for _ in range(3))
+        StationChange.objects.all().delete()
+        settled = timezone.now() - timedelta(minutes=1)
+        StationChange.objects.create(id=1, station_id=first.pk, operator_id=self.operator.pk)
+        StationChange.objects.filter(id=1).update(created_at=settled)
+        # Id 2 was taken by a transaction that has not committed yet, id 3 committed just now
+        StationChange.objects.create(id=3, station_id=last.pk, operator_id=self.operator.pk)
+        page = changes_since(self.operator.pk, 0)
+        self.assertEqual([row[0] for row in page['stations']], [first.pk, last.pk])
+        self.assertEqual(page['cursor'], 1)
+
+        StationChange.objects.create(id=2, station_id=late.pk, operator_id=self.operator.pk)
+        page = changes_since(self.operator.pk, page['cursor'])
+        self.assertEqual([row[0] for row in page['stations']], [late.pk, last.pk])
+        self.assertEqual(page['cursor'], 1)
+        StationChange.objects.update(created_at=settled)
+        self.assertEqual(changes_since(self.operator.pk, 1)['cursor'], 3)
+
+
+@override_settings(TASKS_EAGER=True)
+class UsageTests(StationsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver = User.objects.create(username='driver')
+        # Two stations share a region, the third is in another
+        self.stations = [
+            make_station(self.operator),
+            make_station(self.operator, latitude=Decimal('37.800000')),
+            make_station(self.operator, latitude=Decimal('34.050000'), longitude=Decimal('-118.240000')),
+        ]
+
+    def add_sessions(self, count, seed):
+        rng = random.Random(seed)
+        sessions = []
+        for _ in range(count):
+            # Across the end of January, and some sessions that are not counted
+            end = timezone.make_aware(datetime(2024, 1, 29) + timedelta(hours=rng.randint(0, 24 * 5)))
+            sessions.append(ChargingSession(
+                user=self.driver, station=rng.choice(self.stations), end_time=end, status=rng.choice(['completed'] * 3 + ['cancelled']),
+                energy_consumed=Decimal(rng.randint(100, 6000)) / 100, total_cost=Decimal(rng.randint(50, 3000)) / 100,
+            ))
+        # Created without the session signals, the refresh is queued the way billing does it
+        ChargingSession.objects.bulk_create(sessions)
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_usage_refresh([session for session in sessions if session.status == 'completed'])
+
+    def direct(self, first, last, **filters):
+        return ChargingSession.objects.filter(
+            status='completed', end_time__gte=timezone.make_aware(datetime.combine(first, time())),
+            end_time__lt=timezone.make_aware(datetime.combine(last, time())), **filters
+        ).aggregate(sessions=Count('id'), energy_consumed=Sum('energy_consumed', default=0), revenue=Sum('total_cost', default=0))
+
+    def assertMatchesSessions(self):
+        usage = StationUsage.objects.all()
+        self.assertEqual(usage.filter(period='day').count(), ChargingSession.objects.filter(status='completed').values('station', 'end_time__date').distinct().count())
+        for row in usage:
+            last = row.start + timedelta(days=1) if row.period == 'day' else row.start.replace(month=row.start.month + 1)
+            expected = self.direct(row.start, last, station=row.station_id)
+            self.assertEqual((row.sessions, row.energy_consumed, row.revenue), tuple(expected.values()), (row.station_id, row.period, row.start))
+        for row in RegionUsage.objects.all():
+            last = row.start + timedelta(days=1) if row.period == 'day' else row.start.replace(month=row.start.month + 1)
+            stations = [station.pk for station in self.stations if region_of(station.latitude, station.longitude) == row.region]
+            expected = self.direct(row.start, last, station__in=stations)
+            self.assertEqual((row.sessions, row.energy_consumed, row.revenue), tuple(expected.values()), (row.region, row.period, row.start))
+        self.assertEqual(RegionUsage.objects.values('region').distinct().count(), 2)
+
+    def test_refresh_matches_the_sessions(self):
+        self.add_sessions(120, seed=1)
+        self.assertMatchesSessions()
+        # A later batch recounts the days it touches on top of the earlier rows
+        self.add_sessions(40, seed=2)
+        self.assertMatchesSessions()
@@ -0,0 +1,226 @@
+"""
+Server-side station clusters for web map tiles.
+
+Stations are counted in the slippy map cells (Web Mercator, z/x/y) of every
+zoom level from 0 to CELL_MAX_ZOOM. A tile at zoom z is split into clusters
+by its 8x8 cells at zoom z + TILE_CLUSTER_DEPTH, so rendering one reads at
+most 64 rows whatever the number of stations below it.
+
+Changes reach the cells as deltas: the finest cell of a changed station is
+recounted and the difference is added to it and to each coarser cell above
+it, bumping their versions. Tiles are cached under their own cell's version,
+so a change replaces exactly the tiles it touches.
+
+Every operator has cells of its own, its map only clusters its stations.
+"""
+import itertools
+import math
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast
+
+from tasks.queue import enqueue_many
+from .models import ChargingStation, StationCell
+from .operators import operator_key
+
+TILE_CLUSTER_DEPTH = 3
+TILE_MAX_ZOOM = 12
+CELL_MAX_ZOOM = TILE_MAX_ZOOM + TILE_CLUSTER_DEPTH
+TILE_CACHE_SECONDS = 24 * 3600
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.05112878
+
+TOTALS = ['station_count', 'available_stations', 'available_ports', 'total_ports', 'latitude_sum', 'longitude_sum']
+EMPTY = (0, 0, 0, 0, 0.0, 0.0)
+
+
+def cell_xy(lat, lng, zoom):
+    """Tile column and row containing a point at zoom"""
+    lat = min(max(float(lat), -MAX_LATITUDE), MAX_LATITUDE)
+    size = 1 << zoom
+    x = int((float(lng) + 180) / 360 * size)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * size)
+    return min(max(x, 0), size - 1), min(max(y, 0), size - 1)
+
+
+def cell_key(x, y, zoom):
+    return x * (1 << zoom) + y
+
+
+def split_key(key, zoom):
+    return divmod(key, 1 << zoom)
+
+
+def grid_cell(lat, lng):
+    """Key of the finest cell a station is counted in"""
+    return cell_key(*cell_xy(lat, lng, CELL_MAX_ZOOM), CELL_MAX_ZOOM)
+
+
+def ancestors(key):
+    """(zoom, key) of a finest cell and every coarser cell containing it"""
+    x, y = split_key(key, CELL_MAX_ZOOM)
+    for zoom in range(CELL_MAX_ZOOM, -1, -1):
+        yield zoom, cell_key(x, y, zoom)
+        x >>= 1
+        y >>= 1
+
+
+def station_totals(queryset):
+    """Cell totals of the stations in queryset, keyed by grid_cell, in one GROUP BY"""
+    active = Q(status='active')
+    rows = queryset.exclude(grid_cell=None).order_by().values('grid_cell').annotate(
+        station_count=Count('id'),
+        available_stations=Count('id', filter=active & Q(available_ports__gt=0)),
+        available_ports=Sum('available_ports', filter=active, default=0),
+        total_ports=Sum('total_ports', filter=active, default=0),
+        latitude_sum=Sum(Cast('latitude', FloatField()), default=0.0),
+        longitude_sum=Sum(Cast('longitude', FloatField()), default=0.0),
+    )
+    return {row['grid_cell']: tuple(row[field] for field in TOTALS) for row in rows}
+
+
+def _changed(change):
+    # Sums of coordinates pick up float noise, only real moves count
+    return any(change[:4]) or abs(change[4]) > 1e-9 or abs(change[5]) > 1e-9
+
+
+def refresh_cells(cells):
+    """Recount finest cells, given as (operator id, key) pairs, and add the differences to every cell above them"""
+    keys = defaultdict(set)
+    for operator_id, key in cells:
+        keys[operator_id].add(key)
+    # Always in the same order, so concurrent workers cannot deadlock on the shared coarse cells
+    return sum(_refresh_operator_cells(operator_id, sorted(keys[operator_id])) for operator_id in sorted(keys))
+
+
+def _refresh_operator_cells(operator_id, keys):
+    paths = {key: list(ancestors(key)) for key in keys}
+    cells = StationCell.objects.filter(operator=operator_id)
+    with transaction.atomic():
+        # Every cell on the path has to exist before it can be locked or incremented.
+        # Rows are only removed by a rebuild, so an existing finest cell means its whole path exists.
+        existing = set(cells.filter(zoom=CELL_MAX_ZOOM, key__in=keys).values_list('key', flat=True))
+        missing = {cell for key, path in paths.items() if key not in existing for cell in path}
+        StationCell.objects.bulk_create([
+            StationCell(operator_id=operator_id, zoom=zoom, key=key, x=split_key(key, zoom)[0], y=split_key(key, zoom)[1])
+            for zoom, key in sorted(missing)
+        ], ignore_conflicts=True)
+        # Locking the finest rows serializes workers recounting the same cell
+        stored = {
+            cell.key: tuple(getattr(cell, field) for field in TOTALS)
+            for cell in cells.select_for_update().filter(zoom=CELL_MAX_ZOOM, key__in=keys).order_by('key')
+        }
+        actual = station_totals(ChargingStation.objects.filter(operator=operator_id, grid_cell__in=keys))
+
+        deltas = defaultdict(lambda: [0] * len(TOTALS))
+        for key in keys:
+            change = [now - before for now, before in zip(actual.get(key, EMPTY), stored[key])]
+            if not _changed(change):
+                continue
+            for cell in paths[key]:
+                total = deltas[cell]
+                for index, value in enumerate(change):
+                    total[index] += value
+        # Cells with the same delta share one UPDATE, a port taken or freed is the same change at every level
+        groups = defaultdict(list)
+        for (zoom, key), change in deltas.items():
+            groups[zoom, tuple(change)].append(key)
+        for (zoom, change), cell_keys in sorted(groups.items(), key=lambda item: (item[0][0], min(item[1]))):
+            for batch in _batches(sorted(cell_keys), 500):
+                cells.filter(zoom=zoom, key__in=batch).update(
+                    version=F('version') + 1, **{field: F(field) + value for field, value in zip(TOTALS, change)}
+                )
+    return len(deltas)
+
+
+def queue_cell_refresh(operator_id=None, cells=(), stations=()):
+    """Queue a recount of finest cells of an operator, or of the cells the given stations are in now"""
+    enqueue_many('stations.refresh_cells', [
+        (f'cells:{operator_id}:{cell}', {'operator': operator_id, 'cell': cell}) for cell in cells if cell is not None
+    ] + [
+        (f'cells:station:{station}', {'station': station}) for station in stations
+    ])
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def rebuild_cells(station_model=ChargingStation, cell_model=StationCell, batch_size=5000):
+    """Recount every cell from scratch, for existing data and after bulk imports that skip signals"""
+    # Stations created by bulk_create have no cell yet
+    missing = station_model.objects.filter(grid_cell=None).values_list('pk', 'latitude', 'longitude')
+    for batch in _batches(missing.iterator(chunk_size=batch_size), batch_size):
+        station_model.objects.bulk_update(
+            [station_model(pk=pk, grid_cell=grid_cell(lat, lng)) for pk, lat, lng in batch], ['grid_cell']
+        )
+
+    if any(field.name == 'operator' for field in cell_model._meta.fields):
+        scopes = [
+            {'operator_id': operator_id}
+            for operator_id in station_model.objects.order_by().values_list('operator', flat=True).distinct()
+        ]
+    else:
+        # Migration 0009 rebuilds with the models from before operators
+        scopes = [{}]
+
+    # A fresh base version keeps rebuilt tiles from matching ones cached before the rebuild
+    version = time.time_ns() // 1000
+    created = 0
+    with transaction.atomic():
+        cell_model.objects.all().delete()
+        for scope in scopes:
+            level = station_totals(station_model.objects.filter(**scope))
+            for zoom in range(CELL_MAX_ZOOM, -1, -1):
+                rows = (
+                    cell_model(**scope, zoom=zoom, key=key, x=split_key(key, zoom)[0], y=split_key(key, zoom)[1], version=version, **dict(zip(TOTALS, totals)))
+                    for key, totals in level.items()
+                )
+                for batch in _batches(rows, batch_size):
+                    cell_model.objects.bulk_create(batch)
+                    created += len(batch)
+                if zoom == 0:
+                    break
+                parents = defaultdict(lambda: [0] * len(TOTALS))
+                for key, totals in level.items():
+                    x, y = split_key(key, zoom)
+                    parent = parents[cell_key(x >> 1, y >> 1, zoom - 1)]
+                    for index, value in enumerate(totals):
+                        parent[index] += value
+                level = parents
+    return created
+
+
+def tile_clusters(operator_id, zoom, x, y):
+    """(version, body) of one tile of an operator's map, the body is cached under the version of the tile's own cell"""
+    version = StationCell.objects.filter(
+        operator=operator_id, zoom=zoom, key=cell_key(x, y, zoom)
+    ).values_list('version', flat=True).first()
+    if version is None:
+        return 0, {'zoom': zoom, 'x': x, 'y': y, 'count': 0, 'clusters': []}
+
+    cache_key = operator_key(operator_id, f'tiles:{zoom}:{x}:{y}:{version}')
+    data = cache.get(cache_key)
+    if data is None:
+        span = 1 << TILE_CLUSTER_DEPTH
+        cells = StationCell.objects.filter(
+            operator=operator_id, zoom=zoom + TILE_CLUSTER_DEPTH, x__range=(x * span, x * span + span - 1),
+            y__range=(y * span, y * span + span - 1), station_count__gt=0,
+        ).values_list(*TOTALS)
+        clusters = [{
+            'count': count,
+            'latitude': round(latitude_sum / count, 6),
+            'longitude': round(longitude_sum / count, 6),
+            'available_stations': available_stations,
+            'available_ports': available_ports,
+            'total_ports': total_ports,
+        } for count, available_stations, available_ports, total_ports, latitude_sum, longitude_sum in cells]
+        data = {'zoom': zoom, 'x': x, 'y': y, 'count': sum(cluster['count'] for cluster in clusters), 'clusters': clusters}
+        cache.set(cache_key, data, TILE_CACHE_SECONDS)
+    return version, data
@@ -1,12 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChargingStationViewSet, ChargingSessionViewSet, ReviewViewSet, FavoriteStationViewSet
+from .views import ChargingStationViewSet, ChargingSessionViewSet, ReviewViewSet, FavoriteStationViewSet, FleetViewSet, AnalyticsViewSet
 
 router = DefaultRouter()
 router.register(r'stations', ChargingStationViewSet)
 router.register(r'sessions', ChargingSessionViewSet, basename='session')
 router.register(r'reviews', ReviewViewSet)
 router.register(r'favorites', FavoriteStationViewSet, basename='favorite')
+router.register(r'fleet', FleetViewSet, basename='fleet')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,15 +1,44 @@
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import IntegrityError, router, transaction
 from django.db.models import Q
-import math
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from evspot.db.replicas import replica_safe
+from tasks.queue import enqueue
+from .filters import ChargingStationFilter
+from .exports import CSVRenderer, JSONLinesRenderer, SESSION_EXPORT_FIELDS, stream_csv, stream_jsonl
+from .fleet import ReservationConflict, fleet_dashboard, start_fleet_sessions, stop_fleet_sessions
+from .assignment import NoPortAvailable, assign_session, estimate_end_time, release_port, reserve_port
+from .events import event_log
 from .models import ChargingStation, ChargingSession, Review, FavoriteStation
 from .serializers import (
     ChargingStationSerializer, ChargingSessionSerializer, 
-    ReviewSerializer, FavoriteStationSerializer, NearbyStationsSerializer
+    ReviewSerializer, StationReviewSerializer, ModerationSerializer, FavoriteStationSerializer,
+    NearbyStationsSerializer, AssignmentRequestSerializer, FleetStartSerializer, FleetStopSerializer,
+    AnalyticsQuerySerializer
 )
+from .signals import session_started, session_finished, sessions_finished, sessions_started
+from .spatial import haversine_km, within_box
+from .amenities import count_facets, facet_counts, parse_facets
+from .analytics import daily_totals, network_totals, region_totals, station_ranking
+from .conditional import conditional_response, conditional_station_response
+from .favorites import request_favorite_ids
+from .idempotency import IDEMPOTENCY_HEADER, InvalidKey, claim_key, find_key, request_key, store_response
+from .operators import IsOperatorStaff, is_operator_staff
+from .pins import PinRenderer, pin_columns
+from .reviews import ReviewCursorPagination, decide, upsert_review
+from .sync import changes_since, cursor_expired, latest_snapshot, settled_cursor, snapshot_chunks
+from .tiles import TILE_MAX_ZOOM, tile_clusters
 
 
 class ChargingStationViewSet(viewsets.ModelViewSet):
@@ -17,14 +46,51 @@ class ChargingStationViewSet(viewsets.ModelViewSet):
     serializer_class = ChargingStationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['charging_type', 'status', 'power_output']
+    filterset_class = ChargingStationFilter
     search_fields = ['name', 'address', 'description']
-    ordering_fields = ['name', 'price_per_kwh', 'created_at']
+    ordering_fields = ['name', 'price_per_kwh', 'power_output', 'available_ports', 'created_at']
+    nearby_ordering_fields = ['distance', 'price_per_kwh', 'power_output', 'available_ports']
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [PinRenderer]
     
-    @action(detail=False, methods=['post'])
+    def get_queryset(self):
+        return ChargingStation.objects.filter(operator=self.request.operator)
+    
+    def perform_create(self, serializer):
+        serializer.save(operator=self.request.operator)
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.accepted_renderer.format == 'pins':
+            # Map clients get every matching station as columns instead of pages of full objects
+            return conditional_station_response(request, queryset, lambda: Response(pin_columns(queryset)))
+        facets = parse_facets(request.query_params.get('facets'))
+        
+        def respond():
+            response = super(ChargingStationViewSet, self).list(request, *args, **kwargs)
+            if facets:
+                # Counts cover every matching station, not just this page
+                response.data['facets'] = facet_counts(queryset, facets)
+            return response
+        
+        return conditional_station_response(request, queryset, respond)
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = ChargingStation._meta.pk.to_python(kwargs['pk'])
+        except ValidationError:
+            raise Http404
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk=pk)
+        return conditional_station_response(request, queryset, lambda: super(ChargingStationViewSet, self).retrieve(request, *args, **kwargs))
+    
+    @action(detail=False, methods=['get', 'post'])
+    @replica_safe
     def nearby(self, request):
+        # Filters such as ?amenities=wifi,restrooms narrow the search, invalid ones are a 400 from the filter backend
+        active = self.filter_queryset(self.get_queryset().filter(status='active'))
+        facets = parse_facets(request.query_params.get('facets'))
         try:
-            serializer = NearbyStationsSerializer(data=request.data)
+            # GET reads the query string, so clients can repeat it with If-None-Match
+            serializer = NearbyStationsSerializer(data=request.query_params if request.method == 'GET' else request.data)
             if serializer.is_valid():
                 lat = serializer.validated_data['latitude']
                 lng = serializer.validated_data['longitude']
@@ -37,79 +103,228 @@ class ChargingStationViewSet(viewsets.ModelViewSet):
                 if radius <= 0 or radius > 100:  # Max 100km radius
                     return Response({'error': 'Invalid radius (must be between 0 and 100 km)'}, status=status.HTTP_400_BAD_REQUEST)
                 
-                # Simple distance calculation (Haversine formula)
-                stations = []
-                for station in ChargingStation.objects.filter(status='active'):
-                    distance = self.calculate_distance(lat, lng, station.latitude, station.longitude)
-                    if distance <= radius:
+                # Results are sorted after the distance check, the database need not order them
+                candidates = within_box(active, lat, lng, radius).order_by()
+                
+                def respond():
+                    if request.accepted_renderer.format == 'pins':
+                        return Response(pin_columns(candidates, origin=(lat, lng), radius=radius))
+                    
+                    # Simple distance calculation (Haversine formula)
+                    found = []
+                    for station in candidates:
+                        distance = self.calculate_distance(lat, lng, station.latitude, station.longitude)
+                        if distance <= radius:
+                            found.append((station, distance))
+                    
+                    # Sort by distance unless ?ordering= asks otherwise, distance still breaks ties
+                    found.sort(key=self.nearby_sort_key(request))
+                    stations = []
+                    for station, distance in found:
                         station_data = ChargingStationSerializer(station, context={'request': request}).data
                         station_data['distance'] = round(distance, 2)
                         stations.append(station_data)
+                    if facets:
+                        return Response({'results': stations, 'facets': count_facets([station for station, _ in found], facets)})
+                    return Response(stations)
                 
-                # Sort by distance
-                stations.sort(key=lambda x: x['distance'])
-                return Response(stations)
+                if request.method == 'GET':
+                    # The stations in the box determine the body, so their version can stand in for it
+                    return conditional_station_response(request, candidates, respond)
+                return respond()
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': 'An error occurred while fetching nearby stations'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def calculate_distance(self, lat1, lng1, lat2, lng2):
-        """Calculate distance between two points using Haversine formula"""
-        R = 6371  # Earth's radius in kilometers
+    @action(detail=False, methods=['get'], url_path=r'tiles/(?P<z>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)')
+    def tiles(self, request, z, x, y):
+        """Station clusters of one web map tile (z/x/y) for zoomed-out views"""
+        z, x, y = int(z), int(x), int(y)
+        if z > TILE_MAX_ZOOM:
+            return Response({'error': f'Tiles go up to zoom {TILE_MAX_ZOOM}, use nearby for closer views'}, status=status.HTTP_400_BAD_REQUEST)
+        if x >= 1 << z or y >= 1 << z:
+            return Response({'error': 'Invalid tile'}, status=status.HTTP_400_BAD_REQUEST)
         
-        lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
+        version, data = tile_clusters(request.operator.pk, z, x, y)
+        # Clusters are the same for every user of the operator, the cell version identifies them
+        etag = f'W/"tile-{request.operator.pk}-{z}-{x}-{y}-{version}-{request.accepted_renderer.format}"'
+        return conditional_response(request, etag, lambda: Response(data), private=False)
+    
+    @action(detail=True, methods=['get', 'post'])
+    def reviews(self, request, pk=None):
+        """Published reviews of this station newest first (?cursor= pages), POST writes or replaces the user's own"""
+        station = self.get_object()
+        if request.method == 'POST':
+            serializer = StationReviewSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            review, created = upsert_review(request.user, station, **serializer.validated_data)
+            return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
         
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        distance = R * c
+        reviews = Review.objects.filter(station=station, status='published').select_related('user', 'station')
+        paginator = ReviewCursorPagination()
+        # The station ordering filter does not apply, reviews always page by recency
+        page = paginator.paginate_queryset(reviews, request)
+        return paginator.get_paginated_response(ReviewSerializer(page, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Stations changed since ?since=<cursor> as compact rows, without since or past the log a snapshot of every station to start from"""
+        since = request.query_params.get('since')
+        if since is not None and not since.isdigit():
+            return Response({'error': 'since must be a cursor returned by an earlier sync'}, status=status.HTTP_400_BAD_REQUEST)
+        if since is not None and not cursor_expired(int(since)):
+            return Response(changes_since(request.operator.pk, int(since)))
+        snapshot = latest_snapshot(request.operator)
+        if snapshot:
+            # Snapshot files never change, the web server or a CDN caches them
+            return HttpResponseRedirect(default_storage.url(snapshot))
+        return StreamingHttpResponse(
+            snapshot_chunks(request.operator.pk, settled_cursor(request.operator.pk)), content_type='application/json'
+        )
+    
+    def nearby_sort_key(self, request):
+        """Sort key for (station, distance) pairs from ?ordering=, e.g. price_per_kwh,-power_output"""
+        terms = []
+        for term in request.query_params.get('ordering', '').split(','):
+            field = term.strip().lstrip('-')
+            if field in self.nearby_ordering_fields:
+                terms.append((field, -1 if term.strip().startswith('-') else 1))
+        if ('distance', 1) not in terms and ('distance', -1) not in terms:
+            terms.append(('distance', 1))
         
-        return distance
+        def key(item):
+            station, distance = item
+            return tuple(sign * (distance if field == 'distance' else getattr(station, field)) for field, sign in terms)
+        return key
+    
+    def calculate_distance(self, lat1, lng1, lat2, lng2):
+        """Calculate distance between two points using Haversine formula"""
+        return haversine_km(lat1, lng1, lat2, lng2)
+    
+    def _replay(self, stored, action, station):
+        """The response first given for an idempotency key, 422 when the key came with another request"""
+        if stored is None:
+            # The duplicate that claimed the key rolled back after all
+            return Response({'error': 'Please retry'}, status=status.HTTP_409_CONFLICT)
+        if stored.action != action or stored.session.station_id != station.pk:
+            return Response({'error': f'{IDEMPOTENCY_HEADER} was already used for another request'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        data = stored.response if stored.response is not None else ChargingSessionSerializer(stored.session).data
+        return Response(data, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
     
     @action(detail=True, methods=['post'])
     def start_charging(self, request, pk=None):
+        key = None
         try:
             station = self.get_object()
-            if not station.is_available:
-                return Response({'error': 'Station is not available'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Check if user already has an active session
-            active_session = ChargingSession.objects.filter(user=request.user, status='active').first()
-            if active_session:
-                return Response({'error': 'You already have an active charging session'}, status=status.HTTP_400_BAD_REQUEST)
+            key = request_key(request)
             
-            # Create new charging session
-            session = ChargingSession.objects.create(user=request.user, station=station)
-            station.available_ports -= 1
-            station.save()
+            # Reserve a port and create the session together. A retry finds the key before
+            # the checks, which the first request's session and reservation would now fail.
+            with transaction.atomic():
+                stored = key and find_key(request.user, key)
+                if stored:
+                    return self._replay(stored, 'start_charging', station)
+                if not station.is_available:
+                    return Response({'error': 'Station is not available'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                # Check if user already has an active session, fleet vehicles are tracked separately
+                if ChargingSession.objects.filter(user=request.user, vehicle__isnull=True, status='active').exists():
+                    return Response({'error': 'You already have an active charging session'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                if not reserve_port(station.pk):
+                    return Response({'error': 'Station is not available'}, status=status.HTTP_400_BAD_REQUEST)
+                session = ChargingSession.objects.create(
+                    user=request.user, station=station,
+                    expected_end_time=estimate_end_time(station.power_output),
+                    price_per_kwh=station.effective_price_per_kwh
+                )
+                event_log.sessions_started([session])
+                stored = key and claim_key(request.user, key, 'start_charging', session, status.HTTP_201_CREATED)
+            session_started.send(sender=ChargingSession, session=session)
             
-            serializer = ChargingSessionSerializer(session)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            data = ChargingSessionSerializer(session).data
+            if stored:
+                store_response(stored, data)
+            return Response(data, status=status.HTTP_201_CREATED)
+        except InvalidKey as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            if key is None:
+                return Response({'error': 'An error occurred while starting charging session'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # A concurrent duplicate claimed the key first, this transaction rolled back
+            return self._replay(find_key(request.user, key), 'start_charging', station)
         except Exception as e:
             return Response({'error': 'An error occurred while starting charging session'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=True, methods=['post'])
     def stop_charging(self, request, pk=None):
+        key = None
         try:
             station = self.get_object()
-            session = ChargingSession.objects.filter(user=request.user, station=station, status='active').first()
+            key = request_key(request)
             
-            if not session:
-                return Response({'error': 'No active charging session found'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Update session
-            session.status = 'completed'
-            session.save()
-            
-            # Update station availability
-            station.available_ports += 1
-            station.save()
+            # Update session and station availability
+            with transaction.atomic():
+                stored = key and find_key(request.user, key)
+                if stored:
+                    return self._replay(stored, 'stop_charging', station)
+                # Locked, so of two concurrent stops only one finds the session active and frees its port
+                session = ChargingSession.objects.select_for_update().filter(
+                    user=request.user, station=station, vehicle__isnull=True, status='active'
+                ).first()
+                if not session:
+                    return Response({'error': 'No active charging session found'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                session.finish(timezone.now())
+                session.save()
+                release_port(station.pk)
+                event_log.sessions_stopped([session])
+                # Billing happens in the background, the task commits or rolls back with the stop
+                enqueue('stations.finalize_sessions', {'session': session.pk}, key=f'finalize:{session.pk}')
+                stored = key and claim_key(request.user, key, 'stop_charging', session, status.HTTP_200_OK)
+            session_finished.send(sender=ChargingSession, session=session)
             
-            serializer = ChargingSessionSerializer(session)
-            return Response(serializer.data)
+            data = ChargingSessionSerializer(session).data
+            if stored:
+                store_response(stored, data)
+            return Response(data)
+        except InvalidKey as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            if key is None:
+                return Response({'error': 'An error occurred while stopping charging session'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # A concurrent duplicate claimed the key first, this transaction rolled back
+            return self._replay(find_key(request.user, key), 'stop_charging', station)
         except Exception as e:
             return Response({'error': 'An error occurred while stopping charging session'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def assign(self, request, pk=None):
+        """Start a session on the best port at this station or one of its nearest neighbours"""
+        station = self.get_object()
+        serializer = AssignmentRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        if ChargingSession.objects.filter(user=request.user, vehicle__isnull=True, status='active').exists():
+            return Response({'error': 'You already have an active charging session'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            session, candidate = assign_session(request.user, station.operator_id, station.pk, **serializer.validated_data)
+        except NoPortAvailable as e:
+            data = {'error': 'No charging port is available nearby'}
+            if e.candidates:
+                earliest = min(e.candidates, key=lambda c: c.finish_at)
+                data['next_available_station'] = earliest.station_id
+                data['estimated_wait_minutes'] = round(earliest.wait_seconds / 60)
+            return Response(data, status=status.HTTP_409_CONFLICT)
+        session_started.send(sender=ChargingSession, session=session)
+        
+        data = ChargingSessionSerializer(session).data
+        data['distance'] = round(candidate.distance, 2)
+        data['estimated_wait_minutes'] = round(candidate.wait_seconds / 60)
+        return Response(data, status=status.HTTP_201_CREATED)
 
 
 class ChargingSessionViewSet(viewsets.ModelViewSet):
@@ -117,7 +332,92 @@ class ChargingSessionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return ChargingSession.objects.filter(user=self.request.user)
+        return ChargingSession.objects.filter(
+            user=self.request.user, station__operator=self.request.operator
+        ).select_related('station', 'user')
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action == 'export' and isinstance(response, Response) and response.status_code >= 400:
+            # Errors, including authentication and permission ones, are JSON whatever format the export was asked in
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+        return response
+    
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, JSONLinesRenderer])
+    def export(self, request):
+        """Stream the user's full session history as CSV or JSON lines (?format=csv|jsonl)"""
+        bounds = {}
+        for param, lookup in (('start', 'start_time__gte'), ('end', 'start_time__lt')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            parsed = parse_datetime(value)
+            if parsed is None and parse_date(value) is not None:
+                parsed = datetime.combine(parse_date(value), time.min)
+            if parsed is None:
+                return Response({'error': f'Invalid {param} date'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            bounds[lookup] = parsed
+        
+        # Served by the (user, start_time) index, fetched in chunks so memory stays flat.
+        # The body streams after the request has finished routing, so pick the database now.
+        rows = ChargingSession.objects.using(router.db_for_read(ChargingSession)).filter(
+            user=request.user, station__operator=request.operator, **bounds
+        ).order_by('start_time').values_list(
+            *SESSION_EXPORT_FIELDS
+        ).iterator(chunk_size=2000)
+        
+        if request.accepted_renderer.format == 'jsonl':
+            response = StreamingHttpResponse(stream_jsonl(rows), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="sessions.{request.accepted_renderer.format}"'
+        return response
+
+
+class FleetViewSet(viewsets.ViewSet):
+    """Batched session control for accounts that charge many vehicles"""
+    permission_classes = [IsAuthenticated]
+    
+    def _failures(self, failures):
+        return [{'vehicle': vehicle_id, 'error': error} for vehicle_id, error in failures]
+    
+    @action(detail=False, methods=['post'])
+    def start(self, request):
+        serializer = FleetStartSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        pairs = [(item['vehicle'], item['station']) for item in serializer.validated_data['sessions']]
+        try:
+            sessions, failures = start_fleet_sessions(request.user, pairs, request.operator)
+        except ReservationConflict:
+            return Response({'error': 'Station availability changed, please retry'}, status=status.HTTP_409_CONFLICT)
+        
+        sessions_started.send(sender=ChargingSession, sessions=sessions)
+        return Response({
+            'started': ChargingSessionSerializer(sessions, many=True).data,
+            'failed': self._failures(failures),
+        }, status=status.HTTP_201_CREATED if sessions else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def stop(self, request):
+        serializer = FleetStopSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        sessions, failures = stop_fleet_sessions(request.user, serializer.validated_data['vehicles'], request.operator)
+        sessions_finished.send(sender=ChargingSession, sessions=sessions)
+        return Response({
+            'stopped': ChargingSessionSerializer(sessions, many=True).data,
+            'failed': self._failures(failures),
+        }, status=status.HTTP_200_OK if sessions else status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        return Response(fleet_dashboard(request.user, request.operator))
 
 
 class ReviewViewSet(viewsets.ModelViewSet):
@@ -125,8 +425,43 @@ class ReviewViewSet(viewsets.ModelViewSet):
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+    def get_queryset(self):
+        reviews = Review.objects.filter(station__operator=self.request.operator).select_related('user', 'station')
+        if is_operator_staff(self.request.user, self.request.operator):
+            return reviews
+        if self.request.method not in SAFE_METHODS:
+            # Users edit and delete only their own reviews
+            return reviews.filter(user=self.request.user)
+        if self.request.user.is_authenticated:
+            return reviews.filter(Q(status='published') | Q(user=self.request.user))
+        return reviews.filter(status='published')
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Reviewing a station again replaces the earlier review instead of hitting the unique constraint
+        review, created = upsert_review(request.user, **serializer.validated_data)
+        return Response(self.get_serializer(review).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    def perform_update(self, serializer):
+        # Edited text is screened again before it is listed, and a review stays with its station
+        serializer.save(status='pending', station=serializer.instance.station)
+    
+    @action(detail=False, methods=['get', 'post'], permission_classes=[IsOperatorStaff])
+    def moderation(self, request):
+        """Reviews held by the automatic check oldest first, POST {"publish": [ids], "reject": [ids]} decides many at once"""
+        if request.method == 'POST':
+            serializer = ModerationSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'published': decide(self.get_queryset().filter(pk__in=serializer.validated_data['publish']), 'published'),
+                'rejected': decide(self.get_queryset().filter(pk__in=serializer.validated_data['reject']), 'rejected'),
+            })
+        
+        held = self.get_queryset().filter(status='held').order_by('created_at')
+        page = self.paginate_queryset(held)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
 class FavoriteStationViewSet(viewsets.ModelViewSet):
@@ -134,7 +469,55 @@ class FavoriteStationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return FavoriteStation.objects.filter(user=self.request.user)
+        # Stations come in the same query, their rating rollup is stored on the row
+        return FavoriteStation.objects.filter(
+            user=self.request.user, station__operator=self.request.operator
+        ).select_related('station').order_by('-created_at', '-id')
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user) 
\ No newline at end of file
+        serializer.save(user=self.request.user)
+    
+    @action(detail=False, methods=['get'])
+    def ids(self, request):
+        """Ids of all the user's favorite stations, for marking map pins without fetching the stations"""
+        return Response({'ids': sorted(request_favorite_ids(request))}) 
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Sessions, energy and revenue of the request's operator, read from the materialized usage rows (?start=&end= dates, last 30 days by default)"""
+    permission_classes = [IsOperatorStaff]
+    
+    def list(self, request):
+        """Network totals"""
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        return Response({'start': query['start'], 'end': query['end'], **network_totals(request.operator.pk, query['start'], query['end'])})
+    
+    @action(detail=False, methods=['get'])
+    def stations(self, request):
+        """Top stations by ?ordering=sessions|energy_consumed|revenue"""
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        return Response(station_ranking(request.operator.pk, query['start'], query['end'], query['ordering'], query['limit']))
+    
+    @action(detail=False, methods=['get'])
+    def regions(self, request):
+        """Totals per region map cell, top ones first"""
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        return Response(region_totals(request.operator.pk, query['start'], query['end'], query['ordering'], query['limit']))
+    
+    @action(detail=False, methods=['get'])
+    def days(self, request):
+        """Totals per day of the network, or of one ?station= or ?region="""
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = serializer.validated_data
+        return Response(daily_totals(request.operator.pk, query['start'], query['end'], query.get('station'), query.get('region')))
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from evspot.admin import LargeTableAdmin
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['key']
+    readonly_fields = ['created_at', 'finished_at', 'claimed_by', 'claimed_at']
@@ -0,0 +1,54 @@
+import time
+
+from django.db import connection
+
+from evspot.benchmarks import benchmark, rate, timed
+from .models import Task
+from .queue import Worker, enqueue, enqueue_many, task
+
+handled = []
+
+
+@task('bench.single')
+def single_task(n):
+    handled.append(n)
+
+
+@task('bench.batched', batch=500)
+def batched_task(payloads):
+    handled.extend(payload['n'] for payload in payloads)
+
+
+@benchmark('tasks', scale=20000, iterations=2000)
+def tasks_benchmark(scale, iterations):
+    """Enqueue latency and worker drain rate on the configured database"""
+    results = {'database': connection.vendor}
+
+    start = time.perf_counter()
+    for n in range(iterations):
+        enqueue('bench.single', {'n': n})
+    results['enqueue mean ms'] = (time.perf_counter() - start) / iterations * 1000
+
+    # Every key repeats a hundred times, duplicates of a queued task are dropped by the insert
+    with timed(results, 'keyed enqueue seconds'):
+        for n in range(iterations):
+            enqueue('bench.single', {'n': n}, key=f'bench:{n % (iterations // 100 or 1)}')
+    results['tasks kept from keyed enqueues'] = Task.objects.filter(key__startswith='bench:').count()
+
+    with timed(results, 'enqueue_many seconds'):
+        for offset in range(0, scale, 1000):
+            enqueue_many('bench.batched', [(None, {'n': n}) for n in range(offset, min(offset + 1000, scale))])
+    results['enqueue_many tasks per second'] = rate(scale, results['enqueue_many seconds'])
+
+    worker = Worker(prefetch=500)
+    Task.objects.filter(name='bench.batched').update(status='done')
+    with timed(results, 'single drain seconds'):
+        single = worker.drain()
+    results['single drain tasks per second'] = rate(single, results['single drain seconds'])
+
+    Task.objects.filter(name='bench.batched').update(status='queued')
+    with timed(results, 'batched drain seconds'):
+        batched = worker.drain()
+    results['batched drain tasks per second'] = rate(batched, results['batched drain seconds'])
+    results['handled'] = len(handled)
+    return results
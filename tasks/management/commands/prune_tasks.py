@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from tasks.queue import prune_tasks
+
+
+class Command(BaseCommand):
+    help = 'Delete done and failed tasks past TASK_DONE_RETENTION_DAYS and TASK_FAILED_RETENTION_DAYS, run periodically from cron'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Removed {prune_tasks()} finished tasks'))
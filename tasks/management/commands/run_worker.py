@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from tasks.queue import Worker
+
+
+def _work(prefetch, poll_interval, claim_timeout, once):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    worker = Worker(prefetch=prefetch, claim_timeout=claim_timeout)
+    last_reclaim = 0
+    # A signal lets the current batch finish before the process exits
+    while not stopping:
+        if time.monotonic() - last_reclaim > claim_timeout:
+            worker.requeue_stale()
+            # Finished tasks past their retention would otherwise pile up in the queue table
+            worker.prune()
+            last_reclaim = time.monotonic()
+        if not worker.run_once():
+            if once:
+                break
+            time.sleep(poll_interval)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--prefetch', type=int, default=100, help='Tasks claimed per round trip')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--claim-timeout', type=int, default=300, help='Seconds before a running task counts as abandoned')
+        parser.add_argument('--once', action='store_true', help='Exit when no task is ready instead of polling')
+
+    def handle(self, *args, **options):
+        work_args = (options['prefetch'], options['poll_interval'], options['claim_timeout'], options['once'])
+        if options['processes'] == 1:
+            _work(*work_args)
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+        workers = []
+        for _ in range(options['processes']):
+            process = context.Process(target=_work, args=work_args)
+            process.start()
+            workers.append(process)
+        self.stdout.write(f'Started {len(workers)} workers')
+
+        while not stopping and any(process.is_alive() for process in workers):
+            for index, process in enumerate(workers):
+                if not process.is_alive() and process.exitcode != 0 and not options['once']:
+                    # Replace a worker that crashed
+                    self.stderr.write(f'Worker {process.pid} exited with {process.exitcode}, restarting')
+                    workers[index] = context.Process(target=_work, args=work_args)
+                    workers[index].start()
+            time.sleep(1)
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join()
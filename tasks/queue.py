@@ -0,0 +1,172 @@
+"""
+A small task queue backed by the Task table.
+
+Apps register handlers in their tasks.py with @task and request work with
+enqueue(). Workers started by `manage.py run_worker` claim ready tasks with
+a guarded UPDATE, which works the same on SQLite and PostgreSQL.
+"""
+import logging
+import traceback
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+Handler = namedtuple('Handler', ['func', 'batch', 'max_attempts'])
+
+registry = {}
+
+
+def task(name, batch=None, max_attempts=5):
+    """
+    Register func as the handler for tasks called name.
+
+    Plain handlers are called as func(**payload). With batch=N the handler
+    gets a list of up to N payloads instead, so similar work queued by many
+    requests is done in one pass.
+    """
+    def decorator(func):
+        registry[name] = Handler(func, batch, max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Queue one task, a queued task with the same key absorbs it"""
+    enqueue_many(name, [(key, payload or {})], delay)
+
+
+def enqueue_many(name, items, delay=0):
+    """Queue (key, payload) pairs with a single INSERT, keys may be None"""
+    if name not in registry:
+        raise KeyError(f'No task handler registered for "{name}"')
+    if getattr(settings, 'TASKS_EAGER', False):
+        # Run in-process once the caller's transaction commits, used by tests and benchmarks
+        payloads = [payload for _, payload in items]
+        transaction.on_commit(lambda: _call(registry[name], payloads))
+        return
+    run_after = timezone.now() + timedelta(seconds=delay)
+    max_attempts = registry[name].max_attempts
+    # The partial unique index on key turns duplicates into no-ops
+    Task.objects.bulk_create([
+        Task(name=name, payload=payload, key=key, run_after=run_after, max_attempts=max_attempts)
+        for key, payload in items
+    ], ignore_conflicts=True)
+
+
+def _call(handler, payloads):
+    if handler.batch:
+        for start in range(0, len(payloads), handler.batch):
+            handler.func(payloads[start:start + handler.batch])
+    else:
+        for payload in payloads:
+            handler.func(**payload)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+class Worker:
+    """Claims ready tasks of one name at a time and runs them"""
+
+    def __init__(self, prefetch=100, claim_timeout=300):
+        self.prefetch = prefetch
+        self.claim_timeout = claim_timeout
+
+    def claim(self):
+        now = timezone.now()
+        ready = list(Task.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id').values_list(
+            'id', 'name'
+        )[:self.prefetch])
+        if not ready:
+            return []
+        # Take the oldest task's name and every ready task of the same name, so batches stay homogeneous
+        name = ready[0][1]
+        token = uuid.uuid4().hex
+        Task.objects.filter(pk__in=[pk for pk, task_name in ready if task_name == name], status='queued').update(
+            status='running', claimed_by=token, claimed_at=now, attempts=F('attempts') + 1
+        )
+        return list(Task.objects.filter(claimed_by=token, status='running').order_by('id'))
+
+    def run_once(self):
+        """Claim and run one batch, returns how many tasks it handled"""
+        tasks = self.claim()
+        if not tasks:
+            return 0
+        handler = registry.get(tasks[0].name)
+        if handler is None:
+            self._failed(tasks, f'No task handler registered for "{tasks[0].name}"', retry=False)
+            return len(tasks)
+
+        done = []
+        groups = [tasks[i:i + handler.batch] for i in range(0, len(tasks), handler.batch)] if handler.batch else [[t] for t in tasks]
+        for group in groups:
+            try:
+                with transaction.atomic():
+                    _call(handler, [t.payload for t in group])
+            except Exception:
+                logger.exception('Task %s failed', group[0].name)
+                self._failed(group, traceback.format_exc())
+            else:
+                done.extend(t.pk for t in group)
+        Task.objects.filter(pk__in=done).update(status='done', finished_at=timezone.now())
+        return len(tasks)
+
+    def _failed(self, tasks, error, retry=True):
+        now = timezone.now()
+        for t in tasks:
+            if retry and t.attempts < t.max_attempts:
+                try:
+                    Task.objects.filter(pk=t.pk).update(status='queued', run_after=now + backoff(t.attempts), last_error=error)
+                    continue
+                except IntegrityError:
+                    # A newer task with the same key is already queued and will do the work
+                    error = f'Superseded by a newer task with key {t.key}\n{error}'
+            Task.objects.filter(pk=t.pk).update(status='failed', finished_at=now, last_error=error)
+
+    def requeue_stale(self):
+        """Put back tasks whose worker died while running them"""
+        cutoff = timezone.now() - timedelta(seconds=self.claim_timeout)
+        stale = list(Task.objects.filter(status='running', claimed_at__lt=cutoff))
+        if stale:
+            self._failed(stale, 'Worker stopped before finishing the task')
+        return len(stale)
+
+    def prune(self, batch_size=5000):
+        """Delete finished tasks past their retention, returns how many"""
+        return prune_tasks(batch_size)
+
+    def drain(self):
+        """Run until no task is ready, returns how many were handled"""
+        total = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return total
+            total += count
+
+
+def prune_tasks(batch_size=5000):
+    """
+    Delete done tasks older than TASK_DONE_RETENTION_DAYS and failed ones older
+    than TASK_FAILED_RETENTION_DAYS, batch_size rows per statement, returns how many.
+    """
+    now = timezone.now()
+    removed = 0
+    for status, setting, days in (('done', 'TASK_DONE_RETENTION_DAYS', 7), ('failed', 'TASK_FAILED_RETENTION_DAYS', 30)):
+        before = now - timedelta(days=getattr(settings, setting, days))
+        while True:
+            batch = list(Task.objects.filter(status=status, finished_at__lt=before).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            removed += Task.objects.filter(pk__in=batch).delete()[0]
+    return removed
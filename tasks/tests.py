@@ -0,0 +1,33 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import prune_tasks
+
+
+@override_settings(TASK_DONE_RETENTION_DAYS=7, TASK_FAILED_RETENTION_DAYS=30)
+class PruneTasksTests(TestCase):
+    def make_task(self, status, days_ago=None):
+        finished_at = timezone.now() - timedelta(days=days_ago) if days_ago is not None else None
+        return Task.objects.create(name='noop', status=status, finished_at=finished_at)
+
+    def test_only_finished_tasks_past_retention_are_removed(self):
+        kept = [
+            self.make_task('queued'), self.make_task('running'),
+            self.make_task('done', 6), self.make_task('failed', 8), self.make_task('failed', 29),
+        ]
+        self.make_task('done', 8)
+        self.make_task('failed', 31)
+        self.assertEqual(prune_tasks(batch_size=1), 2)
+        self.assertQuerysetEqual(Task.objects.order_by('pk'), [task.pk for task in kept], transform=lambda task: task.pk)
+
+    def test_command_reports_removed_tasks(self):
+        self.make_task('done', 10)
+        out = StringIO()
+        call_command('prune_tasks', stdout=out)
+        self.assertIn('Removed 1 finished tasks', out.getvalue())
+        self.assertFalse(Task.objects.exists())
@@ -1,5 +1,18 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, Vehicle
 
-admin.site.register(CustomUser, UserAdmin) 
\ No newline at end of file
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    # Staff tied to an operator only manage its data through the API
+    fieldsets = UserAdmin.fieldsets + (('Operator', {'fields': ['operator']}),)
+    list_filter = UserAdmin.list_filter + ('operator',)
+
+
+@admin.register(Vehicle)
+class VehicleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'owner', 'model', 'battery_capacity_kwh', 'connector']
+    list_filter = ['connector']
+    search_fields = ['name', 'license_plate', 'owner__username']
+    raw_id_fields = ['owner']
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db.models import F
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+User = get_user_model()
+
+ACCESS_SALT = 'users.token.access'
+REFRESH_SALT = 'users.token.refresh'
+if settings.DEFAULT_OPERATOR in settings.OPERATOR_DATABASES:
+    # User ids restart in an operator's own database, tokens of the shared deployment must not pass there
+    ACCESS_SALT += f'.{settings.DEFAULT_OPERATOR}'
+    REFRESH_SALT += f'.{settings.DEFAULT_OPERATOR}'
+
+
+def _lifetime(name):
+    return int(getattr(settings, name).total_seconds())
+
+
+def token_stamp(user):
+    """Changes when the user's password changes or their tokens are revoked, which retires every token issued before"""
+    return f'{user.token_version}.{user.get_session_auth_hash()[:12]}'
+
+
+def issue_tokens(user, auth_time=None):
+    """
+    Return a fresh pair of HMAC-signed access and refresh tokens for user.
+
+    auth_time is when the user logged in, kept through refreshes so a chain
+    of refresh tokens ends REFRESH_TOKEN_LIFETIME after the login.
+    """
+    auth_time = int(time.time()) if auth_time is None else auth_time
+    payload = {'uid': user.pk, 'stamp': token_stamp(user)}
+    return {
+        'token': signing.dumps(payload, salt=ACCESS_SALT),
+        'refresh': signing.dumps({**payload, 'auth': auth_time}, salt=REFRESH_SALT),
+        'expires_in': _lifetime('ACCESS_TOKEN_LIFETIME'),
+    }
+
+
+def read_token(token, salt, lifetime_setting):
+    """Return the payload of a valid token, or raise AuthenticationFailed"""
+    try:
+        return signing.loads(token, salt=salt, max_age=_lifetime(lifetime_setting))
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed('Token has expired')
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed('Invalid token')
+
+
+def check_stamp(user, payload):
+    if payload.get('stamp') != token_stamp(user):
+        raise exceptions.AuthenticationFailed('Token has been revoked')
+
+
+def revoke_tokens(user):
+    """Retire every access and refresh token issued to user so far"""
+    User.objects.filter(pk=user.pk).update(token_version=F('token_version') + 1)
+    principal_cache.discard(user.pk)
+
+
+class PrincipalCache:
+    """Small per-process LRU of active users keyed by id, entries expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.pk] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(
+    maxsize=getattr(settings, 'PRINCIPAL_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'PRINCIPAL_CACHE_TTL', 300),
+)
+
+
+def get_principal(payload):
+    """The active user an access token payload was issued to, from the cache when warm"""
+    user = principal_cache.get(payload['uid'])
+    if user is None:
+        user = User.objects.filter(pk=payload['uid'], is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User inactive or deleted')
+        principal_cache.put(user)
+    # Other processes see a revocation once their cached copy of the user expires
+    check_stamp(user, payload)
+    return user
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authorization: Bearer <access token>
+
+    Tokens are verified by signature and the user's token stamp, and users
+    come from the principal cache, so a warm request needs no database
+    queries to authenticate.
+    """
+    keyword = b'bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header')
+        return get_principal(read_token(token, ACCESS_SALT, 'ACCESS_TOKEN_LIFETIME')), None
+
+    def authenticate_header(self, request):
+        return 'Bearer'
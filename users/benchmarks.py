@@ -0,0 +1,79 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from evspot.benchmarks import benchmark, rate
+from stations.benchmarks import create_users
+from .authentication import issue_tokens, principal_cache
+from .models import CustomUser
+
+
+def _requests(client, iterations, before=None):
+    start = time.perf_counter()
+    for i in range(iterations):
+        if before:
+            before(i)
+        client.get('/api/sessions/')
+    return rate(iterations, time.perf_counter() - start)
+
+
+@benchmark('auth', scale=200, iterations=2000)
+def auth_benchmark(scale, iterations):
+    """The same authenticated GET through a Django session and through bearer tokens"""
+    users = create_users(scale, prefix='auth')
+    results = {}
+
+    # Session cookies cost a session row and a user row on every request
+    client = APIClient()
+    client.force_login(users[0])
+    results['session requests per second'] = _requests(client, iterations)
+    with CaptureQueriesContext(connection) as session_queries:
+        client.get('/api/sessions/')
+    results['session queries per request'] = len(session_queries)
+
+    tokens = [issue_tokens(user)['token'] for user in users]
+    client = APIClient()
+
+    def rotate(i):
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens[i % scale]}')
+
+    principal_cache.clear()
+    results['cold bearer requests per second'] = _requests(client, scale, rotate)
+    results['warm bearer requests per second'] = _requests(client, iterations, rotate)
+    with CaptureQueriesContext(connection) as bearer_queries:
+        client.get('/api/sessions/')
+    results['warm bearer queries per request'] = len(bearer_queries)
+    return results
+
+
+@benchmark('login', scale=2, iterations=100)
+def login_benchmark(scale, iterations):
+    """Credential stuffing from scale IPs, with and without the login throttle"""
+    password = make_password('correct horse')
+    CustomUser.objects.bulk_create([CustomUser(username=f'victim{i}', password=password) for i in range(iterations)])
+    results = {}
+    client = APIClient()
+    unlimited = {'WINDOW': 300, 'IP_LIMIT': 10 ** 9, 'USERNAME_LIMIT': 10 ** 9}
+    limited = {'WINDOW': 300, 'IP_LIMIT': 20, 'USERNAME_LIMIT': 5}
+    for label, config in (('unthrottled', unlimited), ('throttled', limited)):
+        with override_settings(LOGIN_THROTTLE=config):
+            statuses = {}
+            start = time.perf_counter()
+            for i in range(iterations):
+                response = client.post(
+                    '/api/users/login/', {'username': f'victim{i}', 'password': 'guess'},
+                    format='json', REMOTE_ADDR=f'10.0.0.{i % scale}'
+                )
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            results[f'{label} attempts per second'] = rate(iterations, time.perf_counter() - start)
+            results[f'{label} rejected before hashing'] = statuses.get(429, 0)
+
+    # A hash made at a lower cost is upgraded by the first successful login
+    with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+        CustomUser.objects.filter(username='victim0').update(password=make_password('correct horse'))
+    client.post('/api/users/login/', {'username': 'victim0', 'password': 'correct horse'}, format='json', REMOTE_ADDR='10.1.0.1')
+    results['iterations after login rehash'] = int(CustomUser.objects.get(username='victim0').password.split('$')[1])
+    return results
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 whose work factor comes from settings.PASSWORD_HASH_ITERATIONS.
+
+    It keeps Django's algorithm name, so existing hashes verify as before and
+    are re-hashed at the configured cost the next time their owner logs in.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', super().iterations)
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vehicle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('license_plate', models.CharField(blank=True, max_length=20)),
+                ('model', models.CharField(blank=True, max_length=50)),
+                ('battery_capacity_kwh', models.DecimalField(decimal_places=1, max_digits=5)),
+                ('connector', models.CharField(choices=[('type1', 'Type 1 (J1772)'), ('type2', 'Type 2 (Mennekes)'), ('ccs', 'CCS'), ('chademo', 'CHAdeMO'), ('nacs', 'NACS (Tesla)')], max_length=10)),
+                ('max_charging_power_kw', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vehicles', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
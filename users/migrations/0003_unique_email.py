@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:17
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+
+def clear_duplicate_emails(apps, schema_editor):
+    # Accounts registered before the constraint may share an address, the oldest keeps it
+    user_model = apps.get_model('users', 'CustomUser')
+    shared = user_model.objects.exclude(email='').annotate(address=Lower('email')).values('address').annotate(
+        accounts=Count('id')
+    ).filter(accounts__gt=1).values_list('address', flat=True)
+    for address in list(shared):
+        ids = list(user_model.objects.annotate(address=Lower('email')).filter(address=address).order_by('date_joined', 'pk').values_list('pk', flat=True))
+        user_model.objects.filter(pk__in=ids[1:]).update(email='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_vehicle'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(condition=models.Q(('email', ''), _negated=True), fields=('email',), name='users_unique_email'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_unique_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_picture_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Thumbnail paths built from profile_picture by a background task'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stations', '0017_operators'),
+        ('users', '0004_profile_picture_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='operator',
+            field=models.ForeignKey(blank=True, help_text='Staff of this operator only see its data, empty for platform staff', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staff', to='stations.operator'),
+        ),
+    ]
@@ -1,11 +1,45 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 
 
 class CustomUser(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     vehicle_type = models.CharField(max_length=50, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture_derivatives = models.JSONField(default=dict, blank=True, editable=False, help_text="Thumbnail paths built from profile_picture by a background task")
+    token_version = models.PositiveIntegerField(default=0, editable=False, help_text="Raised on logout to revoke every signed token issued so far")
+    operator = models.ForeignKey('stations.Operator', on_delete=models.SET_NULL, blank=True, null=True, related_name='staff', help_text="Staff of this operator only see its data, empty for platform staff")
+    
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # Registration lowercases emails, the index catches any other mix of case
+            models.UniqueConstraint(Lower('email'), condition=~models.Q(email=''), name='users_unique_email_ci'),
+        ]
+    
+    def __str__(self):
+        return self.username 
+
+class Vehicle(models.Model):
+    CONNECTOR_TYPES = [
+        ('type1', 'Type 1 (J1772)'),
+        ('type2', 'Type 2 (Mennekes)'),
+        ('ccs', 'CCS'),
+        ('chademo', 'CHAdeMO'),
+        ('nacs', 'NACS (Tesla)'),
+    ]
+    
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='vehicles')
+    name = models.CharField(max_length=100)
+    license_plate = models.CharField(max_length=20, blank=True)
+    model = models.CharField(max_length=50, blank=True)
+    battery_capacity_kwh = models.DecimalField(max_digits=5, decimal_places=1)
+    connector = models.CharField(max_length=10, choices=CONNECTOR_TYPES)
+    max_charging_power_kw = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
     
     def __str__(self):
-        return self.username 
\ No newline at end of file
+        return f"{self.name} ({self.owner.username})"
@@ -1,15 +1,39 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from evspot.images import derivative_urls
+from .models import Vehicle
 
 User = get_user_model()
 
 
+def normalize_email(value):
+    # Stored lowercased, so the case-insensitive unique index and lookups agree
+    return value.strip().lower()
+
+
 class UserSerializer(serializers.ModelSerializer):
+    profile_picture_thumb = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'vehicle_type', 'profile_picture']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'vehicle_type', 'profile_picture', 'profile_picture_thumb']
         read_only_fields = ['id']
+    
+    def get_profile_picture_thumb(self, obj):
+        return derivative_urls(obj.profile_picture_derivatives)
+    
+    def validate_email(self, value):
+        return normalize_email(value)
+    
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError({'email': ["Email already exists"]})
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -19,6 +43,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'email', 'password', 'password2', 'first_name', 'last_name', 'phone_number', 'vehicle_type']
+        # Drop the UniqueValidator lookup, the unique index rejects duplicates on insert
+        extra_kwargs = {'username': {'validators': [UnicodeUsernameValidator()]}}
+
+    def validate_email(self, value):
+        return normalize_email(value)
 
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
@@ -28,19 +57,23 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         if len(attrs['password']) < 8:
             raise serializers.ValidationError("Password must be at least 8 characters long")
         
-        # Check username uniqueness
-        username = attrs.get('username')
-        if username and User.objects.filter(username=username).exists():
-            raise serializers.ValidationError("Username already exists")
-        
-        # Check email uniqueness
-        email = attrs.get('email')
-        if email and User.objects.filter(email=email).exists():
-            raise serializers.ValidationError("Email already exists")
-        
         return attrs
 
     def create(self, validated_data):
         validated_data.pop('password2')
-        user = User.objects.create_user(**validated_data)
-        return user 
\ No newline at end of file
+        # Username and email uniqueness are database constraints, only a clash costs an extra query
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(**validated_data)
+        except IntegrityError:
+            if User.objects.filter(username=validated_data['username']).exists():
+                raise serializers.ValidationError({'non_field_errors': ["Username already exists"]})
+            raise serializers.ValidationError({'non_field_errors': ["Email already exists"]})
+        return user
+
+
+class VehicleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Vehicle
+        fields = ['id', 'name', 'license_plate', 'model', 'battery_capacity_kwh', 'connector', 'max_charging_power_kw', 'created_at']
+        read_only_fields = ['id', 'created_at']
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from evspot.images import needs_derivatives
+from tasks.queue import enqueue
+from .authentication import principal_cache
+from .throttling import reset_login_throttle
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Profile edits and deactivation must not be served from a stale principal
+    principal_cache.discard(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def profile_picture_changed(sender, instance, **kwargs):
+    if needs_derivatives(instance.profile_picture, instance.profile_picture_derivatives):
+        enqueue('users.build_thumbnails', {'user': instance.pk}, key=f'thumbnails:user:{instance.pk}')
+
+
+@receiver(setting_changed)
+def throttle_settings_changed(setting, **kwargs):
+    if setting == 'LOGIN_THROTTLE':
+        reset_login_throttle()
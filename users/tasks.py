@@ -0,0 +1,14 @@
+from evspot.images import build_derivatives, needs_derivatives
+from tasks.queue import task
+from .models import CustomUser
+
+
+@task('users.build_thumbnails', max_attempts=3)
+def build_profile_thumbnails(user):
+    user = CustomUser.objects.filter(pk=user).only('pk', 'profile_picture', 'profile_picture_derivatives').first()
+    if user is None or not needs_derivatives(user.profile_picture, user.profile_picture_derivatives):
+        return
+    derivatives = build_derivatives(user.profile_picture) if user.profile_picture else {}
+    CustomUser.objects.filter(pk=user.pk, profile_picture=user.profile_picture.name or '').update(
+        profile_picture_derivatives=derivatives
+    )
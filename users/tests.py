@@ -0,0 +1,75 @@
+from datetime import timedelta
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .authentication import issue_tokens, principal_cache
+from .models import CustomUser
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        principal_cache.clear()
+        self.user = CustomUser.objects.create_user('driver', password='correct horse')
+        self.client = APIClient()
+        response = self.client.post('/api/users/login/', {'username': 'driver', 'password': 'correct horse'}, format='json')
+        self.tokens = response.json()
+        # Only the tokens should authenticate from here on
+        self.client.logout()
+
+    def get_profile(self, token):
+        return APIClient().get('/api/users/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def refresh(self, token):
+        return APIClient().post('/api/users/token/refresh/', {'refresh': token}, format='json')
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        self.assertEqual(self.get_profile(self.tokens['token']).status_code, 200)
+        response = APIClient().post('/api/users/logout/', HTTP_AUTHORIZATION=f'Bearer {self.tokens["token"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(self.tokens['token']).status_code, 401)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        self.user.set_password('battery staple')
+        self.user.save()
+        self.assertEqual(self.get_profile(self.tokens['token']).status_code, 401)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, 401)
+        response = self.client.post('/api/users/login/', {'username': 'driver', 'password': 'battery staple'}, format='json')
+        self.assertEqual(self.get_profile(response.json()['token']).status_code, 200)
+
+    def test_refresh_chain_ends_a_refresh_lifetime_after_login(self):
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_profile(response.json()['token']).status_code, 200)
+        stale = issue_tokens(self.user, auth_time=int(time.time() - timedelta(days=8).total_seconds()))
+        self.assertEqual(self.refresh(stale['refresh']).status_code, 401)
+
+
+class RegistrationTests(TestCase):
+    def register(self, username, email):
+        return APIClient().post('/api/users/register/', {
+            'username': username, 'email': email, 'password': 'correct horse', 'password2': 'correct horse',
+        }, format='json')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_emails_are_unique_ignoring_case(self):
+        self.assertEqual(self.register('first', ' Driver@Example.com ').status_code, 201)
+        self.assertEqual(CustomUser.objects.get(username='first').email, 'driver@example.com')
+        response = self.register('second', 'DRIVER@example.COM')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Email already exists']})
+
+    def test_profile_cannot_take_another_accounts_email(self):
+        self.register('first', 'driver@example.com')
+        user = CustomUser.objects.create_user('second', email='other@example.com', password='correct horse')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.patch('/api/users/profile/', {'email': 'Driver@Example.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['Email already exists']})
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalWindowStore:
+    """
+    Sliding window counters kept in process memory.
+
+    Each key holds the hits of the current and previous fixed window, the
+    count is the current window plus the share of the previous one that still
+    overlaps the sliding window. Memory stays at one small list per key.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _roll(self, key, window, now):
+        bucket = int(now // window)
+        counter = self._counters.get(key)
+        if counter is None or counter[0] < bucket - 1:
+            counter = [bucket, 0, 0]
+            self._counters[key] = counter
+        elif counter[0] == bucket - 1:
+            counter[:] = [bucket, 0, counter[1]]
+        return counter
+
+    def _estimate(self, counter, window, now):
+        overlap = 1 - (now % window) / window
+        return counter[1] + counter[2] * overlap
+
+    def hit(self, key, window):
+        now = time.time()
+        with self._lock:
+            if len(self._counters) >= self.max_keys:
+                self._prune(window, now)
+            counter = self._roll(key, window, now)
+            counter[1] += 1
+            return self._estimate(counter, window, now)
+
+    def count(self, key, window):
+        now = time.time()
+        with self._lock:
+            if key not in self._counters:
+                return 0
+            return self._estimate(self._roll(key, window, now), window, now)
+
+    def reset(self, key, window):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _prune(self, window, now):
+        # Keys that have not been hit for two windows no longer count towards anything
+        stale = int(now // window) - 1
+        self._counters = {key: counter for key, counter in self._counters.items() if counter[0] >= stale}
+        while len(self._counters) >= self.max_keys:
+            self._counters.pop(next(iter(self._counters)))
+
+
+class CacheWindowStore:
+    """The same sliding window kept in a Django cache, so every process shares the counters"""
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def _keys(self, key, window, now):
+        bucket = int(now // window)
+        return f'throttle:{key}:{bucket}', f'throttle:{key}:{bucket - 1}'
+
+    def hit(self, key, window):
+        now = time.time()
+        current, previous = self._keys(key, window, now)
+        self.cache.add(current, 0, timeout=window * 2)
+        hits = self.cache.incr(current)
+        return hits + self.cache.get(previous, 0) * (1 - (now % window) / window)
+
+    def count(self, key, window):
+        now = time.time()
+        current, previous = self._keys(key, window, now)
+        values = self.cache.get_many([current, previous])
+        return values.get(current, 0) + values.get(previous, 0) * (1 - (now % window) / window)
+
+    def reset(self, key, window):
+        self.cache.delete_many(list(self._keys(key, window, time.time())))
+
+
+class LoginThrottle:
+    """
+    Failed login attempts per client IP and per username over a sliding window.
+
+    Checked before the password is hashed, so a blocked attempt costs a couple
+    of dict lookups instead of a full PBKDF2 run.
+    """
+
+    def __init__(self, store, window=300, ip_limit=20, username_limit=5):
+        self.store = store
+        self.window = window
+        self.ip_limit = ip_limit
+        self.username_limit = username_limit
+
+    def _limits(self, ip, username):
+        limits = [(f'ip:{ip}', self.ip_limit)]
+        if username:
+            limits.append((f'user:{username.lower()}', self.username_limit))
+        return limits
+
+    def blocked(self, ip, username=None):
+        """Seconds the client should wait before trying again, 0 when not blocked"""
+        for key, limit in self._limits(ip, username):
+            if self.store.count(key, self.window) >= limit:
+                return self.window
+        return 0
+
+    def record(self, ip, username=None):
+        for key, _ in self._limits(ip, username):
+            self.store.hit(key, self.window)
+
+    def succeeded(self, ip, username):
+        self.store.reset(f'user:{username.lower()}', self.window)
+
+
+_throttle = None
+
+
+def get_login_throttle():
+    """Shared LoginThrottle built from settings.LOGIN_THROTTLE"""
+    global _throttle
+    if _throttle is None:
+        config = dict(getattr(settings, 'LOGIN_THROTTLE', {}))
+        store = import_string(config.pop('STORE', 'users.throttling.LocalWindowStore'))(**config.pop('OPTIONS', {}))
+        _throttle = LoginThrottle(store, **{name.lower(): value for name, value in config.items()})
+    return _throttle
+
+
+def reset_login_throttle():
+    global _throttle
+    _throttle = None
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
@@ -1,9 +1,15 @@
-from django.urls import path
-from .views import UserRegistrationView, UserLoginView, UserLogoutView, UserProfileView
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import UserRegistrationView, UserLoginView, UserLogoutView, UserProfileView, TokenRefreshView, VehicleViewSet
+
+router = DefaultRouter()
+router.register(r'vehicles', VehicleViewSet, basename='vehicle')
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='user-register'),
     path('login/', UserLoginView.as_view(), name='user-login'),
     path('logout/', UserLogoutView.as_view(), name='user-logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
-] 
\ No newline at end of file
+    path('', include(router.urls)),
+]
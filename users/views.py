@@ -1,11 +1,18 @@
-from rest_framework import status, generics
+import time
+
+from rest_framework import status, generics, viewsets
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.models import get_user_model
-from .serializers import UserSerializer, UserRegistrationSerializer
+from django.contrib.auth import get_user_model
+from .authentication import REFRESH_SALT, check_stamp, issue_tokens, read_token, revoke_tokens
+from .throttling import client_ip, get_login_throttle
+from .models import Vehicle
+from .serializers import UserSerializer, UserRegistrationSerializer, VehicleSerializer
 
 User = get_user_model()
 
@@ -15,6 +22,18 @@ class UserRegistrationView(generics.CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = UserRegistrationSerializer
 
+    def create(self, request, *args, **kwargs):
+        # Every registration hashes a password, so each one counts against the client IP
+        throttle = get_login_throttle()
+        ip = client_ip(request)
+        wait = throttle.blocked(ip)
+        if wait:
+            return Response({
+                'error': 'Too many attempts, try again later'
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(wait)})
+        throttle.record(ip)
+        return super().create(request, *args, **kwargs)
+
 
 class UserLoginView(APIView):
     permission_classes = [AllowAny]
@@ -24,15 +43,28 @@ class UserLoginView(APIView):
         password = request.data.get('password')
         
         if username and password:
-            user = authenticate(username=username, password=password)
+            # Refuse throttled clients before spending a password hash on them
+            throttle = get_login_throttle()
+            ip = client_ip(request)
+            wait = throttle.blocked(ip, username)
+            if wait:
+                return Response({
+                    'error': 'Too many failed login attempts, try again later'
+                }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': str(wait)})
+            
+            # authenticate() re-hashes the password when the configured hasher cost has changed
+            user = authenticate(request, username=username, password=password)
             if user:
+                throttle.succeeded(ip, username)
                 login(request, user)
                 serializer = UserSerializer(user)
                 return Response({
                     'message': 'Login successful',
-                    'user': serializer.data
+                    'user': serializer.data,
+                    **issue_tokens(user)
                 })
             else:
+                throttle.record(ip, username)
                 return Response({
                     'error': 'Invalid credentials'
                 }, status=status.HTTP_401_UNAUTHORIZED)
@@ -42,10 +74,34 @@ class UserLoginView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TokenRefreshView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        refresh = request.data.get('refresh')
+        if not refresh:
+            return Response({'error': 'Please provide a refresh token'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            payload = read_token(refresh, REFRESH_SALT, 'REFRESH_TOKEN_LIFETIME')
+            if time.time() - payload.get('auth', 0) > settings.REFRESH_TOKEN_LIFETIME.total_seconds():
+                raise AuthenticationFailed('Session has expired, please log in again')
+            # Read fresh, a cached principal may predate a logout or password change in another process
+            user = User.objects.filter(pk=payload['uid'], is_active=True).first()
+            if user is None:
+                raise AuthenticationFailed('User inactive or deleted')
+            check_stamp(user, payload)
+        except AuthenticationFailed as e:
+            return Response({'error': e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(issue_tokens(user, auth_time=payload['auth']))
+
+
 class UserLogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        # Signs the user out of every device, access and refresh tokens included
+        revoke_tokens(request.user)
         logout(request)
         return Response({'message': 'Logout successful'})
 
@@ -55,4 +111,16 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        return self.request.user 
\ No newline at end of file
+        # request.user may be a shared cached principal, edit a fresh copy instead
+        return User.objects.get(pk=self.request.user.pk)
+
+
+class VehicleViewSet(viewsets.ModelViewSet):
+    serializer_class = VehicleSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Vehicle.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)